@@ -0,0 +1,3 @@
+"""
+bench : benchmarks for monty. run them with `python -m bench.<name>`
+"""
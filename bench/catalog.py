@@ -0,0 +1,97 @@
+"""
+catalog.py : compare client start-up from the json index and from the catalog snapshot
+
+    $ python -m bench.catalog --tracks 100000 1000000
+
+each start-up path runs in its own process so that peak rss is measured cleanly:
+- json : the old path, json.load plus a Metadata object per track
+- json-stream : build the db from audio.json with the streaming reader
+- snapshot : decompress the sqlite snapshot and read the first page
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from monty.cloud import LocalDirectoryStorage
+from monty.db import Database, build_catalog_snapshot
+from monty import config
+from bench.synthetic import iter_index_entries, write_index
+
+MODES = ['json', 'json-stream', 'snapshot']
+
+
+def measure(mode, bucket_root, workdir):
+    """
+    measure : run one start-up path in this process, print seconds and peak rss in MB
+    """
+    db_location = os.path.join(workdir, '{}.db'.format(mode))
+    index_location = os.path.join(bucket_root, config.AUDIO_INDEX_OBJECT)
+    start = time.time()
+    if mode == 'json':
+        tracks = Database.get_tracks_from_index_file(index_location)
+        assert tracks
+    else:
+        storage = LocalDirectoryStorage(bucket_root)
+        if mode == 'json-stream':
+            storage.get_catalog_snapshot = lambda _: False
+            storage.get_audio_index = lambda: None
+        db = Database(db_location, index_location, storage)
+        assert db.get_tracks_page()
+    elapsed = time.time() - start
+    print('{} {}'.format(elapsed, peak_rss_mb()))
+
+
+def peak_rss_mb() -> float:
+    """
+    peak_rss_mb : peak resident set size of this process in MB. VmHWM is used where it's
+    available since, unlike ru_maxrss, it isn't carried over from the parent across exec
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    # ru_maxrss is in KB on linux, bytes on macos
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def main(args):
+    for track_count in args.tracks:
+        with tempfile.TemporaryDirectory() as workdir:
+            bucket_root = os.path.join(workdir, 'bucket')
+            index_location = os.path.join(bucket_root, config.AUDIO_INDEX_OBJECT)
+            config.ensure_dir(index_location)
+            write_index(index_location, track_count)
+            snapshot_location = os.path.join(bucket_root, config.CATALOG_SNAPSHOT_OBJECT)
+            build_catalog_snapshot(iter_index_entries(track_count), snapshot_location)
+            print('{} tracks: audio.json {:.1f} MB, catalog.db.gz {:.1f} MB'.format(
+                track_count,
+                os.path.getsize(index_location) / 1e6,
+                os.path.getsize(snapshot_location) / 1e6))
+            for mode in MODES:
+                output = subprocess.check_output([sys.executable, '-m', 'bench.catalog',
+                                                  '--measure', mode, bucket_root, workdir])
+                elapsed, peak = output.split()
+                print('  {:>12}: {:.2f}s, peak rss {:.0f} MB'.format(mode,
+                                                                     float(elapsed),
+                                                                     float(peak)))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('--tracks', type=int, nargs='+', default=[100000, 1000000])
+    PARSER.add_argument('--measure', nargs=3, metavar=('MODE', 'BUCKET', 'WORKDIR'),
+                        help=argparse.SUPPRESS)
+    ARGS = PARSER.parse_args()
+    if ARGS.measure:
+        measure(*ARGS.measure)
+    else:
+        main(ARGS)
@@ -0,0 +1,92 @@
+"""
+gapless.py : measure the gap between songs, with and without gapless playback
+
+    $ python -m bench.gapless --songs 6 --seconds 3
+
+plays a handful of short generated tones back to back through monty.playback.Player,
+once moving on to each song with change_song when the last one ends (the old
+behaviour) and once in gapless mode, and reports Player.gap_stats for each.
+needs libvlc and an audio output
+"""
+
+import argparse
+import math
+import os
+import struct
+import tempfile
+import threading
+import wave
+
+from monty.playback import Player
+
+SAMPLE_RATE = 44100
+
+
+def write_tone(path, seconds, frequency):
+    """
+    write_tone : write a mono 16-bit wav of a sine wave
+    """
+    frames = bytearray()
+    for i in range(int(seconds * SAMPLE_RATE)):
+        sample = int(8000 * math.sin(2 * math.pi * frequency * i / SAMPLE_RATE))
+        frames.extend(struct.pack('<h', sample))
+    with wave.open(path, 'wb') as tone:
+        tone.setnchannels(1)
+        tone.setsampwidth(2)
+        tone.setframerate(SAMPLE_RATE)
+        tone.writeframes(bytes(frames))
+
+
+def play_through(songs, gapless):
+    """
+    play_through : play every song in order, returning the player's gap stats
+    """
+    finished = threading.Event()
+    position = {'current' : 0}
+
+    def next_song():
+        position['current'] += 1
+        if position['current'] < len(songs):
+            return songs[position['current']]
+        finished.set()
+        return None
+
+    def on_song_ended():
+        # vlc doesn't allow a player to be changed from its own event thread
+        song = next_song()
+        if song is not None:
+            threading.Thread(target=player.change_song, args=(song, True)).start()
+
+    def on_song_changed(_):
+        following = position['current'] + 2
+        next_song()
+        player.set_next_song(songs[following] if following < len(songs) else None)
+
+    player = Player(gapless=gapless, on_song_ended=on_song_ended,
+                    on_song_changed=on_song_changed)
+    player.change_song(songs[0], play=True)
+    player.set_next_song(songs[1])
+    finished.wait()
+    # give the last song a moment to be heard
+    finished.wait(1)
+    player.close()
+    return player.gap_stats
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        songs = []
+        for i in range(args.songs):
+            path = os.path.join(workdir, '{}.wav'.format(i))
+            write_tone(path, args.seconds, 220 * (i + 2))
+            songs.append(path)
+        for gapless in (False, True):
+            stats = play_through(songs, gapless)
+            print('{:>8}: {}'.format('gapless' if gapless else 'stop/new', stats.describe()))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('--songs', type=int, default=6)
+    PARSER.add_argument('--seconds', type=float, default=3)
+    main(PARSER.parse_args())
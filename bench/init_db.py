@@ -0,0 +1,139 @@
+"""
+init_db.py : compare Database.init_db against the row-at-a-time load it replaced
+
+    $ python -m bench.init_db --tracks 200000
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+from monty.db import Database
+from monty.metadata import Metadata
+from bench.synthetic import write_index
+
+
+class OfflineStorage(object):
+    """
+    OfflineStorage : storage stand-in whose audio index is already on disk
+    """
+    def get_catalog_snapshot(self, _):
+        return False
+
+    def get_audio_index(self):
+        pass
+
+
+def init_db_rows(conn, index_location):
+    """
+    init_db_rows : the init_db this series started from. an unkeyed table, one
+    insert per Metadata object, and no indexes or full text search
+    """
+    with conn:
+        conn.execute("""
+        create table audio_tracks
+            (artist varchar,
+             album varchar,
+             track_title varchar,
+             track_number int,
+             file_path varchar,
+             artist_id varchar,
+             release_id varchar,
+             track_id varchar,
+             file_format varchar)
+        """)
+    with conn:
+        for metadatum in Database.get_tracks_from_index_file(index_location):
+            conn.execute("""
+            insert into audio_tracks (
+                artist,
+                album,
+                track_title,
+                track_number,
+                file_path,
+                artist_id,
+                release_id,
+                track_id,
+                file_format)
+             values (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (metadatum.artist,
+                  metadatum.album,
+                  metadatum.track_title,
+                  metadatum.track_number,
+                  metadatum.file_path,
+                  metadatum.artist_id,
+                  metadatum.release_id,
+                  metadatum.recording_id,
+                  metadatum.file_format))
+
+
+def read_rows(conn):
+    """
+    read_rows : every track in display order, the way generate_all_track_info read
+    the unkeyed table
+    """
+    for i in conn.execute('select * from audio_tracks order by artist, album, track_number'):
+        metadatum = Metadata()
+        metadatum.artist = i[0]
+        metadatum.album = i[1]
+        metadatum.track_title = i[2]
+        metadatum.track_number = i[3]
+        metadatum.file_path = i[4]
+        metadatum.artist_id = i[5]
+        metadatum.release_id = i[6]
+        metadatum.recording_id = i[7]
+        metadatum.file_format = i[8]
+        yield metadatum
+
+
+def time_init_db(workdir, index_location, bulk):
+    """
+    time_init_db : build a fresh database from index_location, with Database.init_db
+    (primary key, filter indexes and full text search included) or the old row load
+    returns (seconds to build, seconds to read every row in display order)
+    """
+    db_location = os.path.join(workdir, 'bulk.db' if bulk else 'rows.db')
+    if not bulk:
+        conn = sqlite3.connect(db_location)
+        try:
+            start = time.time()
+            init_db_rows(conn, index_location)
+            built = time.time() - start
+            start = time.time()
+            for _ in read_rows(conn):
+                pass
+            return built, time.time() - start
+        finally:
+            conn.close()
+    # an empty db file means Database() just connects, leaving init_db to us
+    sqlite3.connect(db_location).close()
+    db = Database(db_location, index_location, OfflineStorage())
+    try:
+        start = time.time()
+        db.init_db()
+        built = time.time() - start
+        start = time.time()
+        for _ in db.generate_all_track_info():
+            pass
+        return built, time.time() - start
+    finally:
+        db.close()
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        index_location = os.path.join(workdir, 'audio.json')
+        write_index(index_location, args.tracks)
+        print('{} tracks'.format(args.tracks))
+        for bulk in (False, True):
+            built, read = time_init_db(workdir, index_location, bulk)
+            print('{:>6}: init_db {:.2f}s, generate_all_track_info {:.2f}s'.format(
+                'bulk' if bulk else 'rows', built, read))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('--tracks', type=int, default=200000)
+    main(PARSER.parse_args())
@@ -0,0 +1,66 @@
+"""
+library_view.py : measure what the gui's track list costs on a synthetic library
+
+    $ python -m bench.library_view --tracks 10000 500000
+
+for each library size, times the first paint (counting the tracks and fetching the
+first screenful), scrolling through the list a few rows at a time, jumping to
+random points (dragging the scrollbar), and filtering
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import monty.config as config
+from monty.db import Database
+from monty.library import LibraryView, SearchResults
+from bench.init_db import OfflineStorage
+from bench.search import make_queries, percentile
+from bench.synthetic import write_index
+
+
+def timed(func, *args):
+    """
+    timed : call func, returning how long it took in ms
+    """
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def describe(name, samples):
+    return '{}: p50 {:.2f}ms, p99 {:.2f}ms, max {:.2f}ms'.format(
+        name, percentile(samples, 0.5), percentile(samples, 0.99), max(samples))
+
+
+def measure(tracks, steps, rand):
+    rows = config.GUI_LIST_ROWS
+    with tempfile.TemporaryDirectory() as workdir:
+        index_location = os.path.join(workdir, 'audio.json')
+        write_index(index_location, tracks)
+        db = Database(os.path.join(workdir, 'local.db'), index_location, OfflineStorage())
+        library = LibraryView(db)
+        first_paint = timed(lambda: (len(library), library.rows(0, rows)))
+        scroll = [timed(library.rows, first, rows) for first in range(0, steps * 3, 3)]
+        jumps = [timed(library.rows, rand.randrange(len(library) - rows), rows)
+                 for _ in range(steps // 10)]
+        filters = [timed(SearchResults.search, library, query)
+                   for query in make_queries(db, steps // 10, rand)]
+        db.close()
+    print('{} tracks'.format(tracks))
+    print('  first paint: {:.2f}ms'.format(first_paint))
+    print('  ' + describe('scroll', scroll))
+    print('  ' + describe('jump', jumps))
+    print('  ' + describe('filter', filters))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('--tracks', type=int, nargs='+', default=[10000, 500000])
+    PARSER.add_argument('--steps', type=int, default=2000)
+    ARGS = PARSER.parse_args()
+    for size in ARGS.tracks:
+        measure(size, ARGS.steps, random.Random(0))
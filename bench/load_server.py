@@ -0,0 +1,195 @@
+"""
+load_server.py : load test monty_server with many concurrent streaming clients
+
+    $ python -m bench.load_server --tracks 200 --size-mb 4 --clients 200 --seconds 20
+
+generates a library of tracks with random-byte audio files, starts monty_server on
+it in a separate process (with HOME pointed at a scratch directory), and has
+--clients keep-alive connections hammer it for --seconds. each client mostly asks
+for whole files, and sometimes for a random 256KB range (a seek) or a page of
+the track list. reports requests/s, MB/s, and p50/p99 time to first byte and
+time to the last byte
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.init_db import OfflineStorage
+from bench.synthetic import write_index
+from monty.util.stats import LatencyStats
+
+RANGE_SIZE = 256 * 1024
+
+
+def prepare(home, args) -> list:
+    """
+    prepare : write the library under home, returning the recording ids
+    """
+    env = dict(os.environ, HOME=home)
+    # config is read at import, so the library is written from a process that sees the new HOME
+    script = ('import sys, json\n'
+              'from bench.load_server import write_library\n'
+              'print(json.dumps(write_library(int(sys.argv[1]), int(sys.argv[2]))))\n')
+    output = subprocess.check_output([sys.executable, '-c', script, str(args.tracks),
+                                      str(int(args.size_mb * 1024 * 1024))], env=env)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def write_library(tracks: int, size: int) -> list:
+    """
+    write_library : write an audio.json, db and audio files for tracks tracks of size bytes
+    """
+    import monty.config as config
+    from monty.db import Database
+    config.ensure_dir(config.AUDIO_INDEX_LOCATION)
+    write_index(config.AUDIO_INDEX_LOCATION, tracks)
+    db = Database(storage=OfflineStorage())
+    payload = os.urandom(size)
+    recording_ids = []
+    for track in db.iter_tracks():
+        path = track.get_local_path()
+        config.ensure_dir(path)
+        with open(path, 'wb') as audio:
+            audio.write(payload)
+        recording_ids.append(track.recording_id)
+    db.close()
+    return recording_ids
+
+
+async def request(reader, writer, path: str, headers: dict = None):
+    """
+    request : make a request on an open connection, reading (and dropping) the body.
+    returns (status, seconds to first byte, body bytes)
+    """
+    start = time.perf_counter()
+    lines = ['GET {} HTTP/1.1'.format(path), 'Host: localhost']
+    lines.extend('{}: {}'.format(name, value) for name, value in (headers or {}).items())
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+    status_line = await reader.readline()
+    first_byte = time.perf_counter() - start
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode().partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    remaining = length
+    while remaining:
+        chunk = await reader.read(min(remaining, 1024 * 1024))
+        if not chunk:
+            raise ConnectionError('connection closed mid-body')
+        remaining -= len(chunk)
+    return status, first_byte, length
+
+
+async def client(port, recording_ids, deadline, results, seed):
+    """
+    client : make requests on one keep-alive connection until deadline
+    """
+    rand = random.Random(seed)
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        while time.perf_counter() < deadline:
+            choice = rand.random()
+            recording_id = rand.choice(recording_ids)
+            headers = None
+            if choice < 0.1:
+                kind, path = 'list', '/tracks?limit=100'
+            elif choice < 0.3:
+                kind, path = 'range', '/tracks/{}/audio'.format(recording_id)
+                start = rand.randrange(results['size'] - RANGE_SIZE)
+                headers = {'Range' : 'bytes={}-{}'.format(start, start + RANGE_SIZE - 1)}
+            else:
+                kind, path = 'full', '/tracks/{}/audio'.format(recording_id)
+            started = time.perf_counter()
+            status, first_byte, length = await request(reader, writer, path, headers)
+            results['latency'][kind].record((time.perf_counter() - started) * 1000)
+            results['first_byte'].record(first_byte * 1000)
+            results['bytes'] += length
+            results['requests'] += 1
+            if status >= 400:
+                results['errors'] += 1
+    except (ConnectionError, asyncio.IncompleteReadError):
+        results['errors'] += 1
+    finally:
+        writer.close()
+
+
+async def load(port, recording_ids, args):
+    window = 10 ** 7
+    results = {
+        'size' : int(args.size_mb * 1024 * 1024),
+        'requests' : 0, 'bytes' : 0, 'errors' : 0,
+        'first_byte' : LatencyStats(window),
+        'latency' : {kind: LatencyStats(window) for kind in ('full', 'range', 'list')},
+    }
+    start = time.perf_counter()
+    deadline = start + args.seconds
+    await asyncio.gather(*[client(port, recording_ids, deadline, results, seed)
+                           for seed in range(args.clients)])
+    results['seconds'] = time.perf_counter() - start
+    return results
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('monty_server did not start')
+
+
+def describe(name, stats):
+    return '{:>11}: p50 {:7.1f}ms  p99 {:7.1f}ms  max {:7.1f}ms  ({} requests)'.format(
+        name, stats.percentile(0.5), stats.percentile(0.99), max(stats.samples),
+        len(stats.samples))
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as home:
+        start = time.perf_counter()
+        recording_ids = prepare(home, args)
+        print('Wrote {} tracks of {} MB in {:.1f}s'.format(
+            len(recording_ids), args.size_mb, time.perf_counter() - start))
+        env = dict(os.environ, HOME=home)
+        server = subprocess.Popen([sys.executable, 'monty_server.py', '--port', str(args.port)],
+                                  env=env, stdout=subprocess.DEVNULL)
+        try:
+            wait_for_port(args.port)
+            loop = asyncio.get_event_loop()
+            results = loop.run_until_complete(load(args.port, recording_ids, args))
+        finally:
+            server.terminate()
+            server.wait()
+    seconds = results['seconds']
+    print('{} clients for {:.1f}s: {} requests ({:.0f}/s), {:.0f} MB/s, {} errors'.format(
+        args.clients, seconds, results['requests'], results['requests'] / seconds,
+        results['bytes'] / seconds / 1024 / 1024, results['errors']))
+    print(describe('first byte', results['first_byte']))
+    for kind, stats in results['latency'].items():
+        if stats.samples:
+            print(describe(kind, stats))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('--tracks', type=int, default=200)
+    PARSER.add_argument('--size-mb', type=float, default=4)
+    PARSER.add_argument('--clients', type=int, default=200)
+    PARSER.add_argument('--seconds', type=float, default=20)
+    PARSER.add_argument('--port', type=int, default=18419)
+    main(PARSER.parse_args())
@@ -0,0 +1,78 @@
+"""
+metadata_memory.py : measure the memory each in-memory track costs
+
+    $ python -m bench.metadata_memory --tracks 300000
+
+compares the current Metadata and TrackRow with LegacyMetadata, a copy of the
+old layout (per-instance __dict__ holding its own format strings, and no interning)
+"""
+
+import argparse
+import tracemalloc
+
+from monty.metadata import Metadata, TrackRow
+from bench.synthetic import iter_index_entries
+
+
+class LegacyMetadata(object):
+    """
+    LegacyMetadata : the shape Metadata objects used to have, minus the mutagen handle
+    (which only made things worse for tracks read from files)
+    """
+
+    def __init__(self):
+        self.artist_id = None
+        self.release_id = None
+        self.recording_id = None
+        self.display_format = '{} - {} - {}'
+        self.basename_format = '{}.{}'
+
+
+def build(kind, entries):
+    """
+    build : turn index entries into track objects the way Database does
+    """
+    tracks = []
+    for rowid, track in enumerate(entries):
+        # copy the strings, as they'd be if each track came from its own json/db row
+        artist, album = ''.join(track['artist']), ''.join(track['album'])
+        if kind == 'TrackRow':
+            tracks.append(TrackRow.from_db_row(
+                (rowid, artist, album, track['track_name'], track['position'], track['path'],
+                 track['artist_id'], track['release_id'], track['track_id'],
+                 track['file_format'], track.get('audio_key'))))
+            continue
+        metadatum = LegacyMetadata() if kind == 'legacy' else Metadata()
+        metadatum.artist = artist
+        metadatum.album = album
+        metadatum.track_title = track['track_name']
+        metadatum.track_number = track['position']
+        metadatum.file_path = track['path']
+        metadatum.artist_id = track['artist_id']
+        metadatum.release_id = track['release_id']
+        metadatum.recording_id = track['track_id']
+        if kind == 'legacy':
+            metadatum._file_format = track['file_format']
+        else:
+            metadatum.file_format = track['file_format']
+        tracks.append(metadatum)
+    return tracks
+
+
+def main(args):
+    entries = list(iter_index_entries(args.tracks))
+    print('{} tracks'.format(args.tracks))
+    for kind in ('legacy', 'Metadata', 'TrackRow'):
+        tracemalloc.start()
+        tracks = build(kind, entries)
+        allocated, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('  {:>8}: {:.0f} bytes/track ({:.1f} MB total)'.format(
+            kind, allocated / len(tracks), allocated / 1e6))
+        del tracks
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('--tracks', type=int, default=300000)
+    main(PARSER.parse_args())
@@ -0,0 +1,66 @@
+"""
+search.py : measure Database.search latency on a synthetic library
+
+    $ python -m bench.search --tracks 500000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from monty.db import Database
+from bench.init_db import OfflineStorage
+from bench.synthetic import write_index
+
+
+def percentile(samples, fraction):
+    """
+    percentile : nearest-rank percentile of a list of samples
+    """
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def make_queries(db, count, rand):
+    """
+    make_queries : build queries out of word prefixes of tracks in the library,
+    e.g. "Vérmi Ba" for "Vérmiel Batoran - ..."
+    """
+    rows = db._conn.execute('select artist, album, track_title from audio_tracks')
+    names = [' '.join(row) for row in rows]
+    queries = []
+    for _ in range(count):
+        words = rand.choice(names).split()
+        picked = rand.sample(words, min(len(words), rand.randint(1, 2)))
+        queries.append(' '.join(word[:rand.randint(2, len(word))] for word in picked))
+    return queries
+
+
+def main(args):
+    rand = random.Random(0)
+    with tempfile.TemporaryDirectory() as workdir:
+        index_location = os.path.join(workdir, 'audio.json')
+        write_index(index_location, args.tracks)
+        start = time.time()
+        db = Database(os.path.join(workdir, 'local.db'), index_location, OfflineStorage())
+        print('{} tracks, built db and search index in {:.2f}s'.format(args.tracks,
+                                                                   time.time() - start))
+        latencies = []
+        results = 0
+        for query in make_queries(db, args.queries, rand):
+            start = time.perf_counter()
+            results += len(db.search(query, args.limit))
+            latencies.append((time.perf_counter() - start) * 1000)
+        print('{} queries, {:.1f} results/query: p50 {:.2f}ms, p99 {:.2f}ms, max {:.2f}ms'.format(
+            len(latencies), results / len(latencies),
+            percentile(latencies, 0.5), percentile(latencies, 0.99), max(latencies)))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('--tracks', type=int, default=500000)
+    PARSER.add_argument('--queries', type=int, default=1000)
+    PARSER.add_argument('--limit', type=int, default=50)
+    main(PARSER.parse_args())
@@ -0,0 +1,101 @@
+"""
+storage.py : time concurrent recording downloads from a LocalDirectoryStorage, for a
+few concurrency limits
+
+    $ python -m bench.storage --recordings 64 --size-mb 8 --concurrency 1 4 16
+
+writes --recordings objects into a bucket directory, then downloads all of them at
+once through get_recording (and, separately, stream_recording) with each
+max_concurrency, reporting the wall time, MB/s, and the storage's per-request
+latency. --latency-ms adds a delay to every request, to stand in for the network.
+run with HOME pointed somewhere disposable: recordings are written to MEDIA_DIR
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+import monty.config as config
+from monty.bucket import DirectoryBlob
+from monty.cloud import LocalDirectoryStorage
+
+
+def delay_requests(latency: float):
+    """
+    delay_requests : make every DirectoryBlob download take latency seconds longer
+    """
+    download_to_filename = DirectoryBlob.download_to_filename
+    download_to_file = DirectoryBlob.download_to_file
+
+    def slow_download_to_filename(self, filename):
+        time.sleep(latency)
+        download_to_filename(self, filename)
+
+    def slow_download_to_file(self, file_obj, start=None, end=None):
+        time.sleep(latency)
+        download_to_file(self, file_obj, start, end)
+
+    DirectoryBlob.download_to_filename = slow_download_to_filename
+    DirectoryBlob.download_to_file = slow_download_to_file
+
+
+def write_bucket(root, recordings, size):
+    payload = os.urandom(size)
+    names = []
+    for i in range(recordings):
+        recording_id = 'recording-{}'.format(i)
+        path = os.path.join(root, config.CLOUD_STORAGE_PREFIX, 'artist', 'release',
+                            '{}.mp3'.format(recording_id))
+        config.ensure_dir(path)
+        with open(path, 'wb') as recording:
+            recording.write(payload)
+        names.append(recording_id)
+    return names
+
+
+async def fetch_all(storage, names, streaming):
+    if streaming:
+        finished = await asyncio.gather(*[
+            storage.stream_recording('artist', 'release', name, 'mp3') for name in names])
+        await asyncio.gather(*finished)
+    else:
+        await asyncio.gather(*[
+            storage.get_recording('artist', 'release', name, 'mp3') for name in names])
+
+
+def measure(root, names, size, concurrency, streaming):
+    shutil.rmtree(config.MEDIA_DIR, ignore_errors=True)
+    storage = LocalDirectoryStorage(root, concurrency)
+    loop = asyncio.new_event_loop()
+    start = time.perf_counter()
+    loop.run_until_complete(fetch_all(storage, names, streaming))
+    seconds = time.perf_counter() - start
+    loop.close()
+    storage.close()
+    print('{} concurrency {:>3}: {:6.2f}s {:8.1f} MB/s'.format(
+        'stream' if streaming else 'download', concurrency, seconds,
+        len(names) * size / seconds / 1024 / 1024))
+    print('  ' + storage.stats.describe().replace('\n', '\n  '))
+
+
+def main(args):
+    if args.latency_ms:
+        delay_requests(args.latency_ms / 1000)
+    size = int(args.size_mb * 1024 * 1024)
+    with tempfile.TemporaryDirectory() as root:
+        names = write_bucket(root, args.recordings, size)
+        for streaming in (False, True):
+            for concurrency in args.concurrency:
+                measure(root, names, size, concurrency, streaming)
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('--recordings', type=int, default=64)
+    PARSER.add_argument('--size-mb', type=float, default=8)
+    PARSER.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    PARSER.add_argument('--latency-ms', type=float, default=50)
+    main(PARSER.parse_args())
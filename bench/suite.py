@@ -0,0 +1,300 @@
+"""
+suite.py : time the index, db and playlist paths on a synthetic library
+
+    $ python -m bench.suite run --tracks 200000 --files 2000 --out results.json
+    $ python -m bench.suite compare baseline.json results.json
+
+run generates a tree of tagged mp3/flac files and an audio.json, then times each
+stage in its own process (so that peak rss is measured cleanly), with HOME pointed
+at a scratch directory. musicbrainz and cloud storage are stubbed out, so nothing
+touches the network. the results (wall time, items, peak rss per stage) are
+written as json
+
+compare prints each stage of a run against a baseline run, and exits with status 1
+if any stage got slower (or bigger) than the baseline by more than --tolerance
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.catalog import peak_rss_mb
+from bench.init_db import OfflineStorage
+from bench.synthetic import write_audio_tree, write_index
+
+STAGES = ['scan', 'index', 'index_load', 'init_db', 'track_info', 'tracklist']
+
+
+class OfflineMusicBrainz(object):
+    """
+    OfflineMusicBrainz : stand-in for the musicbrainzngs module, which knows every
+    artist, release and recording in a synthetic tree and answers straight away
+    (or after latency seconds, to mimic a real round trip)
+    """
+
+    class ResponseError(Exception):
+        """ ResponseError : never raised, but MusicBrainzClient catches it """
+        cause = None
+
+    def __init__(self, entries, latency=0.0):
+        self.latency = latency
+        self.artists = {}
+        self.release_groups = {}
+        self.releases = {}
+        for entry in entries:
+            self.artists[entry['artist']] = entry['artist_id']
+            self.release_groups['{} {}'.format(entry['artist'], entry['album'])] = (
+                entry['artist_id'], entry['release_id'])
+            tracks = self.releases.setdefault(entry['release_id'], [])
+            tracks.append({'position' : str(entry['position']),
+                           'recording' : {'id' : entry['track_id']}})
+
+    def search_artists(self, artist):
+        time.sleep(self.latency)
+        if artist not in self.artists:
+            return {'artist-list' : []}
+        return {'artist-list' : [{'id' : self.artists[artist], 'ext:score' : '100'}]}
+
+    def search_release_groups(self, query):
+        time.sleep(self.latency)
+        if query not in self.release_groups:
+            return {'release-group-list' : []}
+        artist_id, release_id = self.release_groups[query]
+        return {'release-group-list' : [{
+            'ext:score' : '100',
+            'artist-credit' : [{'artist' : {'id' : artist_id}}],
+            'release-list' : [{'id' : release_id}],
+        }]}
+
+    def get_release_by_id(self, release_id, includes=None):
+        time.sleep(self.latency)
+        return {'release' : {'medium-list' : [{'track-list' : list(self.releases[release_id])}]}}
+
+
+class OfflineCloud(object):
+    """
+    OfflineCloud : stand-in for CloudStorage whose downloads (and streams) finish
+    straight away
+    """
+
+    def __init__(self):
+        self.downloads = 0
+
+    async def get_recording(self, *_):
+        self.downloads += 1
+
+    async def stream_recording(self, *_):
+        self.downloads += 1
+        finished = asyncio.get_event_loop().create_future()
+        finished.set_result(None)
+        return finished
+
+
+def prepare(workdir, args):
+    """
+    prepare : write the synthetic tree, audio.json and db the stages read from
+    """
+    from monty.db import Database
+    entries = write_audio_tree(os.path.join(workdir, 'tree'), args.files)
+    with open(os.path.join(workdir, 'tree.json'), 'w') as tree_index:
+        json.dump(entries, tree_index)
+    write_index(os.path.join(workdir, 'audio.json'), args.tracks)
+    Database(os.path.join(workdir, 'library.db'), os.path.join(workdir, 'audio.json'),
+             OfflineStorage()).close()
+
+
+def run_stage(stage, workdir, args):
+    """
+    run_stage : run one stage in this process
+    returns (seconds, items, extra results)
+    """
+    # imported here so that config picks up the scratch HOME
+    from monty.db import Database
+    from monty.index import find_audio_files, generate_index_for_files, get_metadata_for_files
+    from monty.musicbrainz import MusicBrainzClient, RequestScheduler, ResponseCache
+    from monty.tracklist import TrackList
+    from monty.util import mid
+
+    index_location = os.path.join(workdir, 'audio.json')
+    library_location = os.path.join(workdir, 'library.db')
+    extra = {}
+    if stage in ('scan', 'index'):
+        paths = sorted(find_audio_files(os.path.join(workdir, 'tree')))
+        start = time.perf_counter()
+        if stage == 'scan':
+            items = len(get_metadata_for_files(paths, args.workers))
+        else:
+            with open(os.path.join(workdir, 'tree.json')) as tree_index:
+                offline = OfflineMusicBrainz(json.load(tree_index), args.mb_latency)
+            client = MusicBrainzClient(ResponseCache(os.path.join(workdir, 'mb.db')),
+                                       RequestScheduler(interval=0), offline)
+            hash_cache = mid.HashCache(os.path.join(workdir, 'hashes.db'))
+            items = len(generate_index_for_files(paths, args.workers, hash_cache, client))
+    elif stage == 'index_load':
+        start = time.perf_counter()
+        items = sum(1 for _ in Database.get_entries_from_index_file(index_location))
+    elif stage == 'init_db':
+        start = time.perf_counter()
+        db = Database(os.path.join(workdir, 'init.db'), index_location, OfflineStorage())
+        items = db.count_tracks()
+    elif stage == 'track_info':
+        db = Database(library_location, index_location, OfflineStorage())
+        start = time.perf_counter()
+        items = sum(1 for _ in db.generate_all_track_info())
+    elif stage == 'tracklist':
+        db = Database(library_location, index_location, OfflineStorage())
+        tracks = list(db.iter_tracks())
+        cloud = OfflineCloud()
+        track_list = TrackList(tracks, cloud=cloud)
+        rand = random.Random(0)
+
+        async def navigate():
+            for i in range(args.navigations):
+                if i % 10 == 9:
+                    await track_list.skip_to_index(rand.randrange(len(tracks)))
+                elif i % 10 == 8 and track_list.position > 0:
+                    await track_list.get_previous_song()
+                elif track_list.position + 1 < len(tracks):
+                    await track_list.get_next_song()
+            # let the last prefetches finish
+            await asyncio.sleep(0)
+
+        loop = asyncio.new_event_loop()
+        start = time.perf_counter()
+        loop.run_until_complete(navigate())
+        items = args.navigations
+        extra = {'downloads' : cloud.downloads, 'prefetch' : track_list.prefetch_stats()}
+        loop.close()
+    else:
+        raise ValueError('Unknown stage {}'.format(stage))
+    return time.perf_counter() - start, items, extra
+
+
+def measure(stage, workdir, args):
+    """
+    measure : run a stage in its own process, with HOME pointed at the scratch directory
+    """
+    home = os.path.join(workdir, 'home-{}'.format(stage))
+    os.makedirs(home, exist_ok=True)
+    env = dict(os.environ, HOME=home)
+    command = [sys.executable, '-m', 'bench.suite', 'stage', stage, workdir,
+               '--workers', str(args.workers),
+               '--navigations', str(args.navigations),
+               '--mb-latency', str(args.mb_latency)]
+    output = subprocess.check_output(command, env=env, stderr=subprocess.DEVNULL)
+    # the stage prints its own progress, the result is the last line
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def run(args):
+    stages = args.stages or STAGES
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        prepare(workdir, args)
+        print('Generated {} files and a {} track index in {:.1f}s'.format(
+            args.files, args.tracks, time.perf_counter() - start))
+        results = {}
+        for stage in stages:
+            results[stage] = measure(stage, workdir, args)
+            print(describe(stage, results[stage]))
+    report = {
+        'created' : datetime.datetime.now().isoformat(timespec='seconds'),
+        'python' : platform.python_version(),
+        'platform' : platform.platform(),
+        'parameters' : {'tracks' : args.tracks, 'files' : args.files,
+                        'workers' : args.workers, 'navigations' : args.navigations,
+                        'mb_latency' : args.mb_latency},
+        'stages' : results,
+    }
+    with open(args.out, 'w') as out:
+        json.dump(report, out, indent=2)
+    print('Wrote {}'.format(args.out))
+
+
+def describe(stage, result):
+    return '{:>11}: {:8.3f}s {:>8} items {:10.0f}/s  peak rss {:6.0f} MB'.format(
+        stage, result['seconds'], result['items'], result['per_second'], result['peak_rss_mb'])
+
+
+def compare(args):
+    with open(args.baseline) as baseline_file, open(args.results) as results_file:
+        baseline = json.load(baseline_file)
+        results = json.load(results_file)
+    if baseline['parameters'] != results['parameters']:
+        print('Warning: the runs used different parameters\n  baseline: {}\n  results:  {}'.format(
+            baseline['parameters'], results['parameters']))
+    regressions = []
+    print('{:>11}  {:>9} {:>9} {:>8}  {:>8} {:>8} {:>8}'.format(
+        'stage', 'base s', 'new s', 'change', 'base MB', 'new MB', 'change'))
+    for stage, result in results['stages'].items():
+        if stage not in baseline['stages']:
+            continue
+        base = baseline['stages'][stage]
+        time_change = result['seconds'] / base['seconds'] - 1 if base['seconds'] else 0.0
+        rss_change = result['peak_rss_mb'] / base['peak_rss_mb'] - 1
+        print('{:>11}  {:9.3f} {:9.3f} {:+8.1%}  {:8.0f} {:8.0f} {:+8.1%}'.format(
+            stage, base['seconds'], result['seconds'], time_change,
+            base['peak_rss_mb'], result['peak_rss_mb'], rss_change))
+        if time_change > args.tolerance:
+            regressions.append('{} is {:.0%} slower'.format(stage, time_change))
+        if rss_change > args.tolerance:
+            regressions.append('{} uses {:.0%} more memory'.format(stage, rss_change))
+    for regression in regressions:
+        print('REGRESSION: {}'.format(regression))
+    return 1 if regressions else 0
+
+
+def stage_main(args):
+    seconds, items, extra = run_stage(args.stage, args.workdir, args)
+    result = {'seconds' : seconds, 'items' : items,
+              'per_second' : items / seconds if seconds else 0.0,
+              'peak_rss_mb' : peak_rss_mb()}
+    result.update(extra)
+    print(json.dumps(result))
+
+
+def parse():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--tracks', type=int, default=200000,
+                            help='number of tracks in the synthetic audio.json')
+    run_parser.add_argument('--files', type=int, default=2000,
+                            help='number of files in the synthetic music directory')
+    run_parser.add_argument('--stages', nargs='+', choices=STAGES)
+    run_parser.add_argument('--out', default='bench-results.json')
+    compare_parser = commands.add_parser('compare', help='compare results with a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('--tolerance', type=float, default=0.1,
+                                help='fraction a stage may regress by before it fails')
+    stage_parser = commands.add_parser('stage')
+    stage_parser.add_argument('stage', choices=STAGES)
+    stage_parser.add_argument('workdir')
+    for sub in (run_parser, stage_parser):
+        sub.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                         help='processes used to read tags')
+        sub.add_argument('--navigations', type=int, default=20000,
+                         help='track list moves in the tracklist stage')
+        sub.add_argument('--mb-latency', type=float, default=0.0,
+                         help='seconds each stubbed musicbrainz request takes')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    ARGS = parse()
+    if ARGS.command == 'run':
+        run(ARGS)
+    elif ARGS.command == 'compare':
+        sys.exit(compare(ARGS))
+    else:
+        stage_main(ARGS)
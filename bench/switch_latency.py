@@ -0,0 +1,57 @@
+"""
+switch_latency.py : measure how long the player takes to switch songs, for a few
+file caching settings
+
+    $ python -m bench.switch_latency --caching 50 300 1000 --switches 20
+
+switches between generated tones the way the next button does, and reports
+Player's 'next' latency (change_song to the new song being heard) for each
+file caching value. needs libvlc and an audio output
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from monty.playback import Player
+from bench.gapless import write_tone
+
+
+def measure(songs, file_caching, switches):
+    """
+    measure : switch songs switches times, returning the 'next' LatencyStats
+    """
+    player = Player(gapless=False, file_caching=file_caching)
+    player.change_song(songs[0], play=True)
+    time.sleep(1)
+    for i in range(1, switches + 1):
+        stats = player.latency['next']
+        before = len(stats.samples)
+        player.begin_timing('next')
+        player.change_song(songs[i % len(songs)], play=True)
+        deadline = time.time() + 5
+        while len(stats.samples) == before and time.time() < deadline:
+            time.sleep(0.005)
+        time.sleep(0.2)
+    player.close()
+    return player.latency['next']
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        songs = []
+        for i in range(4):
+            path = os.path.join(workdir, '{}.wav'.format(i))
+            write_tone(path, 10, 220 * (i + 2))
+            songs.append(path)
+        for file_caching in args.caching:
+            stats = measure(songs, file_caching, args.switches)
+            print('file caching {:>5}ms: {}'.format(file_caching, stats.describe()))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument('--caching', type=int, nargs='+', default=[50, 300, 1000])
+    PARSER.add_argument('--switches', type=int, default=20)
+    main(PARSER.parse_args())
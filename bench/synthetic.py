@@ -0,0 +1,131 @@
+"""
+synthetic.py : generate fake libraries for the benchmarks
+"""
+
+import json
+import os
+import random
+import struct
+import uuid
+from typing import List
+
+from mutagen.easyid3 import EasyID3
+from mutagen.flac import FLAC
+
+from monty.util import mid
+
+
+SYLLABLES = ['ba', 'ké', 'lo', 'mi', 'nu', 'ra', 'sé', 'to', 'vi', 'zo',
+             'an', 'el', 'ir', 'os', 'ün', 'the', 'dar', 'mon', 'sil', 'vér']
+
+
+def make_name(rand: random.Random, words: int) -> str:
+    """
+    make_name : make up a name out of words built from SYLLABLES
+    """
+    return ' '.join(''.join(rand.choice(SYLLABLES) for _ in range(rand.randint(1, 3)))
+                    for _ in range(words)).title()
+
+
+def iter_index_entries(track_count: int, tracks_per_album=12, albums_per_artist=5, seed=0):
+    """
+    iter_index_entries : yield track_count entries shaped like those in audio.json
+    """
+    rand = random.Random(seed)
+    artist = album = None
+    for i in range(track_count):
+        if i % (tracks_per_album * albums_per_artist) == 0:
+            artist = make_name(rand, 2)
+        if i % tracks_per_album == 0:
+            album = make_name(rand, 3)
+        track_id = str(uuid.UUID(int=rand.getrandbits(128)))
+        artist_id = mid.create_uuid_from_string(artist)
+        release_id = mid.create_uuid_from_string(artist + album)
+        file_format = 'flac' if i % 3 == 0 else 'mp3'
+        yield {
+            'artist' : artist,
+            'album' : album,
+            'track_name' : make_name(rand, 3),
+            'position' : i % tracks_per_album + 1,
+            'path' : '/music/{}/{}/{}.{}'.format(artist, album, i, file_format),
+            'artist_id' : artist_id,
+            'release_id' : release_id,
+            'track_id' : track_id,
+            'file_format' : file_format,
+        }
+
+
+def generate_index(track_count: int, **kwargs) -> dict:
+    """
+    generate_index : return a dict in the same shape as audio.json with track_count entries
+    """
+    return {entry['track_id']: entry for entry in iter_index_entries(track_count, **kwargs)}
+
+
+def write_index(path: str, track_count: int, **kwargs):
+    """
+    write_index : write a synthetic audio.json with track_count entries to path,
+    one entry at a time so that big indexes don't have to fit in memory
+    """
+    with open(path, 'w') as index_file:
+        index_file.write('{')
+        for i, entry in enumerate(iter_index_entries(track_count, **kwargs)):
+            if i:
+                index_file.write(', ')
+            index_file.write('{}: {}'.format(json.dumps(entry['track_id']), json.dumps(entry)))
+        index_file.write('}')
+
+
+# one MPEG-1 layer III frame (128kbps, 44.1kHz) is 417 bytes including its 4 byte header
+MP3_FRAME_HEADER = b'\xff\xfb\x90\x64'
+MP3_FRAME_SIZE = 417
+# 44.1kHz, mono, 16 bits per sample, one second of samples
+FLAC_STREAMINFO = (struct.pack('>HH', 4096, 4096) + bytes(6) +
+                   ((44100 << 44) | (15 << 36) | 44100).to_bytes(8, 'big') + bytes(16))
+
+
+def write_audio_file(path: str, entry: dict, frames=8):
+    """
+    write_audio_file : write a small, tagged mp3 or flac file for an index entry.
+    the audio isn't playable, but it's enough for mutagen to read the tags.
+    every file gets some different bytes, so no two have the same hash
+    """
+    unique = entry['track_id'].encode()
+    if entry['file_format'] == 'mp3':
+        frame = MP3_FRAME_HEADER + bytes(MP3_FRAME_SIZE - len(MP3_FRAME_HEADER))
+        with open(path, 'wb') as audio:
+            audio.write(MP3_FRAME_HEADER + unique +
+                        bytes(MP3_FRAME_SIZE - len(MP3_FRAME_HEADER) - len(unique)))
+            audio.write(frame * (frames - 1))
+        tags = EasyID3()
+    else:
+        with open(path, 'wb') as audio:
+            audio.write(b'fLaC' + b'\x80' + len(FLAC_STREAMINFO).to_bytes(3, 'big') +
+                        FLAC_STREAMINFO + unique)
+        tags = FLAC(path)
+        tags.add_tags()
+    tags['artist'] = entry['artist']
+    tags['album'] = entry['album']
+    tags['title'] = entry['track_name']
+    tags['tracknumber'] = '{}/12'.format(entry['position'])
+    if entry['file_format'] == 'mp3':
+        tags.save(path)
+    else:
+        tags.save()
+
+
+def write_audio_tree(root: str, file_count: int, **kwargs) -> List[dict]:
+    """
+    write_audio_tree : write file_count tagged files under root, laid out as
+    {artist}/{album}/{position} {title}.{format}
+    returns the index entries the files were made from, with their paths filled in
+    """
+    entries = []
+    for entry in iter_index_entries(file_count, **kwargs):
+        album_dir = os.path.join(root, entry['artist'], entry['album'])
+        os.makedirs(album_dir, exist_ok=True)
+        entry['path'] = os.path.join(album_dir, '{:02d} {}.{}'.format(
+            entry['position'], entry['track_name'], entry['file_format']))
+        write_audio_file(entry['path'], entry)
+        entries.append(entry)
+    return entries
@@ -0,0 +1,36 @@
+"""
+compact_index.py : fold the remote index's segments into a new base
+
+Arguments:
+- upload_bucket : google cloud bucket name the index lives in (or file:///some/dir)
+
+ingest.py does this on its own every config.INDEX_COMPACT_THRESHOLD runs. run this
+to do it now, and with --prune to delete the segments the new base covers
+"""
+
+import argparse
+
+from ingest import get_bucket
+from monty.indexlog import compact
+
+
+def main(arguments):
+    """
+    main : compact the index in the given bucket
+    """
+    generation, segments = compact(get_bucket(arguments.upload_bucket), arguments.prune)
+    print('Compacted index up to generation {} ({} segments)'.format(generation, segments))
+
+
+def parse():
+    """
+    parse : parse input arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('upload_bucket')
+    parser.add_argument('--prune', action='store_true',
+                        help='delete the segments folded into the new base')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    main(parse())
@@ -0,0 +1,41 @@
+"""
+duplicate_report.py : list the audio stored more than once in the library
+
+tracks are compared by audio fingerprint, which ignores tags (see monty.dedup).
+tracks indexed before fingerprints were are fingerprinted from the media directory,
+where they've been downloaded
+
+Arguments:
+- --db : sqlite db to check (default: config.DB_LOCATION)
+"""
+
+import argparse
+
+import monty.config as config
+from monty.db import Database
+from monty.dedup import library_duplicates
+from monty.util import mid
+
+
+def main(arguments):
+    """
+    main : print the duplicates
+    """
+    db = Database(arguments.db)
+    hash_cache = mid.HashCache()
+    try:
+        print(library_duplicates(db, hash_cache).describe())
+    finally:
+        hash_cache.close()
+        db.close()
+
+
+def parse():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', help='sqlite db to check (default: {})'.format(
+        config.DB_LOCATION))
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse())
@@ -7,6 +7,8 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
 
+from gui.trackview import TrackView
+
 class PlayerGUI(tk.Frame):
     """
     PlayerGUI : use tkinter to do gui stuff
@@ -36,24 +38,32 @@ class PlayerGUI(tk.Frame):
         self.quit.grid(column=1, row=2)
         self.download = ttk.Button(self.mainframe, text='download')
         self.download.grid(column=0, row=2)
+        # download everything on the selected track's album or by its artist
+        self.download_album = ttk.Button(self.mainframe, text='download album')
+        self.download_album.grid(column=0, row=3)
+        self.download_artist = ttk.Button(self.mainframe, text='download artist')
+        self.download_artist.grid(column=1, row=3)
+        self.cancel_downloads = ttk.Button(self.mainframe, text='cancel downloads')
+        self.cancel_downloads.grid(column=2, row=3)
         self.previous_track = ttk.Button(self.mainframe, text='previous track')
         self.previous_track.grid(column=0, row=1)
         self.play_pause = ttk.Button(self.mainframe, text='play/pause')
         self.play_pause.grid(column=1, row=1)
         self.next_track = ttk.Button(self.mainframe, text='next track')
         self.next_track.grid(column=2, row=1)
-        # ListBox to show available songs
-        self.text = tk.Listbox(self.mainframe, height=10, width=30)
-        # if 'text' in self.bindings:
-        #     self.text.bind('<Double-Button-1>', self.bindings['text'])
-        self.selected_item = None
+        # one line of status, e.g. how many downloads are running
+        self.status = ttk.Label(self.mainframe, text='')
+        self.status.grid(column=2, row=2)
+        # list of available songs, with a filter box above it
+        self.text = TrackView(self.mainframe)
+        self.text.grid(column=0, row=0, columnspan=3, sticky=(tk.N, tk.E, tk.S, tk.W))
 
-    def add_tracks_to_listbox(self, tracklist: list):
+    def set_track_source(self, tracks, search=None):
         """
-        add_tracks_to_listbox : take the list of tracks and add them to the listbox
+        set_track_source : show the tracks in tracks (e.g. a monty.library.LibraryView),
+        filtering them with search(query) as the user types
         """
-        for track in tracklist:
-            self.text.insert('end', track)
+        self.text.set_source(tracks, search)
 
     def bind_to(self, button, event, func, override=False):
         """
@@ -63,7 +73,8 @@ class PlayerGUI(tk.Frame):
             error_msg = 'A binding already exists for {}'.format(button)
             raise BindingAlreadyExistsException(error_msg)
         elif ((button == 'text' and event == '<Double-Button-1>')
-              or (button == 'download' and event == '<Button-1>')):
+              or (button in ('download', 'download_album', 'download_artist')
+                  and event == '<Button-1>')):
             # if this is the text button, then we need to pass the current selected
             # item to the callback
             func = functools.partial(self.on_text_double_click, func)
@@ -72,21 +83,28 @@ class PlayerGUI(tk.Frame):
 
     def set_current_selection(self, index):
         """
-        set_current_selection : set the current selected item in the list box
+        set_current_selection : set the current selected item in the track list
         """
-        self.text.selection_set(index)
+        self.text.select(index)
 
     def get_current_selection(self):
         """
-        get_current_selection : get the current selected item in the list box
+        get_current_selection : get the current selected track in the track list
         """
-        return self.text.selection_get()
+        return self.text.selected_track()
 
     def on_text_double_click(self, func, _):
         """
-        on_text_double_click : on text double click, call the function with the selected element
+        on_text_double_click : on text double click, call the function with the library
+        position of the selected track (None if nothing is selected)
+        """
+        func(self.text.selected_position())
+
+    def set_status(self, message):
+        """
+        set_status : show message in the status line
         """
-        func(self.text.index(tk.ACTIVE))
+        self.status.configure(text=message)
 
     def show_error_message(self, message):
         """
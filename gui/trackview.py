@@ -0,0 +1,224 @@
+"""
+trackview.py : a scrolling list of tracks that only materialises the rows on screen
+"""
+
+import tkinter as tk
+from tkinter import ttk
+
+import monty.config as config
+
+
+class TrackView(ttk.Frame):
+    """
+    TrackView : a virtualised list of tracks with a type-ahead filter box
+
+    the listbox only ever holds the rows that are visible. scrolling moves a window
+    over the source (a monty.library.LibraryView or SearchResults, or anything with
+    __len__, rows(start, count) and position(index)) and asks it for just those rows,
+    so painting and scrolling cost the same however big the library is
+
+    typing in the filter box swaps the source for search(query) once typing pauses
+    for config.GUI_FILTER_DELAY_MS, and clearing it swaps the library back
+
+    Attributes:
+        - library : the unfiltered source
+        - source : the source being shown (library, or the results of a search)
+        - search : function taking a query and returning a source of matching tracks
+        - first : index in source of the top visible row
+        - selected : index in source of the selected row, or None
+    """
+
+    def __init__(self, master, rows: int = None):
+        super().__init__(master)
+        self.rows = rows or config.GUI_LIST_ROWS
+        self.library = []
+        self.source = self.library
+        self.search = None
+        self.first = 0
+        self.selected = None
+        self._render_pending = False
+        self._filter_job = None
+
+        self.query = tk.StringVar()
+        self.filter = ttk.Entry(self, textvariable=self.query)
+        self.filter.grid(column=0, row=0, columnspan=2, sticky=(tk.E, tk.W))
+        self.listbox = tk.Listbox(self, height=self.rows, width=60, activestyle='none',
+                                  exportselection=False)
+        self.listbox.grid(column=0, row=1, sticky=(tk.N, tk.E, tk.S, tk.W))
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.grid(column=1, row=1, sticky=(tk.N, tk.S))
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        self.query.trace_add('write', self.on_query_changed)
+        self.listbox.bind('<<ListboxSelect>>', self.on_select)
+        self.listbox.bind('<MouseWheel>', self.on_mouse_wheel)
+        self.listbox.bind('<Button-4>', lambda _: self.scroll_by(-3))
+        self.listbox.bind('<Button-5>', lambda _: self.scroll_by(3))
+        # the default key bindings stop at the edge of the listbox, which isn't the
+        # edge of the list, so the cursor is moved over the source instead
+        for key, step in (('<Up>', -1), ('<Down>', 1),
+                          ('<Prior>', -self.rows), ('<Next>', self.rows)):
+            self.listbox.bind(key, lambda _, step=step: self.move_selection(step))
+
+    def bind(self, sequence=None, func=None, add=None):
+        """
+        bind : bind events to the listbox, which is what callers mean by the track view
+        """
+        return self.listbox.bind(sequence, func, add)
+
+    def set_source(self, source, search=None):
+        """
+        set_source : show every track in source, filterable with search
+        """
+        self.library = source
+        self.search = search
+        self.query.set('')
+        self.show(source)
+
+    def show(self, source):
+        """
+        show : show the tracks in source from the top, without touching the filter box
+        """
+        self.source = source
+        self.first = 0
+        self.selected = None
+        self.render()
+
+    def refresh(self):
+        """
+        refresh : re-read the library (e.g. after a db sync) and redraw
+        """
+        if hasattr(self.library, 'refresh'):
+            self.library.refresh()
+        self.scroll_to(self.first)
+
+    def scroll_to(self, first: int):
+        """
+        scroll_to : make first the top visible row, as near as the list allows
+        """
+        self.first = max(0, min(first, len(self.source) - self.rows))
+        self.schedule_render()
+
+    def scroll_by(self, rows: int):
+        """
+        scroll_by : scroll the list by some number of rows
+        """
+        self.scroll_to(self.first + rows)
+        return 'break'
+
+    def see(self, index: int):
+        """
+        see : scroll just far enough for index to be visible
+        """
+        if index < self.first:
+            self.scroll_to(index)
+        elif index >= self.first + self.rows:
+            self.scroll_to(index - self.rows + 1)
+
+    def select(self, index: int):
+        """
+        select : select the row at index in the source and scroll to it
+        """
+        if 0 <= index < len(self.source):
+            self.selected = index
+            self.see(index)
+            self.schedule_render()
+
+    def move_selection(self, step: int):
+        """
+        move_selection : move the selection up or down by step rows
+        """
+        if not len(self.source):
+            return 'break'
+        current = self.first if self.selected is None else self.selected
+        self.select(max(0, min(len(self.source) - 1, current + step)))
+        return 'break'
+
+    def selected_track(self):
+        """
+        selected_track : the selected track, or None
+        """
+        if self.selected is None:
+            return None
+        return self.source[self.selected]
+
+    def selected_position(self):
+        """
+        selected_position : the selected track's position in the whole library, or None
+        """
+        if self.selected is None:
+            return None
+        return self.source.position(self.selected)
+
+    def schedule_render(self):
+        """
+        schedule_render : redraw once the events waiting to be handled are done,
+        so dragging the scrollbar fetches rows for where it ends up, not every step
+        """
+        if not self._render_pending:
+            self._render_pending = True
+            self.after_idle(self.render)
+
+    def render(self):
+        """
+        render : fill the listbox with the visible rows and update the scrollbar
+        """
+        self._render_pending = False
+        total = len(self.source)
+        self.first = max(0, min(self.first, total - self.rows))
+        rows = self.source.rows(self.first, self.rows)
+        self.listbox.delete(0, tk.END)
+        if rows:
+            self.listbox.insert(tk.END, *[track.get_display_string() for track in rows])
+        if self.selected is not None and 0 <= self.selected - self.first < len(rows):
+            self.listbox.selection_set(self.selected - self.first)
+            self.listbox.activate(self.selected - self.first)
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + self.rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def on_scrollbar(self, action, amount, unit=None):
+        """
+        on_scrollbar : follow the scrollbar being dragged, clicked, or stepped
+        """
+        if action == tk.MOVETO:
+            self.scroll_to(int(float(amount) * len(self.source)))
+        elif unit == tk.PAGES:
+            self.scroll_by(int(amount) * self.rows)
+        else:
+            self.scroll_by(int(amount))
+
+    def on_mouse_wheel(self, event):
+        """
+        on_mouse_wheel : scroll three rows per notch
+        """
+        return self.scroll_by(-3 if event.delta > 0 else 3)
+
+    def on_select(self, _):
+        """
+        on_select : remember which row of the source was clicked on
+        """
+        selection = self.listbox.curselection()
+        if selection:
+            self.selected = self.first + selection[0]
+
+    def on_query_changed(self, *_):
+        """
+        on_query_changed : filter once typing has paused for a moment
+        """
+        if self._filter_job is not None:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(config.GUI_FILTER_DELAY_MS, self.apply_filter)
+
+    def apply_filter(self):
+        """
+        apply_filter : show the tracks matching the filter box, or every track if it's empty
+        """
+        self._filter_job = None
+        query = self.query.get().strip()
+        if query and self.search is not None:
+            self.show(self.search(query))
+        else:
+            self.show(self.library)
@@ -3,54 +3,137 @@ ingest.py : ingest data and file it away under the monty system
 
 Arugments:
 - music_location : full path to music to be ingested
-- upload_bucket : google cloud bucket name to upload to
+- upload_bucket : google cloud bucket name to upload to (or file:///some/dir for a local stand-in)
 
 store track in upload_bucket based on the following convention (all "id"s are musicbrainz ids):
     {artist-id}/{album-id}/{recording-id}.{file_format}
 
 recursively walk the input directory
+skip files that the ingest manifest says haven't changed since the last run (unless --full)
 get artist/album/song using mutagen
 look up artist/album/song using musicbrainz
+link files whose audio (ignoring tags) is already in the library to the object that
+holds it, instead of uploading and copying them again (see monty.dedup). they still
+get their own index entries
+upload tracks concurrently, skipping objects whose remote md5 already matches
+publish this run's index entries as a new, immutable index segment (see monty.indexlog),
+compacting the segments into a new base every config.INDEX_COMPACT_THRESHOLD runs
+
+with --metrics (or --metrics-log/--metrics-prom), each stage is timed and counted
+(see monty.metrics) and a summary table is printed at the end
 """
 
 import argparse
-import json
 import os
 import shutil
+import time
 from typing import List
-from google.cloud import storage
+import requests
+from google.api_core import exceptions
+
+from monty import config, metrics
+from monty.cloud import get_storage
+from monty.db import Database
+from monty.dedup import link_duplicates
+from monty.index import find_audio_files, generate_index_for_files
+from monty.indexlog import compact, get_base_generation, list_segments, publish_segment
+from monty.manifest import IngestManifest
+from monty.upload import Uploader
+from monty.util import mid
 
-from monty import config
-from monty.index import generate_local_index
+# errors worth retrying an upload for
+TRANSIENT_ERRORS = (ConnectionError,
+                    TimeoutError,
+                    requests.exceptions.ConnectionError,
+                    exceptions.ServerError,
+                    exceptions.TooManyRequests)
+# errors for a create-only upload that found the object already there
+SEGMENT_CONFLICT_ERRORS = (exceptions.PreconditionFailed, FileExistsError)
 
 def main(arguments):
     """
     main : do something with the args
     look up metadata for each track
     """
-    client = storage.Client()
-    enriched_metadata = generate_local_index(arguments.music_location)
-    bucket = client.get_bucket(arguments.upload_bucket)
-    for track in enriched_metadata:
+    run_metrics = metrics.configure(arguments.metrics or bool(arguments.metrics_log)
+                                    or bool(arguments.metrics_prom),
+                                    arguments.metrics_log,
+                                    arguments.metrics_prom)
+    try:
+        with run_metrics.span('ingest'):
+            ingest(arguments)
+    finally:
+        summary = run_metrics.finish()
+        if summary:
+            print(summary)
+
+def ingest(arguments):
+    """
+    ingest : scan, look up, upload, publish and copy the tracks under music_location
+    """
+    manifest = IngestManifest()
+    if arguments.full:
+        manifest.clear()
+    with metrics.get().span('manifest') as span:
+        paths = [os.path.abspath(path) for path in find_audio_files(arguments.music_location)]
+        paths, skipped = manifest.partition(paths)
+        span.set(changed=len(paths), skipped=len(skipped))
+    metrics.get().count('manifest_skipped', len(skipped))
+    if not paths:
+        print('Nothing to ingest: skipped {} unchanged files'.format(len(skipped)))
+        return
+
+    hash_cache = mid.HashCache()
+    enriched_metadata = generate_index_for_files(paths, arguments.workers, hash_cache)
+    with metrics.get().span('fingerprint', items=len(enriched_metadata)):
+        fingerprints = mid.audio_fingerprints([track.file_path for track in enriched_metadata],
+                                              hash_cache)
+    # audio that's already in the library (or earlier in this run) is linked, not stored again
+    library = Database(config.DB_LOCATION) if os.path.isfile(config.DB_LOCATION) else None
+    to_store, links = link_duplicates(enriched_metadata, fingerprints, manifest, library)
+    if library is not None:
+        library.close()
+    if links.linked:
+        print(links.summary())
+    # hash the files to upload up front, on their own threads, so the uploader's md5
+    # checks come from the hash cache instead of holding up the upload threads
+    with metrics.get().span('hash', items=len(to_store)):
+        mid.create_uuids_from_files([track.file_path for track in to_store], hash_cache)
+    # uploads share the storage's thread pool, so --upload-workers is its concurrency limit
+    remote_storage = get_storage(arguments.upload_bucket, arguments.upload_workers)
+    bucket = remote_storage.bucket
+    uploads = []
+    for track in to_store:
         _, ext = os.path.splitext(track.file_path)
         ext = ext.replace('.', '')
         upload_location = os.path.join(arguments.upload_prefix,
                                        track.artist_id,
                                        track.release_id,
-                                       '{}.{}'.format(track.track_id, ext))
-        print('Uploading {} to {}/{}'.format(track.file_path,
-                                             arguments.upload_bucket,
-                                             upload_location))
-        blob = bucket.blob(upload_location)
-        with open(track.file_path, 'rb') as audio:
-            blob.upload_from_file(audio)
-    # tracks uploaded. now let's make that index
-    # first, check to see if it's already there
-    index_location = os.path.join('index', 'audio.json')
-    existing_blob = bucket.get_blob(index_location)
+                                       '{}.{}'.format(track.recording_id, ext))
+        uploads.append((track.file_path, upload_location))
+    uploader = Uploader(retryable=TRANSIENT_ERRORS,
+                        hash_cache=hash_cache,
+                        storage=remote_storage)
+    with metrics.get().span('upload', items=len(uploads)) as span:
+        report = uploader.upload_all(uploads)
+        span.set(uploaded=report.uploaded, skipped=report.skipped,
+                 failed=len(report.failed), bytes=report.bytes_uploaded)
+    print(report.summary())
+    if remote_storage.stats.requests:
+        print(remote_storage.stats.describe())
+    remote_storage.close()
+    # leave failed uploads (and the duplicates linked to them) out of the index and the
+    # manifest, so the next run retries them
+    failed = set(report.failed)
+    failed_keys = {track.get_audio_key() for track in to_store if track.file_path in failed}
+    enriched_metadata = [track for track in enriched_metadata
+                         if track.file_path not in failed
+                         and track.get_audio_key() not in failed_keys]
+    to_store = [track for track in to_store if track.file_path not in failed]
+    # tracks uploaded. now publish them as a new index segment
     index = {}
     for track in enriched_metadata:
-        index[track.track_id] = {
+        index[track.recording_id] = {
             'artist' : track.artist,
             'album' : track.album,
             'track_name' : track.track_title,
@@ -58,23 +141,32 @@ def main(arguments):
             'path' : track.file_path,
             'artist_id' : track.artist_id,
             'release_id' : track.release_id,
-            'track_id' : track.track_id,
+            'track_id' : track.recording_id,
             'file_format' : track.file_format,
+            'fingerprint' : fingerprints.get(track.file_path),
+            'audio_key' : track.audio_key,
         }
-    if existing_blob:
-        # blob exists
-        beep = existing_blob.download_as_string()
-        existing_index = json.loads(beep)
-        # the next two lines are dumb and should be removed
-        existing_index.update(index)
-        index = existing_index
-    # the next 5 lines are also dumb and should also be removed
-    with open('audio_index.json', 'w') as tmp:
-        json.dump(index, tmp)
-    with open('audio_index.json', 'rb') as tmp:
-        blob = bucket.blob(index_location)
-        blob.upload_from_file(tmp)
-    copy_to_media_directory(enriched_metadata)
+    if index:
+        with metrics.get().span('publish', items=len(index)):
+            generation = publish_segment(bucket, index, SEGMENT_CONFLICT_ERRORS)
+        print('Published {} index entries as generation {}'.format(len(index), generation))
+        # fold the segments into a new base every so often, so readers don't pile them up
+        if len(list_segments(bucket, get_base_generation(bucket))) >= config.INDEX_COMPACT_THRESHOLD:
+            with metrics.get().span('compact'):
+                print('Compacted index up to generation {} ({} segments)'.format(*compact(bucket)))
+    with metrics.get().span('copy', items=len(to_store)):
+        copy_to_media_directory(to_store)
+    with metrics.get().span('manifest_record', items=len(enriched_metadata)):
+        manifest.record(enriched_metadata, fingerprints)
+    print('Processed {} files, skipped {} unchanged files'.format(len(enriched_metadata),
+                                                                  len(skipped)))
+
+def get_bucket(name: str):
+    """
+    get_bucket : return the google cloud storage bucket called name,
+    or a local DirectoryBucket if name looks like file:///some/directory
+    """
+    return get_storage(name).bucket
 
 def copy_to_media_directory(metadata: List[dict]):
     """
@@ -93,7 +185,10 @@ def copy_to_media_directory(metadata: List[dict]):
             pass
         dest_shortname = '{}.{}'.format(metadatum.recording_id, metadatum.file_format)
         dest = os.path.join(album_dir, dest_shortname)
+        start = time.perf_counter()
         shutil.copyfile(src, dest)
+        metrics.get().observe('copy_seconds', time.perf_counter() - start)
+        metrics.get().count('copy_bytes', os.path.getsize(dest))
 
 
 def parse():
@@ -105,6 +200,18 @@ def parse():
     parser.add_argument('music_location')
     parser.add_argument('upload_bucket')
     parser.add_argument('upload_prefix')
+    parser.add_argument('--workers', type=int, default=config.SCAN_WORKERS,
+                        help='number of processes used to read tags (1 to scan serially)')
+    parser.add_argument('--upload-workers', type=int, default=config.UPLOAD_WORKERS,
+                        help='maximum number of concurrent uploads')
+    parser.add_argument('--full', action='store_true',
+                        help='ignore the ingest manifest and re-process every file')
+    parser.add_argument('--metrics', action='store_true',
+                        help='time and count each stage, and print a summary at the end')
+    parser.add_argument('--metrics-log', metavar='PATH',
+                        help='append each stage (and the totals) to PATH as json lines')
+    parser.add_argument('--metrics-prom', metavar='PATH',
+                        help='write the totals to PATH in prometheus text format')
     return parser.parse_args()
 
 if __name__ == '__main__':
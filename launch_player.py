@@ -10,17 +10,35 @@ import google
 
 from gui import PlayerGUI
 from monty import Database, Player, TrackList
+from monty.cache import MediaCache
 from monty.cloud import get_remote_storage, NoStorageConnectionException
+from monty.download import BulkDownload
+from monty.library import LibraryView, SearchResults
+from monty.playback import NoAvailableMediaException
+from monty.runtime import Runtime
+from monty.tracklist import NoAvailableSongException
 
 SH = logging.StreamHandler(sys.stdout)
 LOGGER = logging.getLogger(__name__)
 LOGGER.addHandler(SH)
+LOGGER.setLevel(logging.INFO)
 
 def main():
     """
     main : play some songs
     """
+    # one storage client for the track list's downloads, the user's and the index sync,
+    # so between them they stay within config.STORAGE_MAX_CONCURRENCY requests
     client = get_remote_storage()
+    # anything that waits on the network or the disk runs on the runtime's event loop,
+    # and its results come back to these callbacks on the gui thread
+    runtime = Runtime()
+    # downloads : number of downloads the user has asked for that are still running
+    downloads = {'running' : 0}
+    # bulk_downloads : album and artist downloads that are still running
+    bulk_downloads = []
+    # song_changes : the latest track change asked for. slower, older ones are ignored
+    song_changes = {'latest' : 0}
 
     # A bunch of callback functions for keyboard/gui events
     def on_play_or_pause(_):
@@ -28,61 +46,255 @@ def main():
         on_play_or_pause : how to react when the play/pause media key is pressed
         """
         if player.is_playing():
+            player.begin_timing('pause')
             player.pause()
-        else:
+            return
+        player.begin_timing('play')
+        try:
             player.play()
+        except NoAvailableMediaException:
+            gui.show_error_message('Pick a song to play first')
+
+    def change_song(skip, play=None):
+        """
+        change_song : run the track list skip coroutine in the background, then play
+        whatever it returns, unless another skip was asked for in the meantime
+        """
+        song_changes['latest'] += 1
+        change = song_changes['latest']
+
+        def on_done(song_location):
+            if change == song_changes['latest']:
+                player.change_song(song_location, play)
+                queue_next_song()
+
+        runtime.submit(skip, on_done, on_skip_error)
+
+    def queue_next_song():
+        """
+        queue_next_song : tell the player which song comes next, so it can move
+        straight on to it once it's been downloaded
+        """
+        next_position = track_list.position + 1
+        if next_position < len(track_list.song_metadata):
+            player.set_next_song(track_list.song_metadata[next_position].get_local_path())
+        else:
+            player.set_next_song(None)
+
+    def on_song_ended():
+        """
+        on_song_ended : the player got to the end of a song with nothing queued up
+        after it, so fetch the next one and play it
+        """
+        change_song(track_list.get_next_song(), play=True)
+
+    def on_song_changed(song_location):
+        """
+        on_song_changed : the player moved on to the queued-up song by itself,
+        so catch the track list up with it
+        """
+        song_changes['latest'] += 1
+
+        def on_done(new_location):
+            if new_location != song_location:
+                player.change_song(new_location, play=True)
+            queue_next_song()
+
+        runtime.submit(track_list.get_next_song(), on_done, on_skip_error)
+
+    def on_skip_error(error):
+        """
+        on_skip_error : tell the user why we couldn't change songs
+        """
+        if isinstance(error, NoAvailableSongException):
+            return
+        if isinstance(error, NoStorageConnectionException):
+            gui.show_error_message('Unable to connect to the remote tunes. Sorry')
+            return
+        LOGGER.error('Unable to change songs: %r', error)
 
     def on_next_track(_):
         """
         on_next_track : how to react when the next track media key is pressed
         """
-        player.change_song(track_list.get_next_song())
+        player.begin_timing('next')
+        change_song(track_list.get_next_song())
 
     def on_previous_track(_):
         """
         on_previous_track : how to react when the previous track media key is pressed
         """
-        player.change_song(track_list.get_previous_song())
+        player.begin_timing('previous')
+        change_song(track_list.get_previous_song())
 
     def skip_to_arbitrary_song(song_position: int):
         """
-        skip_to_arbitrary_song : given an index, skip to that position in the tracklist
+        skip_to_arbitrary_song : given a position in the library, skip to that song
         """
-        player.change_song(track_list.skip_to_index(song_position))
+        if song_position is None:
+            return
+        player.begin_timing('skip')
+        index = song_position - loaded['start']
+        if 0 <= index < len(loaded['songs']):
+            change_song(track_list.skip_to_index(index))
+            return
+        # the track list hasn't been loaded that far (yet). rather than load everything
+        # before the song, the track list starts over from the song before it, which
+        # the library view looks up by key
+        start = max(0, song_position - 1)
+        songs = library.rows(start, library.page_size)
+        if song_position - start >= len(songs):
+            return
+        loaded.update(start=start, songs=songs,
+                      pages=db.iter_track_pages(after=songs[-1].key))
+        change_song(track_list.play_from(songs, song_position - start))
+        if not loaded['loading']:
+            load_more_tracks()
 
     def download_track(song_position):
         """
-        download_track : given an index, download the track at that position in the track list
+        download_track : given an index, download the track at that position in the
+        track list in the background
         """
-        # TODO: use threading to avoid blocking the gui on long-running background tasks
+        if song_position is None:
+            gui.show_error_message('No song selected')
+            return
+        track = library[song_position]
 
-        try:
-            track = track_list.song_metadata[song_position]
-        except IndexError:
+        def on_done(_):
+            # the user asked for this one, so keep it around regardless of the cache quota
+            media_cache.record_download(track.get_local_path(), pinned=True)
+            update_downloads(-1)
+
+        def on_error(error):
+            update_downloads(-1)
+            if isinstance(error, NoStorageConnectionException):
+                gui.show_error_message('Unable to connect to the remote tunes. Sorry')
+            else:
+                gui.show_error_message('Unable to download {}'.format(track.get_display_string()))
+
+        update_downloads(1)
+        runtime.submit(client.get_recording(*track.audio_ids),
+                       on_done, on_error)
+
+    def download_tracks_of(song_position, by_artist):
+        """
+        download_tracks_of : download every track on the album of (or, if by_artist,
+        by the artist of) the track at song_position, in the background
+        """
+        if song_position is None:
             gui.show_error_message('No song selected')
             return
+        track = library[song_position]
+        if by_artist:
+            filters = {'artist_id' : track.artist_id}
+        else:
+            filters = {'release_id' : track.release_id}
+        bulk = BulkDownload(db, client, media_cache=media_cache,
+                            on_progress=lambda _: runtime.post(show_downloads), **filters)
+        if not bulk.missing:
+            gui.set_status('all {} tracks are already downloaded'.format(len(bulk.tracks)))
+            return
+
+        def on_done(report):
+            bulk_downloads.remove(bulk)
+            show_downloads()
+            LOGGER.info(report.summary())
+            if report.failed:
+                gui.show_error_message('Unable to download {} of the tracks'.format(
+                    len(report.failed)))
+
+        def on_error(error):
+            bulk_downloads.remove(bulk)
+            show_downloads()
+            LOGGER.error('Bulk download failed: %r', error)
+
+        bulk_downloads.append(bulk)
+        show_downloads()
+        runtime.submit(bulk.run(), on_done, on_error)
 
+    def cancel_downloads(_):
+        """
+        cancel_downloads : stop album and artist downloads from starting any more tracks
+        """
+        for bulk in bulk_downloads:
+            bulk.cancel()
+
+    def update_downloads(change):
+        """
+        update_downloads : keep the count of running single-track downloads up to date
+        """
+        downloads['running'] += change
+        show_downloads()
+
+    def show_downloads():
+        """
+        show_downloads : show the running downloads in the status line
+        """
+        running = []
+        if downloads['running']:
+            running.append('downloading {} tracks'.format(downloads['running']))
+        running.extend('downloading {}'.format(bulk.describe()) for bulk in bulk_downloads)
+        gui.set_status(', '.join(running))
+
+    def on_synced(report):
+        """
+        on_synced : the background index sync finished, so show what it changed
+        """
+        LOGGER.info(report.summary())
+        gui.text.refresh()
+
+    def on_sync_error(error):
+        """
+        on_sync_error : the background index sync failed, so carry on with what we have
+        """
+        if isinstance(error, NoStorageConnectionException):
+            LOGGER.info('Unable to reach remote storage, using the local index as-is')
+        else:
+            LOGGER.error('Unable to sync the local index: %r', error)
+
+    def sync_index():
+        """
+        sync_index : sync the local db with remote storage. this runs on the runtime's
+        executor, so it uses its own connection to the db
+        """
+        sync_db = Database(storage=client)
         try:
-            client.get_recording(track.artist_id,
-                                track.release_id,
-                                track.recording_id,
-                                track.file_format)
-        except NoStorageConnectionException:
-            gui.show_error_message('Unable to connect to the remote tunes. Sorry')
+            return sync_db.sync()
+        finally:
+            sync_db.close()
 
     def stop_everything(_, __):
         """
         stop_everything: shut everything down
         """
-        player.stop()
+        player.close()
+        LOGGER.info('Gaps between songs: %s', player.gap_stats.describe())
+        LOGGER.info('Click-to-audible latency:\n%s', player.describe_latency())
+        LOGGER.info('Time to first audio on cold tracks: %s', player.first_audio.describe())
+        LOGGER.info('Remote storage:\n%s', client.stats.describe())
+        runtime.stop()
+        client.close()
+        media_cache.stop()
         sys.exit(0)
 
-    db = Database()
-    # how should this work? db returns metadata objects?
-    tracks = list(db.generate_all_track_info())
-    track_list = TrackList(tracks)
+    db = Database(storage=client)
+    # the gui reads the tracks it shows straight from the db. the track list only
+    # gets the first page up front; the rest is streamed in by load_more_tracks
+    # once the window is up
+    library = LibraryView(db)
+    # loaded : the songs in the track list, and where they start in the library. pages
+    # is where the rest of them come from, and loading is whether they're on their way
+    track_pages = db.iter_track_pages()
+    loaded = {'start' : 0, 'songs' : next(track_pages, []), 'pages' : track_pages,
+              'loading' : False}
+    media_cache = MediaCache()
+    media_cache.start()
+    track_list = TrackList(loaded['songs'], cloud=client, media_cache=media_cache)
 
-    player = Player()
+    # the player calls these from a vlc thread, so they're handed to the gui thread
+    player = Player(on_song_ended=lambda: runtime.post(on_song_ended),
+                    on_song_changed=lambda location: runtime.post(on_song_changed, location))
 
     signal.signal(signal.SIGTERM, stop_everything)
     signal.signal(signal.SIGINT, stop_everything)
@@ -93,10 +305,33 @@ def main():
         'previous_track' : ('<Button-1>', on_previous_track),
         'text' : ('<Double-Button-1>', skip_to_arbitrary_song),
         'download' : ('<Button-1>', download_track),
+        'download_album' : ('<Button-1>',
+                            lambda position: download_tracks_of(position, by_artist=False)),
+        'download_artist' : ('<Button-1>',
+                             lambda position: download_tracks_of(position, by_artist=True)),
+        'cancel_downloads' : ('<Button-1>', cancel_downloads),
     }
     gui = PlayerGUI.new(gui_bindings)
-    gui.add_tracks_to_listbox([track.get_display_string() for track in tracks])
+    gui.set_track_source(library, lambda query: SearchResults.search(library, query))
+    runtime.start(gui.master)
+    runtime.run_blocking(sync_index, on_done=on_synced, on_error=on_sync_error)
+
+    def load_more_tracks():
+        """
+        load_more_tracks : add the next page of tracks, then give the gui a turn before the next
+        """
+        page = next(loaded['pages'], None)
+        loaded['loading'] = page is not None
+        if page is None:
+            return
+        # added to the list the track list has (or is about to have, see play_from)
+        loaded['songs'].extend(page)
+        gui.master.after_idle(load_more_tracks)
+
+    loaded['loading'] = True
+    gui.master.after_idle(load_more_tracks)
     gui.master.mainloop()
+    runtime.stop()
 
     return
 
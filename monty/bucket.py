@@ -0,0 +1,159 @@
+"""
+bucket.py : a local directory that behaves like a google cloud storage bucket
+
+only the parts of the google.cloud.storage Bucket/Blob api that monty uses are
+implemented. objects are stored as plain files under the bucket's root directory,
+so this is handy for running ingest/playback offline and in tests
+"""
+
+import base64
+import io
+import os
+import shutil
+import uuid
+
+import monty.config as config
+from monty.util import mid
+
+
+class DirectoryBucket(object):
+    """
+    DirectoryBucket : a bucket stored in a local directory
+
+    Attributes:
+        - root : directory holding the bucket's objects
+        - name : bucket name, for display only
+    """
+
+    def __init__(self, root, name=None):
+        self.root = root
+        self.name = name or os.path.basename(os.path.normpath(root))
+
+    def blob(self, blob_name):
+        """
+        blob : return a blob handle for blob_name. the object may not exist yet
+        """
+        return DirectoryBlob(blob_name, self)
+
+    def get_blob(self, blob_name):
+        """
+        get_blob : return the blob for blob_name with its metadata loaded, or None
+        """
+        blob = self.blob(blob_name)
+        if not blob.exists():
+            return None
+        blob.reload()
+        return blob
+
+    def list_blobs(self, prefix=''):
+        """
+        list_blobs : yield every blob whose name starts with prefix
+        only the size of each blob is loaded. call reload() for its md5
+        """
+        for (dirpath, _, filenames) in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if name.startswith(prefix) and not name.endswith('.uploading'):
+                    blob = self.blob(name)
+                    blob.size = os.path.getsize(path)
+                    yield blob
+
+
+class DirectoryBlob(object):
+    """
+    DirectoryBlob : a single object in a DirectoryBucket
+
+    Attributes:
+        - name : object name, relative to the bucket root
+        - bucket : the DirectoryBucket this blob belongs to
+        - md5_hash : base64 md5 of the object's contents, set by reload()
+        - size : size of the object in bytes, set by reload()
+    """
+
+    def __init__(self, name, bucket):
+        self.name = name
+        self.bucket = bucket
+        self.md5_hash = None
+        self.size = None
+
+    @property
+    def path(self):
+        """ path : location of this object on local disk """
+        return os.path.join(self.bucket.root, self.name.lstrip('/'))
+
+    def exists(self):
+        """ exists : check if the object is there """
+        return os.path.isfile(self.path)
+
+    def reload(self):
+        """
+        reload : load the object's size and md5 hash
+        """
+        self.size = os.stat(self.path).st_size
+        self.md5_hash = base64.b64encode(mid.file_digest(self.path)).decode('ascii')
+
+    def upload_from_filename(self, filename):
+        """
+        upload_from_filename : copy filename into the bucket
+        """
+        with open(filename, 'rb') as file_obj:
+            self.upload_from_file(file_obj)
+
+    def upload_from_file(self, file_obj, if_generation_match=None):
+        """
+        upload_from_file : write the contents of file_obj to the object.
+        the object only appears once it's fully written.
+        if_generation_match=0 only creates the object, raising FileExistsError if it exists
+        """
+        config.ensure_dir(self.path)
+        tmp_path = '{}.{}.uploading'.format(self.path, uuid.uuid4().hex)
+        with open(tmp_path, 'wb') as out:
+            shutil.copyfileobj(file_obj, out)
+        if if_generation_match == 0:
+            try:
+                # link fails if the object exists, which makes the check-and-create atomic
+                os.link(tmp_path, self.path)
+            finally:
+                os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, self.path)
+
+    def upload_from_string(self, data, if_generation_match=None):
+        """
+        upload_from_string : write data (str or bytes) to the object
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.upload_from_file(io.BytesIO(data), if_generation_match=if_generation_match)
+
+    def delete(self):
+        """
+        delete : remove the object
+        """
+        os.remove(self.path)
+
+    def download_to_filename(self, filename):
+        """
+        download_to_filename : copy the object to filename
+        """
+        shutil.copyfile(self.path, filename)
+
+    def download_to_file(self, file_obj, start=None, end=None):
+        """
+        download_to_file : write the object to file_obj. start and end (inclusive)
+        limit it to a range of bytes, like an http Range request
+        """
+        with open(self.path, 'rb') as source:
+            source.seek(start or 0)
+            if end is None:
+                shutil.copyfileobj(source, file_obj)
+            else:
+                file_obj.write(source.read(end - (start or 0) + 1))
+
+    def download_as_string(self):
+        """
+        download_as_string : return the contents of the object as bytes
+        """
+        with open(self.path, 'rb') as file_obj:
+            return file_obj.read()
@@ -0,0 +1,154 @@
+"""
+cache.py : keep the tracks downloaded into config.MEDIA_DIR under a size quota
+
+every track downloaded from cloud storage is recorded in the media_cache table
+along with its size and when it was last played. once the total goes over the
+quota, the least recently played tracks are deleted, a few at a time, by a
+background thread. tracks are never evicted if they're:
+- pinned (the user asked to download them)
+- in the current TrackList window (about to be played, or just played)
+- currently playing
+tracks that were copied in by ingest.py aren't tracked, so they're never evicted
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import List
+
+import monty.config as config
+
+
+class MediaCache(object):
+    """
+    MediaCache : LRU bookkeeping and eviction for downloaded tracks
+
+    Attributes:
+        - db_location : location of the sqlite db holding the media_cache table
+        - quota_bytes : how many bytes of downloaded tracks to keep
+    """
+
+    def __init__(self, db_location=None, quota_bytes: int = None):
+        self.db_location = db_location or config.DB_LOCATION
+        self.quota_bytes = (config.MEDIA_CACHE_QUOTA_BYTES
+                            if quota_bytes is None else quota_bytes)
+        config.ensure_dir(self.db_location)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_location, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+            create table if not exists media_cache
+                (path varchar primary key,
+                 size int,
+                 last_access real,
+                 pinned int)
+            """)
+            self._conn.execute("""
+            create index if not exists media_cache_lru on media_cache (pinned, last_access)
+            """)
+        self._window = set()
+        self._playing = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record_download(self, path: str, pinned=False):
+        """
+        record_download : start tracking a track that was just downloaded
+        """
+        with self._lock, self._conn:
+            self._conn.execute("""
+            insert or replace into media_cache (path, size, last_access, pinned)
+            values (?, ?, ?, ?)
+            """, (path, os.path.getsize(path), time.time(), int(pinned)))
+
+    def touch(self, path: str):
+        """
+        touch : mark a tracked track as just played
+        """
+        with self._lock, self._conn:
+            self._conn.execute('update media_cache set last_access = ? where path = ?',
+                               (time.time(), path))
+
+    def pin(self, path: str, pinned=True):
+        """
+        pin : keep (or with pinned=False, stop keeping) a track regardless of the quota
+        """
+        with self._lock, self._conn:
+            self._conn.execute('update media_cache set pinned = ? where path = ?',
+                               (int(pinned), path))
+
+    def set_window(self, paths: List[str]):
+        """
+        set_window : protect the tracks around the current TrackList position from eviction
+        """
+        with self._lock:
+            self._window = set(paths)
+
+    def set_playing(self, path: str):
+        """
+        set_playing : protect the track that's playing from eviction
+        """
+        with self._lock:
+            self._playing = path
+
+    def usage(self) -> int:
+        """
+        usage : total size in bytes of tracked downloads
+        """
+        with self._lock:
+            return self._conn.execute('select coalesce(sum(size), 0) from media_cache').fetchone()[0]
+
+    def evict_step(self, max_files: int = None) -> int:
+        """
+        evict_step : if we're over quota, delete up to max_files of the least recently
+        played unprotected tracks. returns the number of bytes freed
+        """
+        max_files = max_files or config.MEDIA_CACHE_EVICT_BATCH
+        excess = self.usage() - self.quota_bytes
+        freed = 0
+        if excess <= 0:
+            return freed
+        with self._lock:
+            candidates = self._conn.execute("""
+            select path, size from media_cache where pinned = 0
+            order by last_access limit ?
+            """, (max_files + len(self._window) + 1,)).fetchall()
+            evicted = []
+            for path, size in candidates:
+                if freed >= excess or len(evicted) >= max_files:
+                    break
+                if path in self._window or path == self._playing:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                evicted.append((path,))
+                freed += size
+            with self._conn:
+                self._conn.executemany('delete from media_cache where path = ?', evicted)
+        return freed
+
+    def start(self, interval: float = None):
+        """
+        start : run evict_step every interval seconds on a background thread
+        """
+        interval = interval or config.MEDIA_CACHE_EVICT_INTERVAL
+
+        def run():
+            while not self._stop.wait(interval):
+                self.evict_step()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name='media-cache-eviction', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        stop : stop the background eviction thread
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,31 +1,162 @@
 """
 cloud.py : interactions with the cloud
+
+a storage's async methods never block the event loop they're awaited on: the
+blocking bucket calls run on the storage's own thread pool, which is also its
+concurrency limit (config.STORAGE_MAX_CONCURRENCY, or max_concurrency), so one
+storage can be shared by the track list, user downloads and ingest without them
+swamping the connection between them. bulk downloads hold one of its bulk_slots
+while they download, so they never take the last config.STORAGE_RESERVED_SLOTS
+threads, which are left for requests the player is waiting on. every request is
+timed and its bytes counted in the storage's StorageStats
 """
 
+import asyncio
+import gzip
+import logging
 import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
 from google.cloud import storage
 from google.auth.exceptions import DefaultCredentialsError
 
 import monty.config as config
+from monty import metrics
+from monty.bucket import DirectoryBucket
+from monty.progressive import ProgressiveDownload, partial_path
+from monty.util.stats import LatencyStats
+
+LOGGER = logging.getLogger(__name__)
 
 
-def get_remote_storage():
+def get_remote_storage(max_concurrency: int = None):
     """
-    get_remote_storage : try creating a GCP client, otherwise return a noop client
+    get_remote_storage : the LocalDirectoryStorage in config.LOCAL_STORAGE_DIR if that's
+    set, otherwise try creating a GCP client, otherwise return a noop client
     """
+    if config.LOCAL_STORAGE_DIR:
+        return LocalDirectoryStorage(config.LOCAL_STORAGE_DIR, max_concurrency)
     try:
-        return CloudStorage()
+        return CloudStorage(max_concurrency=max_concurrency)
     except DefaultCredentialsError:
         return NoopStorage()
 
+def get_storage(name: str, max_concurrency: int = None):
+    """
+    get_storage : storage for the google cloud storage bucket called name,
+    or a LocalDirectoryStorage if name looks like file:///some/directory
+    """
+    if name.startswith('file://'):
+        return LocalDirectoryStorage(name[len('file://'):], max_concurrency)
+    return CloudStorage(name, max_concurrency)
+
+def change_object_name(generation: int) -> str:
+    """
+    change_object_name : name of the index change object for a generation
+    """
+    return '{}{:010d}.json'.format(config.INDEX_CHANGES_PREFIX, generation)
+
+def parse_generation(name: str) -> int:
+    """
+    parse_generation : the generation of an index change object name, or None
+    """
+    match = re.search(r'(\d+)\.json$', name)
+    return int(match.group(1)) if match else None
+
+class StorageStats(object):
+    """
+    StorageStats : request counts, bytes and latency for each kind of storage request
+    requests are recorded from the storage's threads, so everything is behind a lock
+    """
+
+    def __init__(self):
+        # requests : key is an operation, value is [number of requests, bytes transferred]
+        self.requests = {}
+        self.latency = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation: str, started: float, size: int = 0):
+        """
+        record : one request for operation, which started at started (a
+        time.perf_counter() value) and transferred size bytes
+        """
+        seconds = time.perf_counter() - started
+        with self._lock:
+            totals = self.requests.setdefault(operation, [0, 0])
+            totals[0] += 1
+            totals[1] += size
+            self.latency.setdefault(operation, LatencyStats()).record(seconds * 1000)
+        metrics.get().count('storage_{}_bytes'.format(operation), size)
+        metrics.get().observe('storage_{}_seconds'.format(operation), seconds)
+
+    def summary(self) -> dict:
+        """
+        summary : requests, bytes and p50/p95/max latency in ms for each operation
+        """
+        with self._lock:
+            return {operation: dict(self.latency[operation].summary(),
+                                    requests=count, bytes=size)
+                    for operation, (count, size) in self.requests.items()}
+
+    def describe(self) -> str:
+        """
+        describe : the summary as text, one line per operation
+        """
+        with self._lock:
+            return '\n'.join('{}: {} requests, {:.1f} MB, {}'.format(
+                operation, count, size / 1024 / 1024, self.latency[operation].describe())
+                              for operation, (count, size) in sorted(self.requests.items()))
+
+
 class CloudStorage:
     """
     CloudStorage : class for interacting with cloud storage
+
+    Attributes:
+        - bucket : the bucket recordings and the index are kept in
+        - max_concurrency : how many requests the async methods have in flight at once
+        - stats : StorageStats for every request made
     """
 
-    def __init__(self):
+    def __init__(self, bucket_name: str = None, max_concurrency: int = None):
         self.client = storage.Client()
-        self.bucket = self.client.get_bucket(config.CLOUD_STORAGE_BUCKET)
+        self.bucket = self.client.get_bucket(bucket_name or config.CLOUD_STORAGE_BUCKET)
+        self._start_executor(max_concurrency)
+
+    def _start_executor(self, max_concurrency: int = None):
+        self.max_concurrency = max_concurrency or config.STORAGE_MAX_CONCURRENCY
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                           thread_name_prefix='storage')
+        self.stats = StorageStats()
+        self._bulk_slots = None
+
+    def bulk_slots(self) -> asyncio.Semaphore:
+        """
+        bulk_slots : the semaphore bulk downloads (see monty.download) hold while they
+        download, shared by all of them. it leaves config.STORAGE_RESERVED_SLOTS of the
+        storage's threads free, so a cold track can start streaming without waiting for
+        whole bulk downloads to finish. made on first use, on the loop that uses it
+        """
+        if self._bulk_slots is None:
+            self._bulk_slots = asyncio.Semaphore(
+                max(1, self.max_concurrency - config.STORAGE_RESERVED_SLOTS))
+        return self._bulk_slots
+
+    async def _run(self, func, *args):
+        """
+        _run : run a blocking call on the storage's thread pool
+        """
+        return await asyncio.get_event_loop().run_in_executor(self.executor, func, *args)
+
+    def close(self):
+        """
+        close : stop the thread pool, once the requests in flight are done
+        """
+        self.executor.shutdown(wait=False)
 
     async def get_recording(self, artist_id, release_id, recording_id, file_format):
         """
@@ -33,10 +164,7 @@ class CloudStorage:
         """
         # make sure artist/album directory exists locally
         album_dir = os.path.join(config.MEDIA_DIR, artist_id, release_id)
-        try:
-            os.mkdir(album_dir)
-        except FileExistsError:
-            pass
+        os.makedirs(album_dir, exist_ok=True)
 
         # now download the thing
         recording_shortname = '{}.{}'.format(recording_id, file_format)
@@ -45,14 +173,159 @@ class CloudStorage:
                                  artist_id,
                                  release_id,
                                  recording_shortname)
-        storage.Blob(name=blob_name, bucket=self.bucket).download_to_filename(recording_path)
+        # the download itself blocks, so it runs on the storage's threads to let other
+        # downloads (and everything else on the loop) carry on in the meantime
+        await self._run(self._download_recording, blob_name, recording_path)
+
+    async def stream_recording(self, artist_id, release_id, recording_id, file_format):
+        """
+        stream_recording : start downloading a recording progressively (see
+        monty.progressive), and return as soon as the start of it can be played.
+        returns a task that finishes once the rest of it has been downloaded and moved
+        into place. cancelling the task stops the download. if the rest of the download
+        fails, the task's exception is logged whether or not anyone awaits it
+        """
+        recording_shortname = '{}.{}'.format(recording_id, file_format)
+        recording_path = os.path.join(config.MEDIA_DIR, artist_id, release_id,
+                                      recording_shortname)
+        blob_name = os.path.join(config.CLOUD_STORAGE_PREFIX,
+                                 artist_id,
+                                 release_id,
+                                 recording_shortname)
+        config.ensure_dir(recording_path)
+        blob = await self._run(self._get_blob, blob_name)
+        if blob is None:
+            raise FileNotFoundError('No recording at {}'.format(blob_name))
+        download = ProgressiveDownload(blob, recording_path, blob.size)
+        finished = asyncio.ensure_future(self._finish_stream(
+            download, self._run(self._stream_recording, download)))
+
+        def report(task):
+            # nobody has to await the rest of the download, so its failures end up here
+            if not task.cancelled() and task.exception() is not None:
+                LOGGER.error('Streaming %s failed', blob_name, exc_info=task.exception())
+
+        finished.add_done_callback(report)
+        try:
+            # waiting isn't storage i/o, so it doesn't take up one of the storage's threads
+            await asyncio.get_event_loop().run_in_executor(None, download.wait_until_ready)
+        except asyncio.CancelledError:
+            finished.cancel()
+            raise
+        return finished
+
+    @staticmethod
+    async def _finish_stream(download, finished):
+        try:
+            await finished
+        except asyncio.CancelledError:
+            # the executor thread can't be interrupted, so tell it to stop instead
+            download.cancel()
+            raise
+
+    def _get_blob(self, blob_name):
+        started = time.perf_counter()
+        blob = self.bucket.get_blob(blob_name)
+        self.stats.record('metadata', started)
+        return blob
+
+    def _stream_recording(self, download: ProgressiveDownload):
+        started = time.perf_counter()
+        try:
+            download.run()
+        finally:
+            self.stats.record('stream', started, download.written)
+
+    def _download_recording(self, blob_name, recording_path):
+        """
+        _download_recording : download blob_name to recording_path
+        """
+        # download next to the final location and move it into place once it's complete,
+        # so a half-finished download never looks like a playable file. the partial file
+        # is this download's own, since the same recording may be downloading elsewhere
+        # (a prefetch and a bulk download, say)
+        started = time.perf_counter()
+        partial = partial_path(recording_path)
+        try:
+            self.bucket.blob(blob_name).download_to_filename(partial)
+            os.replace(partial, recording_path)
+        except BaseException:
+            try:
+                os.remove(partial)
+            except FileNotFoundError:
+                pass
+            raise
+        self.stats.record('download', started, os.path.getsize(recording_path))
 
     def get_audio_index(self):
         """
         get_audio_index : pretty self-explanatory
         """
-        blob_name = '/index/audio.json'
-        storage.Blob(name=blob_name, bucket=self.bucket).download_to_filename(config.AUDIO_INDEX_LOCATION)
+        config.ensure_dir(config.AUDIO_INDEX_LOCATION)
+        started = time.perf_counter()
+        blob = self.bucket.get_blob(config.AUDIO_INDEX_OBJECT)
+        if blob is None:
+            # nothing has been compacted into a base yet, everything is in the changes
+            with open(config.AUDIO_INDEX_LOCATION, 'w'):
+                pass
+            return
+        blob.download_to_filename(config.AUDIO_INDEX_LOCATION)
+        self.stats.record('index', started, os.path.getsize(config.AUDIO_INDEX_LOCATION))
+
+    def get_catalog_snapshot(self, db_location: str) -> bool:
+        """
+        get_catalog_snapshot : download the catalog snapshot and decompress it to db_location
+        returns False if no snapshot has been published
+        """
+        blob = self.bucket.get_blob(config.CATALOG_SNAPSHOT_OBJECT)
+        if blob is None:
+            return False
+        config.ensure_dir(db_location)
+        started = time.perf_counter()
+        compressed_path = '{}.gz.part'.format(db_location)
+        snapshot_path = '{}.part'.format(db_location)
+        blob.download_to_filename(compressed_path)
+        self.stats.record('index', started, os.path.getsize(compressed_path))
+        with gzip.open(compressed_path, 'rb') as snapshot, open(snapshot_path, 'wb') as out:
+            shutil.copyfileobj(snapshot, out)
+        os.remove(compressed_path)
+        os.replace(snapshot_path, db_location)
+        return True
+
+    def list_index_changes(self, after_generation: int) -> List[Tuple[int, str]]:
+        """
+        list_index_changes : return (generation, object name) for every index change
+        published after after_generation, oldest first
+        """
+        changes = []
+        for blob in self.bucket.list_blobs(prefix=config.INDEX_CHANGES_PREFIX):
+            generation = parse_generation(blob.name)
+            if generation is not None and generation > after_generation:
+                changes.append((generation, blob.name))
+        return sorted(changes)
+
+    def get_index_object(self, name: str) -> bytes:
+        """
+        get_index_object : return the contents of an object under the index prefix
+        """
+        started = time.perf_counter()
+        contents = self.bucket.blob(name).download_as_string()
+        self.stats.record('index', started, len(contents))
+        return contents
+
+
+class LocalDirectoryStorage(CloudStorage):
+    """
+    LocalDirectoryStorage : CloudStorage backed by a local directory laid out
+    like the bucket, for running without a network connection
+    (set config.LOCAL_STORAGE_DIR to have get_remote_storage return one)
+    """
+
+    def __init__(self, root, max_concurrency: int = None):
+        # pylint: disable=super-init-not-called
+        self.client = None
+        self.bucket = DirectoryBucket(root)
+        self._start_executor(max_concurrency)
 
 
 class NoopStorage:
@@ -60,15 +333,37 @@ class NoopStorage:
     NoopStorage : returned by get_remote_storage 
     """
     def __init__(self):
+        self.stats = StorageStats()
+        self._bulk_slots = None
+
+    def close(self):
         pass
 
+    def bulk_slots(self):
+        if self._bulk_slots is None:
+            self._bulk_slots = asyncio.Semaphore(1)
+        return self._bulk_slots
+
     async def get_recording(self, artist_id, release_id, recording_id, file_format):
         raise NoStorageConnectionException
 
+    async def stream_recording(self, artist_id, release_id, recording_id, file_format):
+        raise NoStorageConnectionException
+
     def get_audio_index(self):
+        config.ensure_dir(config.AUDIO_INDEX_LOCATION)
         with open(config.AUDIO_INDEX_LOCATION, 'w'):
             pass
 
+    def get_catalog_snapshot(self, db_location):
+        return False
+
+    def list_index_changes(self, after_generation):
+        return []
+
+    def get_index_object(self, name):
+        raise NoStorageConnectionException
+
 
 class NoStorageConnectionException(Exception):
     """
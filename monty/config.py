@@ -9,10 +9,77 @@ APP_DIR = os.path.join(os.environ['HOME'], '.monty/')
 MEDIA_DIR = os.path.join(APP_DIR, 'media', 'audio')
 DB_LOCATION = os.path.join(APP_DIR, 'db/local.db')
 AUDIO_INDEX_LOCATION = os.path.join(APP_DIR, 'index/audio.json')
+DB_BULK_CACHE_KIB = 64 * 1024
+DB_PAGE_SIZE = 500
+DB_MMAP_BYTES = 256 * 1024 * 1024
+SEARCH_LIMIT = 50
+
+# ingest values
+SCAN_WORKERS = os.cpu_count() or 1
+MANIFEST_LOCATION = os.path.join(os.path.dirname(DB_LOCATION), 'manifest.db')
+HASH_CACHE_LOCATION = os.path.join(os.path.dirname(DB_LOCATION), 'hashes.db')
+HASH_WORKERS = 4
+UPLOAD_WORKERS = 8
+UPLOAD_RETRIES = 3
+UPLOAD_BACKOFF = 0.5
+
+# musicbrainz values
+MUSICBRAINZ_CACHE_LOCATION = os.path.join(os.path.dirname(DB_LOCATION), 'musicbrainz.db')
+MUSICBRAINZ_CACHE_TTLS = {
+    'search_artists' : 30 * 24 * 60 * 60,
+    'search_release_groups' : 30 * 24 * 60 * 60,
+    'get_release_by_id' : 90 * 24 * 60 * 60,
+}
+MUSICBRAINZ_NEGATIVE_TTL = 24 * 60 * 60
+MUSICBRAINZ_INTERVAL = 1.0
+MUSICBRAINZ_WORKERS = 4
+
+# playback values
+PREFETCH_AHEAD = 3
+MAX_PREFETCHES = 2
+BULK_DOWNLOAD_WORKERS = 3
+MEDIA_CACHE_QUOTA_BYTES = 10 * 1024 ** 3
+MEDIA_CACHE_EVICT_INTERVAL = 30
+MEDIA_CACHE_EVICT_BATCH = 20
+GAPLESS_PLAYBACK = True
+GAPLESS_ARM_SECONDS = 5
+GAPLESS_POLL_SECONDS = 0.25
+# songs played back to back before the gapless media list is started afresh
+GAPLESS_MAX_LIST_LENGTH = 50
+PLAYER_FILE_CACHING_MS = 300
+# play cold tracks while they download, once the first PROGRESSIVE_LEAD_BYTES are on disk
+PROGRESSIVE_DOWNLOADS = True
+PROGRESSIVE_CHUNK_SIZE = 1024 * 1024
+PROGRESSIVE_LEAD_BYTES = 512 * 1024
+
+# gui values
+GUI_LIST_ROWS = 20
+GUI_CACHED_PAGES = 8
+GUI_SEARCH_LIMIT = 500
+GUI_FILTER_DELAY_MS = 150
+RUNTIME_POLL_MS = 20
+
+# server values
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8419
+SERVER_MAX_PAGE_SIZE = 1000
+SERVER_REQUEST_TIMEOUT = 30
+SERVER_CHUNK_SIZE = 256 * 1024
 
 # Cloud storage values
 CLOUD_STORAGE_PREFIX = 'audio'
 CLOUD_STORAGE_BUCKET = 'monty-media'
+AUDIO_INDEX_OBJECT = 'index/audio.json'
+CATALOG_SNAPSHOT_OBJECT = 'index/catalog.db.gz'
+INDEX_CHANGES_PREFIX = 'index/changes/'
+INDEX_BASE_OBJECT = 'index/base.json'
+INDEX_COMPACT_THRESHOLD = 50
+# most requests to remote storage in flight at once, per storage client
+STORAGE_MAX_CONCURRENCY = 4
+# how many of those bulk downloads leave free, for the player's requests
+STORAGE_RESERVED_SLOTS = 1
+# a directory laid out like the bucket, used instead of cloud storage if set
+LOCAL_STORAGE_DIR = os.environ.get('MONTY_STORAGE_DIR')
 
 def ensure_dir(complete_dir):
     """
@@ -4,14 +4,40 @@ db.py : do some database-y things with sqlite
 This should keep track of what songs we have available, with a flag for local vs remote
 """
 
+import gzip
 import json
 import os
+import re
+import shutil
 import sqlite3
-from typing import List
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 import monty.config as config
 from monty.cloud import get_remote_storage
-from monty.metadata import Metadata, FormatNotImplemented
+from monty.metadata import Metadata, TrackRow, FormatNotImplemented
+from monty.util import jsonstream
+
+INSERT_TRACK = """
+insert or replace into audio_tracks (
+    artist,
+    album,
+    track_title,
+    track_number,
+    file_path,
+    artist_id,
+    release_id,
+    track_id,
+    file_format,
+    fingerprint,
+    audio_key)
+values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+TRACK_ROW_COLUMNS = """
+rowid, artist, album, track_title, track_number, file_path,
+artist_id, release_id, track_id, file_format, audio_key
+"""
 
 class Database(object):
     """
@@ -24,6 +50,7 @@ class Database(object):
     Attributes:
         - media_dir : location to look for audio tracks
         - db_location : location of sqlite db file
+        - index_location : location of the audio index file the db is built from
 
     DB table attributes:
     - artist name
@@ -32,26 +59,129 @@ class Database(object):
     - track number
     """
 
-    def __init__(self):
+    def __init__(self, db_location=None, index_location=None, storage=None):
         self.media_dir = config.MEDIA_DIR
-        self.db_location = config.DB_LOCATION
+        self.db_location = db_location or config.DB_LOCATION
+        self.index_location = index_location or config.AUDIO_INDEX_LOCATION
+        self.storage = storage
         if not os.path.isfile(self.db_location):
             # if the db doesn't exist, make it!
-            config.ensure_dir(config.DB_LOCATION)
-            self._conn = sqlite3.connect(self.db_location)
-            storage = get_remote_storage()
+            self._build(storage or get_remote_storage())
+        else:
+            self._conn = self._connect()
+            self._add_missing_columns()
+            self.create_indexes()
+
+    def _build(self, storage):
+        """
+        _build : create the db from the newest catalog snapshot, or from audio.json
+        """
+        config.ensure_dir(self.db_location)
+        if storage.get_catalog_snapshot(self.db_location):
+            # the snapshot is a ready-made db, indexes and all
+            self._conn = self._connect()
+            if self._add_missing_columns():
+                self.create_indexes()
+        else:
+            self._conn = self._connect()
             storage.get_audio_index()
             self.init_db()
-        else:
-            self._conn = sqlite3.connect(self.db_location)
 
-    def init_db(self):
+    def rebuild(self, storage=None):
+        """
+        rebuild : build the catalog again from remote storage and swap it in
+
+        the catalog is built in a scratch db next to this one, then its tables replace
+        audio_tracks and sync_state in a single transaction. the db file itself stays
+        put, so everything else in it (the media_cache table) is kept, and other
+        connections to it (MediaCache's, the gui's) carry on, seeing the new catalog
+        """
+        storage = storage or self.storage or get_remote_storage()
+        config.ensure_dir(self.db_location)
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(self.db_location)) as workdir:
+            fresh = Database(os.path.join(workdir, 'catalog.db'), self.index_location, storage)
+            fresh.close()
+            self._replace_catalog(fresh.db_location)
+        self.create_indexes()
+
+    def _replace_catalog(self, fresh_location: str):
+        """
+        _replace_catalog : replace audio_tracks and sync_state with the ones in the db
+        at fresh_location. the search index and the other indexes on audio_tracks go
+        with it, for create_indexes to make again
+        """
+        self._conn.execute('attach database ? as fresh', (fresh_location,))
+        try:
+            # an explicit transaction, since sqlite3 wouldn't put the drops in one
+            self._conn.execute('begin immediate')
+            try:
+                self._conn.execute('drop table if exists audio_tracks_fts')
+                for table in ('audio_tracks', 'sync_state'):
+                    self._conn.execute('drop table if exists main.{}'.format(table))
+                    row = self._conn.execute("""
+                    select sql from fresh.sqlite_master where type = 'table' and name = ?
+                    """, (table,)).fetchone()
+                    if row is None:
+                        continue
+                    self._conn.execute(row[0])
+                    # rowids are copied too, since track keys end in them
+                    columns = ', '.join(['rowid'] + [
+                        column[1] for column in
+                        self._conn.execute('pragma fresh.table_info({})'.format(table))])
+                    self._conn.execute('insert into main.{0} ({1}) select {1} from fresh.{0}'.format(
+                        table, columns))
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        finally:
+            self._conn.execute('detach database fresh')
+
+    def _connect(self):
+        """
+        _connect : open the sqlite connection
+        recursive triggers are turned on so that rows removed by "insert or replace"
+        also fire the delete trigger that keeps the search index in sync
+        """
+        conn = sqlite3.connect(self.db_location)
+        conn.execute('pragma recursive_triggers = on')
+        conn.execute('pragma mmap_size = {}'.format(config.DB_MMAP_BYTES))
+        return conn
+
+    def close(self):
+        """
+        close : close the sqlite connection
+        """
+        self._conn.close()
+
+    def _add_missing_columns(self) -> bool:
         """
-        init_db : go through self.media_dir and store metadata in sqlite
+        _add_missing_columns : add columns to an audio_tracks table made before they
+        existed. returns True if any were added
+        """
+        columns = {row[1] for row in self._conn.execute('pragma table_info(audio_tracks)')}
+        missing = [column for column in ('fingerprint', 'audio_key') if column not in columns]
+        if not columns or not missing:
+            return False
+        with self._conn:
+            for column in missing:
+                self._conn.execute('alter table audio_tracks add column {} varchar'.format(column))
+        return True
+
+    def init_db(self, bulk=True, entries: Iterable[dict] = None):
+        """
+        init_db : load the audio index file (or the given index entries) into sqlite
+
+        with bulk=True (the default) rows are streamed straight from the index file
+        into a single executemany, with journaling relaxed for the duration of the
+        load. bulk=False inserts one Metadata object at a time into the same table.
+        either way the indexes and full text search are built once the rows are in
         """
+        if entries is None:
+            entries = Database.get_entries_from_index_file(self.index_location)
         with self._conn:
             self._conn.execute("""
-            create table audio_tracks 
+            create table audio_tracks
                 (artist varchar,
                  album varchar,
                  track_title varchar,
@@ -59,34 +189,224 @@ class Database(object):
                  file_path varchar,
                  artist_id varchar,
                  release_id varchar,
-                 track_id varchar,
-                 file_format varchar)
+                 track_id varchar primary key,
+                 file_format varchar,
+                 fingerprint varchar,
+                 audio_key varchar)
             """)
-        # iterate through self.media_dir
-        #   get metadata for each track, then insert it into the database
+        # the index's generation is the newest change it includes. sync() picks up from there
+        generation = 0
+
+        def rows():
+            nonlocal generation
+            for track in entries:
+                generation = max(generation, track.get('sequence', 0))
+                yield index_entry_to_row(track)
+
+        if bulk:
+            self._conn.execute('pragma journal_mode = wal')
+            self._conn.execute('pragma synchronous = off')
+            self._conn.execute('pragma cache_size = -{}'.format(config.DB_BULK_CACHE_KIB))
+            self._conn.execute('pragma temp_store = memory')
+            try:
+                with self._conn:
+                    self._conn.executemany(INSERT_TRACK, rows())
+            finally:
+                self._conn.execute('pragma synchronous = normal')
+        else:
+            with self._conn:
+                for metadatum in Database.get_tracks_from_index_file(self.index_location):
+                    self._conn.execute(INSERT_TRACK, (metadatum.artist,
+                                                      metadatum.album,
+                                                      metadatum.track_title,
+                                                      metadatum.track_number,
+                                                      metadatum.file_path,
+                                                      metadatum.artist_id,
+                                                      metadatum.release_id,
+                                                      metadatum.recording_id,
+                                                      metadatum.file_format,
+                                                      None,
+                                                      metadatum.audio_key))
+        self.set_generation(generation)
+        # indexes are much cheaper to build once over the loaded table than to
+        # keep up to date row by row
+        self.create_indexes()
+
+    def get_generation(self) -> int:
+        """
+        get_generation : the newest index change applied to this db
+        """
+        try:
+            row = self._conn.execute(
+                "select value from sync_state where key = 'generation'").fetchone()
+        except sqlite3.OperationalError:
+            return 0
+        return row[0] if row else 0
+
+    def set_generation(self, generation: int):
+        """
+        set_generation : record the newest index change applied to this db
+        """
+        with self._conn:
+            self._write_generation(generation)
+
+    def _write_generation(self, generation: int):
+        self._conn.execute("""
+        create table if not exists sync_state (key varchar primary key, value int)
+        """)
+        self._conn.execute("""
+        insert or replace into sync_state (key, value) values ('generation', ?)
+        """, (generation,))
+
+    def sync(self, storage=None) -> 'SyncReport':
+        """
+        sync : apply every index change published since the last one this db saw
+
+        all changes are applied in a single transaction, so the db either moves to
+        the newest generation or stays where it was. entries are keyed on their
+        recording (track) id: existing rows are replaced, new ones added, and
+        entries marked "removed" deleted
+        """
+        storage = storage or self.storage or get_remote_storage()
+        report = SyncReport(self.get_generation())
+        listed = storage.list_index_changes(report.generation)
+        if listed and listed[0][0] > report.generation + 1:
+            # the changes we're missing were compacted into a newer base and pruned,
+            # so start over from that base. only once: if the base is still too old
+            # (it was pruned again meanwhile, or the snapshot is stale) trying again
+            # won't help
+            self.rebuild(storage)
+            report = SyncReport(self.get_generation())
+            listed = storage.list_index_changes(report.generation)
+            if listed and listed[0][0] > report.generation + 1:
+                raise SyncError('rebuilt the db at generation {}, but the oldest index '
+                                'change is {}'.format(report.generation, listed[0][0]))
+        changes = []
+        for generation, name in listed:
+            body = storage.get_index_object(name)
+            report.bytes_transferred += len(body)
+            changes.append((generation, json.loads(body)))
+
         with self._conn:
-            for metadatum in Database.get_tracks_from_index_file(config.AUDIO_INDEX_LOCATION):
+            for generation, change in changes:
+                for track_id, track in change['entries'].items():
+                    deleted = self._conn.execute('delete from audio_tracks where track_id = ?',
+                                                 (track_id,)).rowcount
+                    if track.get('removed'):
+                        report.removed += deleted
+                    else:
+                        self._conn.execute(INSERT_TRACK, index_entry_to_row(track))
+                        if deleted:
+                            report.updated += 1
+                        else:
+                            report.added += 1
+                report.generation = generation
+            self._write_generation(report.generation)
+        return report
+
+    def create_indexes(self):
+        """
+        create_indexes : create the indexes used for ordering and looking up tracks
+        sqlite keeps the rowid in every index entry, so audio_tracks_order also
+        serves (artist, album, track_number, rowid) ordering without a sort
+        """
+        try:
+            with self._conn:
                 self._conn.execute("""
-                insert into audio_tracks (
-                    artist,
-                    album,
-                    track_title,
-                    track_number,
-                    file_path,
-                    artist_id,
-                    release_id,
-                    track_id,
-                    file_format)
-                 values (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (metadatum.artist,
-                      metadatum.album,
-                      metadatum.track_title,
-                      metadatum.track_number,
-                      metadatum.file_path,
-                      metadatum.artist_id,
-                      metadatum.release_id,
-                      metadatum.recording_id,
-                      metadatum.file_format))
+                create index if not exists audio_tracks_order
+                    on audio_tracks (artist, album, track_number)
+                """)
+                # one index per get_tracks_page filter, each ending in the display order
+                for column in ('artist_id', 'release_id', 'file_format'):
+                    self._conn.execute("""
+                    create index if not exists audio_tracks_by_{0}
+                        on audio_tracks ({0}, artist, album, track_number)
+                    """.format(column))
+                self._conn.execute("""
+                create index if not exists audio_tracks_by_fingerprint
+                    on audio_tracks (fingerprint) where fingerprint is not null
+                """)
+        except sqlite3.OperationalError:
+            # no audio_tracks table yet
+            return
+        self.create_search_index()
+
+    def create_search_index(self):
+        """
+        create_search_index : create the full-text index over artist, album and track title
+
+        audio_tracks_fts is an external-content fts5 table, so it only stores the
+        index itself. it's filled in one pass from audio_tracks, then triggers keep
+        it in sync with every insert, update and delete
+        """
+        exists = self._conn.execute("""
+        select 1 from sqlite_master where type = 'table' and name = 'audio_tracks_fts'
+        """).fetchone()
+        if exists:
+            return
+        with self._conn:
+            self._conn.execute("""
+            create virtual table audio_tracks_fts using fts5
+                (artist,
+                 album,
+                 track_title,
+                 content = 'audio_tracks',
+                 content_rowid = 'rowid',
+                 tokenize = 'unicode61 remove_diacritics 2',
+                 prefix = '2 3')
+            """)
+            self._conn.execute("""
+            insert into audio_tracks_fts (audio_tracks_fts) values ('rebuild')
+            """)
+            self._conn.execute("""
+            create trigger audio_tracks_fts_insert after insert on audio_tracks begin
+                insert into audio_tracks_fts (rowid, artist, album, track_title)
+                values (new.rowid, new.artist, new.album, new.track_title);
+            end
+            """)
+            self._conn.execute("""
+            create trigger audio_tracks_fts_delete after delete on audio_tracks begin
+                insert into audio_tracks_fts (audio_tracks_fts, rowid, artist, album, track_title)
+                values ('delete', old.rowid, old.artist, old.album, old.track_title);
+            end
+            """)
+            self._conn.execute("""
+            create trigger audio_tracks_fts_update after update on audio_tracks begin
+                insert into audio_tracks_fts (audio_tracks_fts, rowid, artist, album, track_title)
+                values ('delete', old.rowid, old.artist, old.album, old.track_title);
+                insert into audio_tracks_fts (rowid, artist, album, track_title)
+                values (new.rowid, new.artist, new.album, new.track_title);
+            end
+            """)
+
+    def search(self, query: str, limit: int = None) -> List[TrackRow]:
+        """
+        search : return up to limit tracks whose artist, album or title match query, best first
+        every word in query has to match the start of a word in the track (so "beat ab"
+        finds "The Beatles - Abbey Road"). case and diacritics are ignored
+
+        the matches are ranked and cut to limit inside the fts query, so only limit
+        rows are joined back to audio_tracks
+        """
+        words = re.findall(r'\w+', query)
+        if not words:
+            return []
+        match = ' '.join('"{}"*'.format(word) for word in words)
+        columns = ', '.join('audio_tracks.{}'.format(column.strip())
+                            for column in TRACK_ROW_COLUMNS.split(','))
+        try:
+            rows = self._conn.execute("""
+            select {} from
+                (select rowid, rank from audio_tracks_fts
+                 where audio_tracks_fts match ?
+                 order by rank
+                 limit ?) as matches
+            join audio_tracks on audio_tracks.rowid = matches.rowid
+            order by matches.rank
+            """.format(columns), (match, limit or config.SEARCH_LIMIT))
+            return [TrackRow.from_db_row(row) for row in rows]
+        except sqlite3.OperationalError:
+            return []
 
     def generate_all_track_info(self):
         """
@@ -108,8 +428,161 @@ class Database(object):
             metadatum.release_id = i[6]
             metadatum.recording_id = i[7]
             metadatum.file_format = i[8]
+            metadatum.audio_key = i[10]
             yield metadatum
 
+    def get_tracks_page(self, after: tuple = None, page_size: int = None,
+                        artist_id=None, release_id=None, file_format=None) -> List[TrackRow]:
+        """
+        get_tracks_page : return up to page_size tracks in (artist, album, track_number) order
+        arguments:
+            after : the key of the last row of the previous page, or None for the first page
+            page_size : maximum number of rows to return (default: config.DB_PAGE_SIZE)
+            artist_id, release_id, file_format : optional filters
+
+        pages are fetched by key rather than offset, so every page costs the same
+        no matter how deep into the library it is
+        """
+        conditions, params = _track_conditions(artist_id, release_id, file_format)
+        if after is not None:
+            conditions.append('(artist, album, track_number, rowid) > (?, ?, ?, ?)')
+            params.extend(after)
+        query = 'select {} from audio_tracks'.format(TRACK_ROW_COLUMNS)
+        if conditions:
+            query += ' where ' + ' and '.join(conditions)
+        query += ' order by artist, album, track_number, rowid limit ?'
+        params.append(page_size or config.DB_PAGE_SIZE)
+        try:
+            return [TrackRow.from_db_row(row) for row in self._conn.execute(query, params)]
+        except sqlite3.OperationalError:
+            return []
+
+    def count_tracks(self, before: tuple = None,
+                     artist_id=None, release_id=None, file_format=None) -> int:
+        """
+        count_tracks : the number of tracks matching the filters
+        if before is a track key, only tracks ahead of it in display order are
+        counted, which is that track's position in the list
+        """
+        conditions, params = _track_conditions(artist_id, release_id, file_format)
+        if before is not None:
+            conditions.append('(artist, album, track_number, rowid) < (?, ?, ?, ?)')
+            params.extend(before)
+        query = 'select count(*) from audio_tracks'
+        if conditions:
+            query += ' where ' + ' and '.join(conditions)
+        try:
+            return self._conn.execute(query, params).fetchone()[0]
+        except sqlite3.OperationalError:
+            return 0
+
+    def get_track(self, recording_id: str) -> TrackRow:
+        """
+        get_track : the track with this recording id, or None
+        """
+        try:
+            row = self._conn.execute(
+                'select {} from audio_tracks where track_id = ?'.format(TRACK_ROW_COLUMNS),
+                (recording_id,)).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return TrackRow.from_db_row(row) if row else None
+
+    def get_tracks_by_fingerprint(self, fingerprint: str) -> List[TrackRow]:
+        """
+        get_tracks_by_fingerprint : the tracks whose audio has this fingerprint
+        (see mid.audio_fingerprint)
+        """
+        try:
+            return [TrackRow.from_db_row(row) for row in self._conn.execute(
+                'select {} from audio_tracks where fingerprint = ?'.format(TRACK_ROW_COLUMNS),
+                (fingerprint,))]
+        except sqlite3.OperationalError:
+            return []
+
+    def get_duplicates(self) -> List[Tuple[str, List[TrackRow]]]:
+        """
+        get_duplicates : (fingerprint, tracks) for every fingerprint shared by more than
+        one track stored under its own ids, i.e. the same audio stored more than once.
+        tracks linked to another's audio (see monty.dedup) aren't stored, so aren't counted
+        """
+        duplicates = []
+        query = """
+        select fingerprint, {} from audio_tracks
+        where audio_key is null
+          and fingerprint in (select fingerprint from audio_tracks
+                              where fingerprint is not null and audio_key is null
+                              group by fingerprint having count(*) > 1)
+        order by fingerprint, artist, album, track_number
+        """.format(TRACK_ROW_COLUMNS)
+        try:
+            rows = self._conn.execute(query).fetchall()
+        except sqlite3.OperationalError:
+            return []
+        for row in rows:
+            if not duplicates or duplicates[-1][0] != row[0]:
+                duplicates.append((row[0], []))
+            duplicates[-1][1].append(TrackRow.from_db_row(row[1:]))
+        return duplicates
+
+    def get_tracks_without_fingerprint(self) -> List[TrackRow]:
+        """
+        get_tracks_without_fingerprint : tracks indexed before fingerprints were
+        """
+        try:
+            return [TrackRow.from_db_row(row) for row in self._conn.execute(
+                'select {} from audio_tracks where fingerprint is null'.format(
+                    TRACK_ROW_COLUMNS))]
+        except sqlite3.OperationalError:
+            return []
+
+    def set_fingerprints(self, fingerprints: Dict[str, str]):
+        """
+        set_fingerprints : record the fingerprint of each track (recording id -> fingerprint)
+        """
+        with self._conn:
+            self._conn.executemany('update audio_tracks set fingerprint = ? where track_id = ?',
+                                   [(fingerprint, recording_id)
+                                    for recording_id, fingerprint in fingerprints.items()])
+
+    def get_track_key_at(self, position: int,
+                         artist_id=None, release_id=None, file_format=None) -> tuple:
+        """
+        get_track_key_at : the key of the track at position in display order, or None
+        this walks the ordering index without touching the table, so it's the cheap way
+        to find where a page starts when jumping deep into the library
+        """
+        conditions, params = _track_conditions(artist_id, release_id, file_format)
+        query = 'select artist, album, track_number, rowid from audio_tracks'
+        if conditions:
+            query += ' where ' + ' and '.join(conditions)
+        query += ' order by artist, album, track_number, rowid limit 1 offset ?'
+        params.append(position)
+        try:
+            return self._conn.execute(query, params).fetchone()
+        except sqlite3.OperationalError:
+            return None
+
+    def iter_track_pages(self, page_size: int = None, after: tuple = None,
+                         **filters) -> Iterator[List[TrackRow]]:
+        """
+        iter_track_pages : lazily yield pages of tracks until there are none left,
+        starting after the track whose key is after (default: from the first track)
+        takes the same filters as get_tracks_page
+        """
+        page = self.get_tracks_page(after, page_size, **filters)
+        while page:
+            yield page
+            page = self.get_tracks_page(after=page[-1].key, page_size=page_size, **filters)
+
+    def iter_tracks(self, page_size: int = None, **filters) -> Iterator[TrackRow]:
+        """
+        iter_tracks : lazily yield every track, one page at a time
+        takes the same filters as get_tracks_page
+        """
+        for page in self.iter_track_pages(page_size, **filters):
+            yield from page
+
     @staticmethod
     def get_tracks_from_media_dir(input_dir):
         """
@@ -125,6 +598,28 @@ class Database(object):
                 except FormatNotImplemented:
                     continue
 
+    @staticmethod
+    def get_entries_from_index_file(index: str) -> Iterator[dict]:
+        """
+        get_entries_from_index_file : yield each track entry in the index file.
+        the file is parsed incrementally, so only one entry is in memory at a time.
+        an empty index file (what NoopStorage leaves behind) has no entries
+        """
+        if os.path.getsize(index) == 0:
+            return
+        with open(index) as index_file:
+            for _, track in jsonstream.iter_object_items(index_file):
+                yield track
+
+    @staticmethod
+    def get_rows_from_index_file(index: str) -> Iterator[tuple]:
+        """
+        get_rows_from_index_file : yield audio_tracks rows straight from the index file,
+        without building a Metadata object for each one
+        """
+        for track in Database.get_entries_from_index_file(index):
+            yield index_entry_to_row(track)
+
     @staticmethod
     def get_tracks_from_index_file(index: str) -> List[Metadata]:
         """
@@ -144,6 +639,7 @@ class Database(object):
             metadatum.artist_id = track['artist_id']
             metadatum.release_id = track['release_id']
             metadatum.recording_id = track['track_id']
+            metadatum.audio_key = track.get('audio_key')
             try:
                 metadatum.file_format = track['format']
             except KeyError:
@@ -153,5 +649,91 @@ class Database(object):
         return metadata
 
 
+def build_catalog_snapshot(entries: Iterable[dict], path: str, generation: int = None):
+    """
+    build_catalog_snapshot : build a ready-to-open db from index entries and gzip it to path
+
+    the snapshot has the same tables and indexes a Database builds for itself, so
+    clients can download it, decompress it and open it, rather than parsing json.
+    generation defaults to the newest sequence among the entries
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        db_location = os.path.join(workdir, 'catalog.db')
+        # an empty db file means Database() just connects, leaving init_db to us
+        sqlite3.connect(db_location).close()
+        db = Database(db_location)
+        db.init_db(entries=entries)
+        if generation is not None:
+            db.set_generation(generation)
+        # a self-contained file: no wal, no free pages
+        db._conn.execute('pragma journal_mode = delete')
+        db._conn.execute('vacuum')
+        db.close()
+        with open(db_location, 'rb') as snapshot, gzip.open(path, 'wb') as out:
+            shutil.copyfileobj(snapshot, out)
+
+
+class SyncReport(object):
+    """
+    SyncReport : what Database.sync changed
+    """
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.added = 0
+        self.updated = 0
+        self.removed = 0
+        self.bytes_transferred = 0
+
+    def summary(self) -> str:
+        """
+        summary : human-readable sync results
+        """
+        return 'Synced to generation {}: {} added, {} updated, {} removed, {} bytes'.format(
+            self.generation, self.added, self.updated, self.removed, self.bytes_transferred)
+
+
+class SyncError(Exception):
+    """
+    SyncError : the db can't be brought up to date with the remote index
+    """
+    pass
+
+
+def _track_conditions(artist_id, release_id, file_format) -> tuple:
+    """
+    _track_conditions : where clauses and parameters for the track list filters
+    """
+    conditions = []
+    params = []
+    for column, value in (('artist_id', artist_id),
+                          ('release_id', release_id),
+                          ('file_format', file_format)):
+        if value is not None:
+            conditions.append('{} = ?'.format(column))
+            params.append(value)
+    return conditions, params
+
+def index_entry_to_row(track: dict) -> tuple:
+    """
+    index_entry_to_row : turn an audio index entry into an audio_tracks row
+    """
+    file_format = track.get('file_format') or track.get('format')
+    if file_format is None:
+        _, ext = os.path.splitext(track['path'])
+        file_format = ext.replace('.', '')
+    return (track['artist'],
+            track['album'],
+            track['track_name'],
+            track['position'],
+            track['path'],
+            track['artist_id'],
+            track['release_id'],
+            track['track_id'],
+            file_format,
+            track.get('fingerprint'),
+            track.get('audio_key'))
+
+
 if __name__ == '__main__':
     db = Database()
@@ -0,0 +1,153 @@
+"""
+dedup.py : spot audio that's already in the library, however it's tagged
+
+files are compared by audio fingerprint (see mid.audio_fingerprint), which leaves
+the tags out, so a re-tagged copy of a song matches the original. during an ingest,
+link_duplicates points each duplicate at the object that already holds its audio
+(its audio_key, see monty.metadata), found in this run, in the ingest manifest, or
+in the local db, so it isn't uploaded or copied again. a duplicate keeps its own
+ids, tags and library entry; only the stored audio is shared
+
+library_duplicates reports the audio stored more than once across the whole db
+"""
+
+import os
+from typing import Dict, List, Tuple
+
+from monty import metrics
+from monty.db import Database
+from monty.manifest import IngestManifest
+from monty.metadata import Metadata, TrackRow
+from monty.util import mid
+
+
+def link_duplicates(tracks: List[Metadata], fingerprints: Dict[str, str],
+                    manifest: IngestManifest,
+                    db: Database = None) -> Tuple[List[Metadata], 'LinkReport']:
+    """
+    link_duplicates : split tracks into (tracks to upload and copy, LinkReport).
+    duplicates of another recording's audio get its audio_key. fingerprints is keyed
+    by file path
+    """
+    report = LinkReport()
+    # seen : key is a fingerprint, value is the audio key of the track in this run that has it
+    seen = {}
+    unique = []
+    for track in tracks:
+        fingerprint = fingerprints.get(track.file_path)
+        if fingerprint is None:
+            unique.append(track)
+            continue
+        own_key = track.get_audio_key()
+        # a recording that was ingested before (re-tagged, or with --full) finds its own
+        # audio, which isn't a duplicate of it
+        existing = seen.get(fingerprint) or find_recording(fingerprint, manifest, db,
+                                                           exclude=own_key)
+        if existing is None:
+            seen[fingerprint] = own_key
+            unique.append(track)
+            continue
+        # two files of the same recording in this run are stored under its own key once
+        if existing != own_key:
+            track.audio_key = existing
+        report.add(track, os.path.getsize(track.file_path), relinked=existing != own_key)
+    metrics.get().count('dedup_linked', len(report.linked))
+    metrics.get().count('dedup_bytes_saved', report.bytes_saved)
+    return unique, report
+
+
+def find_recording(fingerprint: str, manifest: IngestManifest,
+                   db: Database = None, exclude: str = None) -> str:
+    """
+    find_recording : audio key of the stored audio of an ingested recording with this
+    fingerprint, or None. audio stored under the key exclude doesn't count
+    """
+    existing = manifest.find_fingerprint(fingerprint, exclude)
+    if existing is None and db is not None:
+        existing = next((track.get_audio_key() for track
+                         in db.get_tracks_by_fingerprint(fingerprint)
+                         if track.get_audio_key() != exclude), None)
+    return existing
+
+
+class LinkReport(object):
+    """
+    LinkReport : the duplicates link_duplicates found
+
+    Attributes:
+        - linked : the duplicate tracks (with their audio_key set, if it's another's)
+        - relinked : how many of them share a different recording's audio
+        - bytes_saved : bytes that weren't uploaded (or copied) again
+    """
+
+    def __init__(self):
+        self.linked = []
+        self.relinked = 0
+        self.bytes_saved = 0
+
+    def add(self, track: Metadata, size: int, relinked: bool):
+        """
+        add : record a duplicate
+        """
+        self.linked.append(track)
+        self.relinked += relinked
+        self.bytes_saved += size
+
+    def summary(self) -> str:
+        """
+        summary : one line describing the duplicates
+        """
+        return ('Linked {} duplicates to audio already in the library '
+                '({} shared with a different recording), saving {:.1f} MB of uploads and copies').format(
+                    len(self.linked), self.relinked, self.bytes_saved / 1024 / 1024)
+
+
+def library_duplicates(db: Database, hash_cache: mid.HashCache = None) -> 'DuplicateReport':
+    """
+    library_duplicates : find the audio stored more than once in the library. tracks
+    indexed before fingerprints were are fingerprinted from MEDIA_DIR first, where
+    they've been downloaded, and the fingerprints saved in the db
+    """
+    fingerprints = {}
+    for track in db.get_tracks_without_fingerprint():
+        local_path = track.get_local_path()
+        if os.path.isfile(local_path):
+            fingerprints[track.recording_id] = mid.audio_fingerprint(local_path, hash_cache)
+    if fingerprints:
+        db.set_fingerprints(fingerprints)
+    return DuplicateReport(db.get_duplicates(), len(fingerprints))
+
+
+class DuplicateReport(object):
+    """
+    DuplicateReport : (fingerprint, tracks) for each piece of audio stored more than once
+
+    Attributes:
+        - groups : (fingerprint, tracks sharing it) pairs
+        - fingerprinted : tracks that were fingerprinted from MEDIA_DIR for the report
+        - wasted_bytes : size of every copy but one, for copies in MEDIA_DIR
+    """
+
+    def __init__(self, groups: List[Tuple[str, List[TrackRow]]], fingerprinted: int = 0):
+        self.groups = groups
+        self.fingerprinted = fingerprinted
+        self.wasted_bytes = 0
+        for _, tracks in groups:
+            sizes = [os.path.getsize(track.get_local_path()) for track in tracks
+                     if os.path.isfile(track.get_local_path())]
+            self.wasted_bytes += sum(sizes) - max(sizes, default=0)
+
+    def describe(self) -> str:
+        """
+        describe : every group of duplicates, then a summary line
+        """
+        lines = []
+        for fingerprint, tracks in self.groups:
+            lines.append(fingerprint)
+            lines.extend('    {} ({})'.format(track.get_display_string(), track.recording_id)
+                         for track in tracks)
+        lines.append('{} pieces of audio stored more than once ({} extra copies), '
+                     '{:.1f} MB wasted locally; fingerprinted {} tracks'.format(
+                         len(self.groups), sum(len(tracks) - 1 for _, tracks in self.groups),
+                         self.wasted_bytes / 1024 / 1024, self.fingerprinted))
+        return '\n'.join(lines)
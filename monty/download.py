@@ -0,0 +1,179 @@
+"""
+download.py : download every track of an artist or a release, for listening offline
+
+    bulk = BulkDownload(db, storage, release_id=release_id, on_progress=print)
+    report = await bulk.run()
+
+the tracks are looked up in the db when the BulkDownload is made, and ones already
+in config.MEDIA_DIR (or on their way there) are skipped. the rest are downloaded
+by `workers` coroutines at a time. every bulk download shares the storage's
+bulk_slots, which keep some of the storage's threads free for the player.
+cancel() stops new downloads from starting; the ones in flight are finished, since
+a download on the storage's threads can't be interrupted (and a finished one is
+never half-written, see CloudStorage.get_recording)
+"""
+
+import asyncio
+import collections
+import os
+import time
+from typing import Callable, List
+
+import monty.config as config
+from monty import progressive
+from monty.cache import MediaCache
+from monty.db import Database
+from monty.metadata import TrackRow
+
+
+class BulkDownload(object):
+    """
+    BulkDownload : download the tracks of an artist (artist_id) or release (release_id)
+
+    Attributes:
+        - tracks : every track of the artist or release
+        - missing : the tracks that weren't on disk yet, which run() downloads. only
+          one of the tracks that share a local path (see monty.dedup) is included
+        - downloaded, failed, cancelled : tracks done so far, by outcome
+        - bytes_downloaded : bytes of audio downloaded so far
+        - on_progress : called with the BulkDownload after each track, on the
+          event loop's thread
+    """
+
+    def __init__(self, db: Database, storage, artist_id: str = None, release_id: str = None,
+                 workers: int = None, on_progress: Callable = None,
+                 media_cache: MediaCache = None):
+        if artist_id is None and release_id is None:
+            raise ValueError('BulkDownload needs an artist_id or a release_id')
+        self.storage = storage
+        self.workers = workers or config.BULK_DOWNLOAD_WORKERS
+        self.on_progress = on_progress
+        self.media_cache = media_cache
+        self.tracks = list(db.iter_tracks(artist_id=artist_id, release_id=release_id))
+        self.missing = []
+        # linked duplicates share one file, which only needs downloading once
+        local_paths = set()
+        for track in self.tracks:
+            local_path = track.get_local_path()
+            if local_path not in local_paths and not is_local(track):
+                self.missing.append(track)
+            local_paths.add(local_path)
+        self.downloaded = 0
+        self.failed = []
+        self.cancelled = 0
+        self.bytes_downloaded = 0
+        self._cancel = False
+        self._started = None
+
+    @property
+    def skipped(self) -> int:
+        """ skipped : tracks that were already on disk, or share another track's file """
+        return len(self.tracks) - len(self.missing)
+
+    @property
+    def finished(self) -> int:
+        """ finished : tracks that have been dealt with, one way or another """
+        return self.skipped + self.downloaded + len(self.failed) + self.cancelled
+
+    async def run(self) -> 'BulkDownloadReport':
+        """
+        run : download the missing tracks. failures are recorded rather than raised
+        """
+        self._started = time.perf_counter()
+        pending = collections.deque(self.missing)
+        workers = [asyncio.ensure_future(self._work(pending))
+                   for _ in range(min(self.workers, len(pending)))]
+        try:
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            for worker in workers:
+                worker.cancel()
+            raise
+        return self.report()
+
+    def cancel(self):
+        """
+        cancel : don't start any more downloads. safe to call from any thread
+        """
+        self._cancel = True
+
+    async def _work(self, pending: collections.deque):
+        while pending:
+            track = pending.popleft()
+            if not self._cancel:
+                async with self.storage.bulk_slots():
+                    # cancel may have been called while we waited for a slot
+                    if not self._cancel:
+                        await self._download(track)
+                        continue
+            self.cancelled += 1
+            self._progress()
+
+    async def _download(self, track: TrackRow):
+        try:
+            await self.storage.get_recording(*track.audio_ids)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error: # pylint: disable=broad-except
+            self.failed.append((track, error))
+        else:
+            local_path = track.get_local_path()
+            self.downloaded += 1
+            self.bytes_downloaded += os.path.getsize(local_path)
+            if self.media_cache is not None:
+                # asked for by the user, so kept regardless of the cache quota
+                self.media_cache.record_download(local_path, pinned=True)
+        self._progress()
+
+    def _progress(self):
+        if self.on_progress is not None:
+            self.on_progress(self)
+
+    def describe(self) -> str:
+        """
+        describe : progress so far, as a line of text
+        """
+        return '{}/{} tracks, {:.1f} MB'.format(self.finished, len(self.tracks),
+                                                self.bytes_downloaded / 1024 / 1024)
+
+    def report(self) -> 'BulkDownloadReport':
+        """
+        report : what happened to each track so far
+        """
+        seconds = time.perf_counter() - self._started if self._started else 0.0
+        return BulkDownloadReport(len(self.tracks), self.downloaded, self.skipped,
+                                  self.failed, self.cancelled, self.bytes_downloaded, seconds)
+
+
+class BulkDownloadReport(object):
+    """
+    BulkDownloadReport : the outcome of a BulkDownload
+    """
+
+    def __init__(self, total: int, downloaded: int, skipped: int,
+                 failed: List[tuple], cancelled: int, bytes_downloaded: int, seconds: float):
+        self.total = total
+        self.downloaded = downloaded
+        self.skipped = skipped
+        # failed : (track, exception) for each track that couldn't be downloaded
+        self.failed = failed
+        self.cancelled = cancelled
+        self.bytes_downloaded = bytes_downloaded
+        self.seconds = seconds
+
+    def summary(self) -> str:
+        """
+        summary : one line describing the download
+        """
+        return ('Downloaded {} of {} tracks ({:.1f} MB) in {:.1f}s: {} already here, '
+                '{} failed, {} cancelled').format(
+                    self.downloaded, self.total, self.bytes_downloaded / 1024 / 1024,
+                    self.seconds, self.skipped, len(self.failed), self.cancelled)
+
+
+def is_local(track: TrackRow) -> bool:
+    """
+    is_local : whether a track is on disk, or being streamed there
+    """
+    local_path = track.get_local_path()
+    return os.path.isfile(local_path) or progressive.active(local_path) is not None
@@ -3,44 +3,76 @@ index.py : functions to get musicbrainz data for files and then do something wit
 
 recursively walk the input directory
 get artist/album/song using mutagen
-look up artist/album/song using musicbrainz
+look up artist/album/song using musicbrainz (through monty.musicbrainz's cache)
 """
 
 import os
-from typing import Callable, List
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterator, List
 
 import musicbrainzngs as mb
 from mutagen import mp3, flac
 
+from monty import config, metrics
 from monty.metadata import Metadata, FORMAT_PARSERS
+from monty.musicbrainz import MusicBrainzClient, NotFound
 from monty.util import mid
 
 
 mb.set_useragent("application", "0.01", "http://example.com")
 
-def generate_local_index(directory: str) -> List[Metadata]:
+def generate_local_index(directory: str, workers: int = None) -> List[Metadata]:
     """
     generate_local_index : generate an index (list of dicts) of music data
     arguments:
     - directory : full path to root of media for which we want to generate index
+    - workers : number of processes used to read tags (default: config.SCAN_WORKERS)
 
     returns list of dict with musicbrainz ids and names and file format
     """
-    metadata = get_metadata_for_directory(directory)
-    get_track_data = get_musicbrainz_data()
-    enriched_metadata = [get_track_data(i) for i in metadata]
+    return generate_index_for_files(list(find_audio_files(directory)), workers)
+
+def generate_index_for_files(paths: List[str],
+                             workers: int = None,
+                             hash_cache: mid.HashCache = None,
+                             client: MusicBrainzClient = None) -> List[Metadata]:
+    """
+    generate_index_for_files : like generate_local_index, but for an explicit list of files
+    arguments:
+    - paths : full paths to the audio files to index
+    - workers : number of processes used to read tags (default: config.SCAN_WORKERS)
+    - hash_cache : optional cache of file hashes, used when making ids for unknown tracks
+    - client : MusicBrainzClient to look tracks up with (default: one with the on-disk cache)
+    """
+    metadata = get_metadata_for_files(paths, workers)
+    client = client or MusicBrainzClient()
+    get_track_data = get_musicbrainz_data(hash_cache, client)
+    # lookups mostly wait on the client's rate limit, so a few threads are enough to
+    # let tracks from the same album share (or coalesce) their lookups
+    with metrics.get().span('musicbrainz', items=len(metadata)), \
+            ThreadPoolExecutor(max_workers=config.MUSICBRAINZ_WORKERS) as pool:
+        enriched_metadata = list(pool.map(get_track_data, metadata))
+    print(client.summary())
     return enriched_metadata
 
-def get_musicbrainz_data() -> Callable[[dict], dict]:
+def get_musicbrainz_data(hash_cache: mid.HashCache = None,
+                         client: MusicBrainzClient = None) -> Callable[[Metadata], Metadata]:
     """
     get_musicbrainz_data : memoization closure for musicbrainz data
     reduce calls to the musicbrainz api by saving track lists
+    hash_cache is passed along to mid.create_uuid_from_file for tracks without musicbrainz ids
+    every musicbrainz request goes through client, which caches and rate-limits them
 
     returns a closure, get_mb_data_for_track
     """
+    client = client or MusicBrainzClient()
 
     # releases_with_tracks : key is release ID, value is a track list sorted by track number
+    # the closure runs on several threads at once, so the dict is only touched under the lock
     releases_with_tracks = {}
+    releases_lock = threading.Lock()
 
     def get_mb_data_for_track(metadata: Metadata) -> Metadata:
         """
@@ -48,75 +80,145 @@ def get_musicbrainz_data() -> Callable[[dict], dict]:
         arguments:
             metadata : Metadata object containing artist, album, and track names
         returns:
-            musicbrainz ids for artist, album, and track names
+            metadata, with musicbrainz ids for artist, album, and track set
         """
         # get artist and album id by searching for release groups with both artist and album name?
         # search for recording: filter results based on release and artist
 
         ids = {}
         # get artist id, or make one if it's not available
-        artists = mb.search_artists(metadata.artist)
-        artist = [i for i in artists['artist-list'] if i['ext:score'] == 100]
+        artists = client.search_artists(metadata.artist)
+        artist = [i for i in artists['artist-list'] if int(i.get('ext:score', 0)) == 100]
         if artist:
-            ids['artist'] = artist['id']
+            ids['artist'] = artist[0]['id']
         else:
             ids['artist'] = mid.create_uuid_from_string(metadata.artist)
             ids['album'] = mid.create_uuid_from_string(metadata.album)
-            ids['track'] = mid.create_uuid_from_file(metadata.file_path)
+            ids['track'] = mid.create_uuid_from_file(metadata.file_path, hash_cache)
 
         if 'album' not in ids:
             search_string = '{} {}'.format(metadata.artist, metadata.album)
             try:
-                release_group = mb.search_release_groups(search_string)
-            except mb.musicbrainz.ResponseError:
-                search_string = metadata['album']
-                release_group = mb.search_release_groups(search_string)
+                release_group = client.search_release_groups(search_string)
+            except mb.ResponseError:
+                search_string = metadata.album
+                release_group = client.search_release_groups(search_string)
 
             releases = [
                 i for i in release_group['release-group-list']
-                if (i['ext:score'] == 100 and
-                    i['artist-credit'][0]['artist']['id'] == ids['artist'])
+                if (int(i.get('ext:score', 0)) == 100 and
+                    i['artist-credit'][0]['artist']['id'] == ids['artist'] and
+                    i.get('release-list'))
             ]
             if releases:
-                ids['album'] = release_group['release-group-list'][0]['release-list'][0]
+                ids['album'] = releases[0]['release-list'][0]['id']
             else:
-                ids['album'] = mid.create_uuid_from_string(metadata['album'])
-                ids['track'] = mid.create_uuid_from_file(metadata.file_path)
+                ids['album'] = mid.create_uuid_from_string(metadata.album)
+                ids['track'] = mid.create_uuid_from_file(metadata.file_path, hash_cache)
 
         # check to see if we already have track/album information for this album
-        if 'album_id' in releases_with_tracks:
-            ids['track'] = releases_with_tracks[ids['album']][metadata.track_number - 1]['recording']['id']
-        elif 'track' not in ids:
-            release_with_tracks = mb.get_release_by_id(ids['album'], includes=['recordings'])
-            tracks = release_with_tracks['release']['medium-list'][0]['track-list']
-            tracks.sort(key=lambda x: int(x['position']))
-            releases_with_tracks[release['id']] = tracks
-            track = tracks[metadata.track_number - 1]
-
-        metadata.artist_id = artist['id']
-        metadata.release_id = release['id']
-        metadata.track_id = track['recording']['id']
+        if 'track' not in ids:
+            with releases_lock:
+                tracks = releases_with_tracks.get(ids['album'])
+            if tracks is None:
+                try:
+                    release_with_tracks = client.get_release_by_id(ids['album'],
+                                                                   includes=['recordings'])
+                    # sorted into a new list: the response is shared with other callers
+                    # (coalesced lookups, the cache), so it mustn't be changed in place
+                    tracks = sorted(release_with_tracks['release']['medium-list'][0]['track-list'],
+                                    key=lambda x: int(x['position']))
+                except NotFound:
+                    tracks = []
+                with releases_lock:
+                    tracks = releases_with_tracks.setdefault(ids['album'], tracks)
+            if 0 < metadata.track_number <= len(tracks):
+                ids['track'] = tracks[metadata.track_number - 1]['recording']['id']
+            else:
+                ids['track'] = mid.create_uuid_from_file(metadata.file_path, hash_cache)
+
+        metadata.artist_id = ids['artist']
+        metadata.release_id = ids['album']
+        metadata.recording_id = ids['track']
 
         return metadata
 
     return get_mb_data_for_track
 
-def get_metadata_for_directory(directory: str) -> List[dict]:
+def get_metadata_for_directory(directory: str, workers: int = None) -> List[Metadata]:
     """
     get_metadata_for_directory
     arguments:
         directory: full path to directory of audio files
+        workers: number of processes to parse tags with (default: config.SCAN_WORKERS)
+    returns:
+        list of Metadata objects (with paths!)
+    """
+    return get_metadata_for_files(list(find_audio_files(directory)), workers)
+
+def find_audio_files(directory: str) -> Iterator[str]:
+    """
+    find_audio_files : recursively walk a directory, yielding paths of supported audio files
+    """
+    for (dirpath, _, filenames) in os.walk(directory):
+        for filename in filenames:
+            if is_supported_file_format(filename):
+                yield os.path.join(dirpath, filename)
+
+def get_metadata_for_files(paths: List[str], workers: int = None) -> List[Metadata]:
+    """
+    get_metadata_for_files : read the tags of every file in paths
+    arguments:
+        paths: full paths to audio files
+        workers: number of processes to parse tags with. 1 parses serially in this process
     returns:
-        listof metadata dicts (with paths!)
-    """
-    metadata = []
-    for (dirpath, dirnames, filenames) in os.walk(directory):
-        for dirname in dirnames:
-            get_metadata_for_directory(dirname)
-        metadata += [Metadata(os.path.join(dirpath, filename))
-                     for filename in filenames if is_supported_file_format(filename)]
+        list of Metadata objects. files that fail to parse are reported and skipped
+    """
+    if workers is None:
+        workers = config.SCAN_WORKERS
+    start = time.time()
+    with metrics.get().span('scan', items=len(paths), workers=workers) as span:
+        if workers > 1 and len(paths) > 1:
+            chunksize = max(1, min(64, len(paths) // (workers * 4)))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                records = list(pool.map(read_tags, paths, chunksize=chunksize))
+        else:
+            records = [read_tags(path) for path in paths]
+
+        metadata = []
+        errors = 0
+        for record in records:
+            # the workers time their own parsing, since their metrics don't come back
+            metrics.get().observe('tag_parse_seconds', record.pop('seconds'))
+            if 'error' in record:
+                errors += 1
+                print('Skipping {}: {}'.format(record['file_path'], record['error']))
+                continue
+            metadata.append(Metadata.from_record(record))
+        metrics.get().count('scan_files', len(paths))
+        metrics.get().count('scan_errors', errors)
+        span.set(errors=errors)
+
+    elapsed = time.time() - start
+    print('Scanned {} files in {:.2f}s ({:.1f} files/sec, {} workers, {} errors)'.format(
+        len(paths), elapsed, len(paths) / elapsed if elapsed else 0, workers, errors))
     return metadata
 
+def read_tags(path: str) -> dict:
+    """
+    read_tags : parse the tags of a single file into a plain dict
+    this runs in worker processes, so it must only return picklable values.
+    any failure is returned as an 'error' entry rather than raised so that
+    one bad file doesn't take down the rest of the batch.
+    how long parsing took is returned as 'seconds'
+    """
+    start = time.perf_counter()
+    try:
+        record = Metadata(path).to_record()
+    except Exception as err: # pylint: disable=broad-except
+        record = {'file_path' : path, 'error' : repr(err)}
+    record['seconds'] = time.perf_counter() - start
+    return record
 
 def is_supported_file_format(filename):
     _, ext = os.path.splitext(filename)
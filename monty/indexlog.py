@@ -0,0 +1,142 @@
+"""
+indexlog.py : the remote audio index as a base plus a log of immutable segments
+
+    index/audio.json           base: every track as of the base generation
+    index/catalog.db.gz        the base as a ready-made sqlite db
+    index/base.json            {"generation": <base generation>}
+    index/changes/<gen>.json   one segment per ingest run after the base
+
+ingest only ever writes a new segment, so its cost depends on how many tracks it
+ingested rather than the size of the library. segments are created with a
+create-only precondition, so two concurrent ingests can't overwrite each other:
+the loser just takes the next generation. compact() periodically folds the
+segments into a new base. a segment is never left at or below the base's
+generation, where readers would skip it. readers load the base and then apply newer segments
+(see Database.sync)
+"""
+
+import json
+import os
+import tempfile
+from typing import Tuple
+
+import monty.config as config
+from monty.cloud import change_object_name, parse_generation
+from monty.db import build_catalog_snapshot
+from monty.util import jsonstream
+
+
+def get_base_generation(bucket) -> int:
+    """
+    get_base_generation : the generation the base index is up to date with
+    """
+    blob = bucket.get_blob(config.INDEX_BASE_OBJECT)
+    if blob is None:
+        return 0
+    return json.loads(blob.download_as_string())['generation']
+
+
+def list_segments(bucket, after_generation=0) -> list:
+    """
+    list_segments : (generation, blob) for each segment after after_generation, oldest first
+    """
+    segments = []
+    for blob in bucket.list_blobs(prefix=config.INDEX_CHANGES_PREFIX):
+        generation = parse_generation(blob.name)
+        if generation is not None and generation > after_generation:
+            segments.append((generation, blob))
+    return sorted(segments, key=lambda segment: segment[0])
+
+
+def next_generation(bucket) -> int:
+    """
+    next_generation : one past the newest generation in the base or the segments
+    """
+    newest = get_base_generation(bucket)
+    for generation, _ in list_segments(bucket, newest):
+        newest = max(newest, generation)
+    return newest + 1
+
+
+def publish_segment(bucket, entries: dict, conflict_errors: tuple, attempts=10) -> int:
+    """
+    publish_segment : write entries (track id -> index entry) as a new segment
+    returns the generation it was published as
+
+    conflict_errors are the exceptions the bucket raises when a create-only
+    upload finds the object already exists, i.e. another ingest took the generation
+    """
+    generation = next_generation(bucket)
+    for _ in range(attempts):
+        # a compaction since may have folded this generation into the base and pruned it
+        generation = max(generation, get_base_generation(bucket) + 1)
+        for entry in entries.values():
+            entry['sequence'] = generation
+        body = json.dumps({'generation' : generation, 'entries' : entries})
+        try:
+            bucket.blob(change_object_name(generation)).upload_from_string(
+                body, if_generation_match=0)
+        except conflict_errors:
+            generation += 1
+            continue
+        # if a compaction moved the base up to this generation while we uploaded, the
+        # segment may have missed it, and everyone would skip it from now on. publishing
+        # it again is harmless: its entries just replace themselves
+        if get_base_generation(bucket) < generation:
+            return generation
+        generation += 1
+    raise SegmentConflictException('gave up publishing a segment after {} attempts'.format(
+        attempts))
+
+
+def compact(bucket, prune=False) -> Tuple[int, int]:
+    """
+    compact : fold every segment into a new base (audio.json, catalog.db.gz and base.json)
+    returns (new base generation, number of segments folded in)
+
+    with prune=True, segments covered by the new base are deleted. clients that hadn't
+    synced that far rebuild from the new base the next time they sync.
+    only one compaction should run at a time
+    """
+    base_generation = get_base_generation(bucket)
+    index = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        base = bucket.get_blob(config.AUDIO_INDEX_OBJECT)
+        if base is not None:
+            base_path = os.path.join(workdir, 'audio.json')
+            base.download_to_filename(base_path)
+            with open(base_path) as base_file:
+                index.update(jsonstream.iter_object_items(base_file))
+
+        segments = list_segments(bucket, base_generation)
+        for generation, blob in segments:
+            for track_id, entry in json.loads(blob.download_as_string())['entries'].items():
+                if entry.get('removed'):
+                    index.pop(track_id, None)
+                else:
+                    index[track_id] = entry
+            base_generation = generation
+
+        index_path = os.path.join(workdir, 'audio.json')
+        with open(index_path, 'w') as index_file:
+            json.dump(index, index_file)
+        bucket.blob(config.AUDIO_INDEX_OBJECT).upload_from_filename(index_path)
+        snapshot_path = os.path.join(workdir, 'catalog.db.gz')
+        build_catalog_snapshot(index.values(), snapshot_path, base_generation)
+        bucket.blob(config.CATALOG_SNAPSHOT_OBJECT).upload_from_filename(snapshot_path)
+    # base.json goes last: until it's updated, readers still see the old base plus segments
+    bucket.blob(config.INDEX_BASE_OBJECT).upload_from_string(
+        json.dumps({'generation' : base_generation}))
+
+    if prune:
+        for _, blob in list_segments(bucket):
+            if parse_generation(blob.name) <= base_generation:
+                blob.delete()
+    return base_generation, len(segments)
+
+
+class SegmentConflictException(Exception):
+    """
+    SegmentConflictException : couldn't find a free generation to publish a segment as
+    """
+    pass
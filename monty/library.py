@@ -0,0 +1,137 @@
+"""
+library.py : read-only views of the track library for the gui
+
+a LibraryView looks like a list of every track in the db, but only keeps a few pages
+of rows in memory, fetching them from the db as they're asked for. SearchResults
+wraps the (bounded) results of a search in the same interface
+"""
+
+from collections import OrderedDict
+from typing import List
+
+import monty.config as config
+from monty.db import Database
+from monty.metadata import TrackRow
+
+
+class LibraryView(object):
+    """
+    LibraryView : the tracks in a Database, in display order, fetched a page at a time
+
+    pages are fetched by key (see Database.get_tracks_page). the key a page starts
+    after is remembered whenever its previous page is fetched, so scrolling only
+    ever costs a keyed page fetch; jumping somewhere new first looks the key up
+    with Database.get_track_key_at
+
+    Attributes:
+        - db : the Database to read from
+        - filters : artist_id/release_id/file_format filters, as for get_tracks_page
+    """
+
+    def __init__(self, db: Database, page_size: int = None, cached_pages: int = None,
+                 **filters):
+        self.db = db
+        self.filters = filters
+        self.page_size = page_size or config.DB_PAGE_SIZE
+        self.cached_pages = cached_pages or config.GUI_CACHED_PAGES
+        self._length = None
+        # _pages : key is a page number, value is its rows. least recently used first
+        self._pages = OrderedDict()
+        # _anchors : key is a page number, value is the key of the row before that page
+        self._anchors = {0: None}
+
+    def __len__(self):
+        if self._length is None:
+            self._length = self.db.count_tracks(**self.filters)
+        return self._length
+
+    def __getitem__(self, index: int) -> TrackRow:
+        if index < 0 or index >= len(self):
+            raise IndexError('track index {} out of range'.format(index))
+        number, offset = divmod(index, self.page_size)
+        return self._page(number)[offset]
+
+    def refresh(self):
+        """
+        refresh : forget everything fetched so far, e.g. after the db has been synced
+        """
+        self._length = None
+        self._pages.clear()
+        self._anchors = {0: None}
+
+    def rows(self, start: int, count: int) -> List[TrackRow]:
+        """
+        rows : up to count tracks starting at index start
+        """
+        start = max(0, start)
+        end = min(len(self), start + count)
+        rows = []
+        index = start
+        while index < end:
+            number, offset = divmod(index, self.page_size)
+            page = self._page(number)
+            if offset >= len(page):
+                # the db shrank under us
+                break
+            rows.extend(page[offset:offset + end - index])
+            index = (number + 1) * self.page_size
+        return rows
+
+    def position(self, index: int) -> int:
+        """
+        position : the position of the track at index in the whole library
+        """
+        return index
+
+    def _page(self, number: int) -> List[TrackRow]:
+        if number in self._pages:
+            self._pages.move_to_end(number)
+            return self._pages[number]
+        if number in self._anchors:
+            after = self._anchors[number]
+        else:
+            after = self.db.get_track_key_at(number * self.page_size - 1, **self.filters)
+        page = self.db.get_tracks_page(after, self.page_size, **self.filters)
+        if page:
+            self._anchors[number + 1] = page[-1].key
+        self._pages[number] = page
+        while len(self._pages) > self.cached_pages:
+            self._pages.popitem(last=False)
+        return page
+
+
+class SearchResults(object):
+    """
+    SearchResults : the tracks matching a search, with the same interface as LibraryView
+    """
+
+    def __init__(self, tracks: List[TrackRow], library: LibraryView):
+        self.tracks = tracks
+        self.library = library
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __getitem__(self, index: int) -> TrackRow:
+        return self.tracks[index]
+
+    def rows(self, start: int, count: int) -> List[TrackRow]:
+        """
+        rows : up to count tracks starting at index start
+        """
+        return self.tracks[max(0, start):start + count]
+
+    def position(self, index: int) -> int:
+        """
+        position : the position of the track at index in the whole library
+        """
+        return self.library.db.count_tracks(before=self.tracks[index].key,
+                                            **self.library.filters)
+
+    @staticmethod
+    def search(library: LibraryView, query: str, limit: int = None):
+        """
+        search : the tracks in library matching query, best matches first
+        """
+        return SearchResults(library.db.search(query, limit or config.GUI_SEARCH_LIMIT),
+                             library)
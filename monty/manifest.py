@@ -0,0 +1,138 @@
+"""
+manifest.py : remember which source files have already been ingested
+
+each ingested file is keyed by its absolute path and stored with the size, mtime
+and inode it had when it was ingested. if all three still match, the file hasn't
+changed and ingest.py can skip it
+
+the audio fingerprint (see mid.audio_fingerprint) of each file is kept too, along
+with the recording it was filed as and the key its audio is stored under, so later
+ingests can spot the same audio coming back under different tags
+"""
+
+import os
+import sqlite3
+from typing import Dict, List, Tuple
+
+import monty.config as config
+from monty.metadata import Metadata, make_audio_key
+
+
+class IngestManifest(object):
+    """
+    IngestManifest : sqlite-backed record of ingested source files
+
+    Attributes:
+        - location : location of the sqlite manifest file
+    """
+
+    def __init__(self, location=None):
+        self.location = location or config.MANIFEST_LOCATION
+        config.ensure_dir(self.location)
+        self._conn = sqlite3.connect(self.location)
+        with self._conn:
+            self._conn.execute("""
+            create table if not exists ingested_files
+                (path varchar primary key,
+                 size int,
+                 mtime_ns int,
+                 inode int,
+                 artist_id varchar,
+                 release_id varchar,
+                 recording_id varchar,
+                 file_format varchar,
+                 fingerprint varchar,
+                 audio_key varchar)
+            """)
+            # manifests from before fingerprints (and audio keys) were kept
+            columns = {row[1] for row in self._conn.execute('pragma table_info(ingested_files)')}
+            for column in ('file_format', 'fingerprint', 'audio_key'):
+                if column not in columns:
+                    self._conn.execute(
+                        'alter table ingested_files add column {} varchar'.format(column))
+            self._conn.execute("""
+            create index if not exists ingested_files_by_fingerprint
+                on ingested_files (fingerprint) where fingerprint is not null
+            """)
+
+    def is_unchanged(self, path: str) -> bool:
+        """
+        is_unchanged : check if path was ingested and hasn't been modified since
+        """
+        row = self._conn.execute(
+            'select size, mtime_ns, inode from ingested_files where path = ?',
+            (os.path.abspath(path),)).fetchone()
+        if row is None:
+            return False
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+        return row == (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+    def partition(self, paths: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        partition : split paths into (new or modified, unchanged)
+        """
+        changed, unchanged = [], []
+        for path in paths:
+            if self.is_unchanged(path):
+                unchanged.append(path)
+            else:
+                changed.append(path)
+        return changed, unchanged
+
+    def find_fingerprint(self, fingerprint: str, exclude: str = None) -> str:
+        """
+        find_fingerprint : the audio key (see metadata.make_audio_key) holding the audio
+        of an ingested file with this audio fingerprint, or None. files stored under
+        the audio key exclude (a recording's own, say) don't count
+        """
+        for row in self._conn.execute("""
+        select audio_key, artist_id, release_id, recording_id, file_format from ingested_files
+        where fingerprint = ? and file_format is not null
+        """, (fingerprint,)):
+            audio_key = row[0] or make_audio_key(*row[1:])
+            if audio_key != exclude:
+                return audio_key
+        return None
+
+    def record(self, tracks: List[Metadata], fingerprints: Dict[str, str] = None):
+        """
+        record : store the current stat info, musicbrainz ids, audio keys and (if given,
+        keyed by file path) audio fingerprints for ingested tracks
+        """
+        fingerprints = fingerprints or {}
+        rows = []
+        for track in tracks:
+            stat = os.stat(track.file_path)
+            rows.append((os.path.abspath(track.file_path),
+                         stat.st_size,
+                         stat.st_mtime_ns,
+                         stat.st_ino,
+                         track.artist_id,
+                         track.release_id,
+                         track.recording_id,
+                         track.file_format,
+                         fingerprints.get(track.file_path),
+                         track.audio_key))
+        with self._conn:
+            self._conn.executemany("""
+            insert or replace into ingested_files
+                (path, size, mtime_ns, inode, artist_id, release_id, recording_id,
+                 file_format, fingerprint, audio_key)
+            values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+
+    def clear(self):
+        """
+        clear : forget every ingested file, forcing the next ingest to process everything
+        """
+        with self._conn:
+            self._conn.execute('delete from ingested_files')
+
+    def close(self):
+        """
+        close : close the sqlite connection
+        """
+        self._conn.close()
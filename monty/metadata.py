@@ -1,8 +1,15 @@
 """
 metadata.py : get information about a file
+
+a track's audio is normally stored under its own ids, at
+{artist_id}/{release_id}/{recording_id}.{file_format} in the bucket and in MEDIA_DIR.
+a track whose audio duplicates another's (see monty.dedup) keeps its own ids, and
+its audio_key names the object that holds the audio instead
 """
 
 import os
+import sys
+from typing import NamedTuple
 from mutagen import mp3, flac
 import monty.config as config
 
@@ -14,9 +21,25 @@ FORMAT_PARSERS = {
 class Metadata(object):
     """
     Metadata : return information about a track
+
+    there's one of these per track in a TrackList, so it's kept small: no __dict__,
+    formats shared by the class, no reference to the parsed file, and artist and
+    album names interned so every track on an album shares the same strings
     """
 
+    __slots__ = ('_artist', '_album', 'track_title', 'track_number', 'file_path',
+                 'artist_id', 'release_id', 'recording_id', '_file_format', 'audio_key')
+
+    display_format = '{} - {} - {}'
+    basename_format = '{}.{}'
+
     def __init__(self, file_path=None):
+        self._artist = None
+        self._album = None
+        self.track_title = None
+        self.track_number = 0
+        self.file_path = None
+        self._file_format = None
         if file_path:
             self.file_path = file_path
             self.set_metadata_from_file()
@@ -25,9 +48,26 @@ class Metadata(object):
         self.artist_id = None
         self.release_id = None
         self.recording_id = None
+        # key of the stored audio, if it's another track's (see get_audio_key)
+        self.audio_key = None
+
+    @property
+    def artist(self):
+        """ artist : artist name """
+        return self._artist
+
+    @artist.setter
+    def artist(self, artist):
+        self._artist = _intern(artist)
+
+    @property
+    def album(self):
+        """ album : album name """
+        return self._album
 
-        self.display_format = '{} - {} - {}'
-        self.basename_format = '{}.{}'
+    @album.setter
+    def album(self, album):
+        self._album = _intern(album)
 
     def set_metadata_from_file(self):
         """
@@ -39,17 +79,45 @@ class Metadata(object):
             raise FormatNotImplemented('Extension {} not supported'.format(extension))
 
         parser = FORMAT_PARSERS[extension.replace('.', '').lower()]
-        self._metadata = parser(self.file_path)
-
-        self.artist = self._metadata['artist'][0]
-        self.album = self._metadata['album'][0]
-        self.track_title = self._metadata['title'][0]
-        if 'tracknumber' in self._metadata:
-            self.track_number = int(self._metadata['tracknumber'][0].split('/')[0])
+        # only the fields we need are kept, the parsed file itself is let go
+        tags = parser(self.file_path)
+
+        self.artist = tags['artist'][0]
+        self.album = tags['album'][0]
+        self.track_title = tags['title'][0]
+        if 'tracknumber' in tags:
+            self.track_number = int(tags['tracknumber'][0].split('/')[0])
         else:
             self.track_number = 0
         self.file_format = extension.replace('.', '')
 
+    def to_record(self) -> dict:
+        """
+        to_record : return the tag fields as a plain (picklable) dict
+        """
+        return {
+            'artist' : self.artist,
+            'album' : self.album,
+            'track_title' : self.track_title,
+            'track_number' : self.track_number,
+            'file_path' : self.file_path,
+            'file_format' : self.file_format,
+        }
+
+    @staticmethod
+    def from_record(record: dict):
+        """
+        from_record : build a Metadata object from a dict created by to_record
+        """
+        metadatum = Metadata()
+        metadatum.artist = record['artist']
+        metadatum.album = record['album']
+        metadatum.track_title = record['track_title']
+        metadatum.track_number = record['track_number']
+        metadatum.file_path = record['file_path']
+        metadatum.file_format = record['file_format']
+        return metadatum
+
     def set_format(self, file_format):
         """
         set_format : validate format before setting it
@@ -70,19 +138,115 @@ class Metadata(object):
         """
         return self.display_format.format(self.artist, self.album, self.track_title)
 
+    def get_audio_key(self):
+        """
+        get_audio_key : return the key of the object holding this track's audio
+        """
+        return self.audio_key or make_audio_key(self.artist_id, self.release_id,
+                                                self.recording_id, self.file_format)
+
+    @property
+    def audio_ids(self) -> tuple:
+        """ audio_ids : (artist_id, release_id, recording_id, file_format) of the stored audio """
+        return split_audio_key(self.get_audio_key())
+
     def get_local_path(self):
         """
-        get_local_path : return path to where this track should be on local disk
+        get_local_path : return path to where this track's audio should be on local disk
         """
-        basename = self.basename_format.format(self.recording_id, self.file_format)
-        return os.path.join(config.MEDIA_DIR, self.artist_id, self.release_id, basename)
+        return os.path.join(config.MEDIA_DIR, self.get_audio_key())
 
     def get_remote_path(self):
         """
-        get_remote_path : return path to where this track should be on network storage
+        get_remote_path : return path to where this track's audio should be on network storage
+        """
+        return os.path.join(config.CLOUD_STORAGE_PREFIX, self.get_audio_key())
+
+class TrackRow(NamedTuple):
+    """
+    TrackRow : a lightweight, read-only track returned by Database queries
+    it has the same fields and path/display helpers as Metadata, without parsing anything
+    """
+    rowid: int
+    artist: str
+    album: str
+    track_title: str
+    track_number: int
+    file_path: str
+    artist_id: str
+    release_id: str
+    recording_id: str
+    file_format: str
+    audio_key: str = None
+
+    @staticmethod
+    def from_db_row(row: tuple):
+        """
+        from_db_row : build a TrackRow from a database row, interning the strings
+        that repeat across tracks
         """
-        basename = self.basename_format.format(self.recording_id, self.file_format)
-        return os.path.join(config.CLOUD_STORAGE_PREFIX, self.artist_id, self.release_id, basename)
+        (rowid, artist, album, track_title, track_number, file_path,
+         artist_id, release_id, recording_id, file_format, audio_key) = row
+        return TrackRow(rowid, _intern(artist), _intern(album), track_title, track_number,
+                        file_path, _intern(artist_id), _intern(release_id), recording_id,
+                        _intern(file_format), audio_key)
+
+    @property
+    def key(self) -> tuple:
+        """ key : position of this row in (artist, album, track_number, rowid) order """
+        return (self.artist, self.album, self.track_number, self.rowid)
+
+    def get_display_string(self):
+        """
+        get_display_string : return human-readable string of artist, album, and track names
+        """
+        return Metadata.display_format.format(self.artist, self.album, self.track_title)
+
+    def get_audio_key(self):
+        """
+        get_audio_key : return the key of the object holding this track's audio
+        """
+        return self.audio_key or make_audio_key(self.artist_id, self.release_id,
+                                                self.recording_id, self.file_format)
+
+    @property
+    def audio_ids(self) -> tuple:
+        """ audio_ids : (artist_id, release_id, recording_id, file_format) of the stored audio """
+        return split_audio_key(self.get_audio_key())
+
+    def get_local_path(self):
+        """
+        get_local_path : return path to where this track's audio should be on local disk
+        """
+        return os.path.join(config.MEDIA_DIR, self.get_audio_key())
+
+    def get_remote_path(self):
+        """
+        get_remote_path : return path to where this track's audio should be on network storage
+        """
+        return os.path.join(config.CLOUD_STORAGE_PREFIX, self.get_audio_key())
+
+def make_audio_key(artist_id, release_id, recording_id, file_format) -> str:
+    """
+    make_audio_key : the key a recording's audio is stored under, relative to
+    CLOUD_STORAGE_PREFIX in the bucket and to MEDIA_DIR locally
+    """
+    basename = Metadata.basename_format.format(recording_id, file_format)
+    return '/'.join((artist_id, release_id, basename))
+
+def split_audio_key(audio_key: str) -> tuple:
+    """
+    split_audio_key : (artist_id, release_id, recording_id, file_format) from an audio key
+    """
+    artist_id, release_id, basename = audio_key.split('/', 2)
+    recording_id, _, file_format = basename.rpartition('.')
+    return artist_id, release_id, recording_id, file_format
+
+def _intern(string):
+    """
+    _intern : sys.intern, passing None (and anything else that isn't a str) through
+    """
+    return sys.intern(string) if isinstance(string, str) else string
 
 class FormatNotImplemented(Exception):
     """
@@ -0,0 +1,279 @@
+"""
+metrics.py : timing spans, counters and latency histograms for the ingest pipeline
+
+code records into whatever get() returns. that's a NullMetrics, which does nothing,
+unless configure() has turned metrics on, so instrumented code costs next to nothing
+when nobody's looking:
+
+    with metrics.get().span('upload', items=len(uploads)):
+        ...
+    metrics.get().count('upload_bytes', size)
+    metrics.get().observe('upload_seconds', seconds)
+
+when metrics are on, every span is written as a line of json to the log file as it
+ends, and finish() writes the totals there too, optionally writes them as a
+prometheus text-format file (for node_exporter's textfile collector), and returns
+a summary table
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict
+
+from monty.util.stats import LatencyStats
+
+# upper bounds (seconds) of the histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+PROMETHEUS_PREFIX = 'monty_'
+
+
+class Histogram(object):
+    """
+    Histogram : cumulative bucket counts and a sum, like a prometheus histogram,
+    plus the recent samples for percentiles
+    """
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = LatencyStats()
+
+    def observe(self, seconds: float):
+        """
+        observe : add a sample
+        """
+        self.count += 1
+        self.sum += seconds
+        self.recent.record(seconds * 1000)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+
+class Span(object):
+    """
+    Span : context manager timing one stage, see Metrics.span
+    """
+
+    def __init__(self, metrics: 'Metrics', stage: str, fields: dict):
+        self.metrics = metrics
+        self.stage = stage
+        self.fields = fields
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, error_type, error, _):
+        seconds = time.perf_counter() - self.started
+        if error_type is not None:
+            self.fields['error'] = repr(error)
+        self.metrics.end_span(self.stage, seconds, self.fields)
+        return False
+
+    def set(self, **fields):
+        """
+        set : add fields to the span's log line, e.g. counts only known at the end
+        """
+        self.fields.update(fields)
+
+
+class Metrics(object):
+    """
+    Metrics : collect spans, counters and histograms, and write them out
+
+    Attributes:
+        - log_path : file each span (and the final totals) is appended to as json
+        - prometheus_path : file finish() writes the totals to in prometheus text format
+    """
+
+    def __init__(self, log_path: str = None, prometheus_path: str = None):
+        self.log_path = log_path
+        self.prometheus_path = prometheus_path
+        self.counters = {}
+        self.histograms = {}
+        # spans : key is a stage, value is [number of spans, total seconds]
+        self.spans = {}
+        self._lock = threading.Lock()
+        self._log = open(log_path, 'a') if log_path else None
+
+    def span(self, stage: str, **fields) -> Span:
+        """
+        span : time a stage of the pipeline. fields are added to its log line
+        """
+        return Span(self, stage, fields)
+
+    def end_span(self, stage: str, seconds: float, fields: dict):
+        """
+        end_span : record a finished span
+        """
+        with self._lock:
+            totals = self.spans.setdefault(stage, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+        self._write(dict(fields, event='span', stage=stage, seconds=round(seconds, 6)))
+
+    def count(self, name: str, value=1):
+        """
+        count : add value to a counter
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        """
+        observe : add a sample to a latency histogram
+        """
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def _write(self, record: dict):
+        if self._log is None:
+            return
+        record['time'] = time.time()
+        line = json.dumps(record, sort_keys=True)
+        with self._lock:
+            self._log.write(line + '\n')
+            self._log.flush()
+
+    def totals(self) -> dict:
+        """
+        totals : everything recorded so far, as a json-able dict
+        """
+        with self._lock:
+            return {
+                'spans' : {stage: {'count' : count, 'seconds' : seconds}
+                           for stage, (count, seconds) in self.spans.items()},
+                'counters' : dict(self.counters),
+                'histograms' : {name: dict(histogram.recent.summary(),
+                                           count=histogram.count, sum=histogram.sum)
+                                for name, histogram in self.histograms.items()},
+            }
+
+    def write_prometheus(self, path: str):
+        """
+        write_prometheus : write the totals to path in prometheus text format. the file
+        is written next to path and moved into place, so a collector never sees half of it
+        """
+        lines = []
+        with self._lock:
+            lines.append('# TYPE {}stage_seconds_total counter'.format(PROMETHEUS_PREFIX))
+            for stage, (_, seconds) in sorted(self.spans.items()):
+                lines.append('{}stage_seconds_total{{stage="{}"}} {}'.format(
+                    PROMETHEUS_PREFIX, stage, seconds))
+            for name, value in sorted(self.counters.items()):
+                lines.append('# TYPE {}{}_total counter'.format(PROMETHEUS_PREFIX, name))
+                lines.append('{}{}_total {}'.format(PROMETHEUS_PREFIX, name, value))
+            for name, histogram in sorted(self.histograms.items()):
+                metric = PROMETHEUS_PREFIX + name
+                lines.append('# TYPE {} histogram'.format(metric))
+                for bound, count in zip(BUCKETS, histogram.buckets):
+                    lines.append('{}_bucket{{le="{}"}} {}'.format(metric, bound, count))
+                lines.append('{}_bucket{{le="+Inf"}} {}'.format(metric, histogram.count))
+                lines.append('{}_sum {}'.format(metric, histogram.sum))
+                lines.append('{}_count {}'.format(metric, histogram.count))
+        partial_path = '{}.part'.format(path)
+        with open(partial_path, 'w') as out:
+            out.write('\n'.join(lines) + '\n')
+        os.replace(partial_path, path)
+
+    def summary(self) -> str:
+        """
+        summary : a table of spans, counters and histograms
+        """
+        totals = self.totals()
+        lines = ['{:<28} {:>8} {:>10}'.format('stage', 'count', 'seconds')]
+        for stage, span in totals['spans'].items():
+            lines.append('{:<28} {:>8} {:>10.2f}'.format(stage, span['count'], span['seconds']))
+        if totals['counters']:
+            lines.append('')
+            lines.append('{:<28} {:>8}'.format('counter', 'value'))
+            for name, value in sorted(totals['counters'].items()):
+                lines.append('{:<28} {:>8}'.format(name, value))
+        if totals['histograms']:
+            lines.append('')
+            lines.append('{:<28} {:>8} {:>10} {:>10} {:>10}'.format(
+                'latency (ms)', 'count', 'p50', 'p95', 'max'))
+            for name, histogram in sorted(totals['histograms'].items()):
+                lines.append('{:<28} {:>8} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                    name, histogram['count'], histogram['p50'], histogram['p95'],
+                    histogram['max']))
+        return '\n'.join(lines)
+
+    def finish(self) -> str:
+        """
+        finish : write the totals to the log and the prometheus file, close the log,
+        and return the summary table
+        """
+        self._write(dict(self.totals(), event='totals'))
+        if self.prometheus_path:
+            self.write_prometheus(self.prometheus_path)
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        return self.summary()
+
+
+class NullSpan(object):
+    """
+    NullSpan : a span that doesn't time anything
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+    def set(self, **_):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class NullMetrics(object):
+    """
+    NullMetrics : the metrics used when metrics are off. every method does nothing
+    """
+
+    def span(self, stage: str, **fields) -> NullSpan:
+        return NULL_SPAN
+
+    def count(self, name: str, value=1):
+        pass
+
+    def observe(self, name: str, seconds: float):
+        pass
+
+    def totals(self) -> Dict[str, dict]:
+        return {'spans' : {}, 'counters' : {}, 'histograms' : {}}
+
+    def finish(self) -> str:
+        return ''
+
+
+_METRICS = NullMetrics()
+
+
+def get():
+    """
+    get : the metrics to record into (a NullMetrics unless configure turned them on)
+    """
+    return _METRICS
+
+
+def configure(enabled=True, log_path: str = None, prometheus_path: str = None):
+    """
+    configure : turn metrics on (or off) for this process, returning the new metrics
+    """
+    global _METRICS # pylint: disable=global-statement
+    _METRICS = Metrics(log_path, prometheus_path) if enabled else NullMetrics()
+    return _METRICS
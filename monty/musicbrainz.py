@@ -0,0 +1,226 @@
+"""
+musicbrainz.py : a caching, rate-limited front end for musicbrainzngs
+
+every lookup monty makes goes through MusicBrainzClient, which:
+- answers from an on-disk cache when it can (with a ttl per endpoint)
+- remembers lookups that found nothing, for a shorter ttl
+- sends everything else through a RequestScheduler, which keeps us under
+  musicbrainz's one-request-per-second limit and makes identical lookups
+  that are already in flight share a single request
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import musicbrainzngs
+
+import monty.config as config
+from monty import metrics
+
+
+class ResponseCache(object):
+    """
+    ResponseCache : sqlite-backed cache of musicbrainz responses
+
+    Attributes:
+        - location : location of the sqlite cache file
+        - ttls : seconds a response stays fresh, per endpoint
+        - negative_ttl : seconds an empty or not-found response stays fresh
+    """
+
+    def __init__(self, location=None, ttls=None, negative_ttl=None):
+        self.location = location or config.MUSICBRAINZ_CACHE_LOCATION
+        self.ttls = ttls or config.MUSICBRAINZ_CACHE_TTLS
+        self.negative_ttl = (config.MUSICBRAINZ_NEGATIVE_TTL
+                             if negative_ttl is None else negative_ttl)
+        config.ensure_dir(self.location)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.location, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+            create table if not exists responses
+                (endpoint varchar,
+                 request varchar,
+                 response varchar,
+                 negative int,
+                 fetched_at real,
+                 primary key (endpoint, request))
+            """)
+
+    def get(self, endpoint: str, request: str):
+        """
+        get : return (found, negative, response) for a cached request
+        expired entries count as not found
+        """
+        with self._lock:
+            row = self._conn.execute("""
+            select response, negative, fetched_at from responses
+            where endpoint = ? and request = ?
+            """, (endpoint, request)).fetchone()
+        if row is None:
+            return False, False, None
+        response, negative, fetched_at = row
+        ttl = self.negative_ttl if negative else self.ttls.get(endpoint, 0)
+        if time.time() - fetched_at > ttl:
+            return False, False, None
+        return True, bool(negative), json.loads(response)
+
+    def put(self, endpoint: str, request: str, response, negative=False):
+        """
+        put : cache a response. negative marks a lookup that found nothing
+        """
+        with self._lock, self._conn:
+            self._conn.execute("""
+            insert or replace into responses (endpoint, request, response, negative, fetched_at)
+            values (?, ?, ?, ?, ?)
+            """, (endpoint, request, json.dumps(response), int(negative), time.time()))
+
+    def close(self):
+        """
+        close : close the sqlite connection
+        """
+        self._conn.close()
+
+
+class RequestScheduler(object):
+    """
+    RequestScheduler : run requests no more often than once every interval seconds,
+    across all threads. a request with the same key as one that's already running
+    waits for that one instead of being sent again
+
+    Attributes:
+        - interval : minimum number of seconds between the start of two requests
+        - coalesced : how many requests were answered by an in-flight duplicate
+    """
+
+    def __init__(self, interval: float = None):
+        self.interval = config.MUSICBRAINZ_INTERVAL if interval is None else interval
+        self.coalesced = 0
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self._rate_lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def call(self, key, func, *args, **kwargs):
+        """
+        call : run func(*args, **kwargs) once a rate-limit slot is free and return its result
+        """
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+
+        try:
+            self._wait_for_slot()
+            future.set_result(func(*args, **kwargs))
+        except Exception as err: # pylint: disable=broad-except
+            future.set_exception(err)
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+        return future.result()
+
+    def _wait_for_slot(self):
+        with self._rate_lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class MusicBrainzClient(object):
+    """
+    MusicBrainzClient : the musicbrainzngs calls monty uses, behind a cache and a scheduler
+
+    Attributes:
+        - cache : ResponseCache for responses
+        - scheduler : RequestScheduler that requests go through
+        - mb : the musicbrainzngs module (or a stand-in for it)
+        - hits, misses : cache statistics for this client
+    """
+
+    def __init__(self, cache: ResponseCache = None,
+                 scheduler: RequestScheduler = None,
+                 mb_module=musicbrainzngs):
+        self.cache = cache or ResponseCache()
+        self.scheduler = scheduler or RequestScheduler()
+        self.mb = mb_module
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def search_artists(self, artist: str) -> dict:
+        """ search_artists : cached musicbrainzngs.search_artists """
+        return self._lookup('search_artists', 'artist-list', artist)
+
+    def search_release_groups(self, query: str) -> dict:
+        """ search_release_groups : cached musicbrainzngs.search_release_groups """
+        return self._lookup('search_release_groups', 'release-group-list', query)
+
+    def get_release_by_id(self, release_id: str, includes=None) -> dict:
+        """ get_release_by_id : cached musicbrainzngs.get_release_by_id """
+        return self._lookup('get_release_by_id', None, release_id, includes=includes or [])
+
+    def _lookup(self, endpoint, list_key, *args, **kwargs):
+        """
+        _lookup : answer from the cache, or call the endpoint and cache what comes back
+        a search with an empty list_key, or a 404, is cached as a negative result
+        """
+        request = json.dumps([args, kwargs], sort_keys=True)
+        found, negative, response = self.cache.get(endpoint, request)
+        with self._stats_lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.get().count('musicbrainz_cache_hits' if found else 'musicbrainz_cache_misses')
+        if found:
+            if negative and response is None:
+                raise NotFound('{}{} not found (cached)'.format(endpoint, args))
+            return response
+
+        func = getattr(self.mb, endpoint)
+        start = time.perf_counter()
+        try:
+            # includes any wait for a rate limit slot, which is where most of the time goes
+            response = self.scheduler.call((endpoint, request), func, *args, **kwargs)
+        except self.mb.ResponseError as err:
+            metrics.get().observe('musicbrainz_request_seconds', time.perf_counter() - start)
+            if getattr(err.cause, 'code', None) != 404:
+                metrics.get().count('musicbrainz_errors')
+                raise
+            self.cache.put(endpoint, request, None, negative=True)
+            raise NotFound('{}{} not found'.format(endpoint, args))
+        except Exception:
+            metrics.get().count('musicbrainz_errors')
+            raise
+        metrics.get().observe('musicbrainz_request_seconds', time.perf_counter() - start)
+        negative = list_key is not None and not response.get(list_key)
+        self.cache.put(endpoint, request, response, negative)
+        return response
+
+    def hit_rate(self) -> float:
+        """ hit_rate : fraction of lookups answered from the cache """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self) -> str:
+        """ summary : human-readable cache statistics """
+        return 'MusicBrainz cache: {} hits, {} misses ({:.0%} hit rate), {} coalesced'.format(
+            self.hits, self.misses, self.hit_rate(), self.scheduler.coalesced)
+
+
+class NotFound(Exception):
+    """
+    NotFound : musicbrainz doesn't know about the thing we looked up
+    """
+    pass
@@ -3,18 +3,131 @@ playback.py : take 2 at trying to play audio, this time trying to divide the aud
 parts from the cli parts
 """
 
+import ctypes
+import itertools
+import os
+import threading
+import time
+
 import vlc
 
+import monty.config as config
+from monty import progressive
+from monty.util.stats import LatencyStats
+
+# actions whose click-to-audible latency is measured, see Player.begin_timing
+TIMED_ACTIONS = ('play', 'pause', 'next', 'previous', 'skip')
+# the timed actions that change songs, which are only done once the new song is heard
+SONG_CHANGES = ('next', 'previous', 'skip')
+
+# songs still being downloaded are read through libvlc's media callbacks, which pass
+# around an integer handle. _HANDLES : key is a handle, value is the ProgressiveDownload
+# a media was made for, or a PartialFileReader libvlc has opened on one
+_HANDLES = {}
+_NEXT_HANDLE = itertools.count(1)
+
+
+@vlc.CallbackDecorators.MediaOpenCb
+def _open_stream(opaque, datap, sizep):
+    try:
+        reader = _HANDLES[opaque].open()
+    except (KeyError, OSError):
+        return -1
+    handle = next(_NEXT_HANDLE)
+    _HANDLES[handle] = reader
+    datap[0] = handle
+    sizep[0] = reader.download.size
+    return 0
+
+
+@vlc.CallbackDecorators.MediaReadCb
+def _read_stream(handle, buffer, length):
+    try:
+        data = _HANDLES[handle].read(length)
+    except Exception: # pylint: disable=broad-except
+        # the download failed or was cancelled, which vlc sees as a read error
+        return -1
+    ctypes.memmove(buffer, data, len(data))
+    return len(data)
+
+
+@vlc.CallbackDecorators.MediaSeekCb
+def _seek_stream(handle, offset):
+    _HANDLES[handle].seek(offset)
+    return 0
+
+
+@vlc.CallbackDecorators.MediaCloseCb
+def _close_stream(handle):
+    reader = _HANDLES.pop(handle, None)
+    if reader is not None:
+        reader.close()
+
+
 class Player(object):
     """
     Player : play a file using vlc
+
+    in gapless mode, songs are played by a vlc MediaListPlayer. shortly before the
+    current song ends (config.GAPLESS_ARM_SECONDS), the song given to set_next_song is
+    parsed and added to its media list, so vlc moves straight on to it without the
+    player being torn down. on_song_changed is called with the new song's location
+    when that happens. if there's no next song ready in time, or outside of gapless
+    mode, on_song_ended is called when a song ends and it's up to the caller to
+    change_song. both are called from a vlc thread
+
+    vlc's MediaListPlayer keeps its place in the list by index, so songs it has played
+    can't be taken out of the list while it's playing. instead the list is started
+    afresh by change_song, and once config.GAPLESS_MAX_LIST_LENGTH songs have played
+    back to back, the next one isn't queued up, so the caller's change_song does it
+
+    there's one vlc MediaPlayer for the life of the Player; changing songs swaps its
+    media in place. file_caching is how many ms of a file vlc buffers before playing
+    (default: config.PLAYER_FILE_CACHING_MS)
+
+    gap_stats records the time from a song ending to the next one being audible, and
+    latency_stats (see begin_timing) the time from a button being clicked to its
+    effect being heard
+
+    a song that's still being downloaded (see monty.progressive) is read as it
+    arrives rather than from its path, and first_audio records the time from its
+    download starting to it being heard
     """
 
-    def __init__(self, file_location=''):
-        self.vlc_instance = vlc.Instance()
+    def __init__(self, file_location='', gapless=None, on_song_ended=None,
+                 on_song_changed=None, file_caching: int = None):
+        file_caching = config.PLAYER_FILE_CACHING_MS if file_caching is None else file_caching
+        self.vlc_instance = vlc.Instance('--file-caching={}'.format(file_caching))
+        self.gapless = config.GAPLESS_PLAYBACK if gapless is None else gapless
+        self.on_song_ended = on_song_ended
+        self.on_song_changed = on_song_changed
+        self.gap_stats = LatencyStats()
+        self.first_audio = LatencyStats()
+        # latency : key is an action (see TIMED_ACTIONS), value is its LatencyStats
+        self.latency = {action: LatencyStats() for action in TIMED_ACTIONS}
+        self.media = None
+        self._ended_at = None
+        self._timing = None
+        self._cold_start = None
+        self._stream_handle = None
+        self._next_location = None
+        self._armed_location = None
+        self._stop_arming = threading.Event()
+        self._arming = None
+        self.player = self.vlc_instance.media_player_new()
+        self._attach_events(self.player)
+        if self.gapless:
+            self.media_list = self.vlc_instance.media_list_new()
+            self.list_player = self.vlc_instance.media_list_player_new()
+            self.list_player.set_media_player(self.player)
+            self.list_player.set_media_list(self.media_list)
+            self.list_player.event_manager().event_attach(
+                vlc.EventType.MediaListPlayerNextItemSet, self._on_next_item_set)
+            self._arming = threading.Thread(target=self._arm_when_due, name='gapless-arming',
+                                            daemon=True)
+            self._arming.start()
         if file_location:
-            self.media = self.vlc_instance.media_new_path(file_location)
-            self.player = self.media.player_new_from_media()
+            self.change_song(file_location, play=False)
 
     def play(self):
         """
@@ -22,10 +135,12 @@ class Player(object):
 
         TODO: should probably check if the stream's open first
         """
-        if self.player:
-            self.player.play()
+        if self.media is None:
+            raise NoAvailableMediaException('Tried to play but there is no song to play')
+        if self.gapless:
+            self.list_player.play()
         else:
-            raise NoAvailableMediaException('Tried to play but you have no media player')
+            self.player.play()
 
     def pause(self):
         """
@@ -33,10 +148,10 @@ class Player(object):
 
         TODO: should probably check if the stream's open first
         """
-        if self.player:
-            self.player.pause()
+        if self.gapless:
+            self.list_player.pause()
         else:
-            raise NoAvailableMediaException('Tried to pause but you have no media player')
+            self.player.pause()
 
     def stop(self):
         """
@@ -44,29 +159,210 @@ class Player(object):
 
         TODO: should probably check if the stream's open first
         """
-        if self.player:
-            self.player.stop()
+        if self.gapless:
+            self.list_player.stop()
         else:
-            raise NoAvailableMediaException('Tried to stop but you have no media player')
+            self.player.stop()
 
-    def change_song(self, new_song_location):
+    def close(self):
         """
-        change_song: create a new vlc media player for this song
+        close : stop playing, stop watching for the next song to be due, and release
+        the vlc objects
         """
-        was_playing = False
-        if self.is_playing():
-            was_playing = True
+        self._stop_arming.set()
+        if self._arming is not None:
+            self._arming.join()
         self.stop()
-        self.media = self.vlc_instance.media_new_path(new_song_location)
-        self.player = self.media.player_new_from_media()
+        if self.gapless:
+            self.list_player.release()
+            self.media_list.release()
+        self.player.release()
+
+    def change_song(self, new_song_location, play=None):
+        """
+        change_song: switch to this song, playing it if play is True, or
+        if play is None and the last song was playing
+        """
+        was_playing = self.is_playing() if play is None else play
+        self.stop()
+        _HANDLES.pop(self._stream_handle, None)
+        self._stream_handle = None
+        self._cold_start = None
+        download = progressive.active(new_song_location)
+        if download is not None:
+            self.media = self._media_for_download(download)
+        else:
+            self.media = self.vlc_instance.media_new_path(new_song_location)
+        if self.gapless:
+            self._next_location = None
+            self._armed_location = None
+            # a new list drops the songs played so far. the list player holds its own
+            # reference to the list it's given, so ours to the old one can go
+            played = self.media_list
+            self.media_list = self.vlc_instance.media_list_new()
+            self.media_list.add_media(self.media)
+            self.list_player.set_media_list(self.media_list)
+            played.release()
+        else:
+            self.player.set_media(self.media)
+        timing = self._timing
+        if timing is not None and timing[0] in SONG_CHANGES and timing[2] is None:
+            # this is the song the timed action was waiting for
+            self._timing = (timing[0], timing[1], self.media)
         if was_playing:
             self.play()
 
+    def _media_for_download(self, download: progressive.ProgressiveDownload):
+        """
+        _media_for_download : a media that reads a download in progress, waiting for
+        the bytes it gets to before they've arrived
+        """
+        self._stream_handle = next(_NEXT_HANDLE)
+        _HANDLES[self._stream_handle] = download
+        self._cold_start = download.started
+        return self.vlc_instance.media_new_callbacks(
+            _open_stream, _read_stream, _seek_stream, _close_stream,
+            ctypes.c_void_p(self._stream_handle))
+
+    def set_next_song(self, new_song_location):
+        """
+        set_next_song : in gapless mode, the song to move on to when this one ends
+        (None if there isn't one). it's only queued up once it's on disk
+        """
+        if not self.gapless:
+            return
+        armed = self._armed_location
+        if armed is not None and armed != new_song_location:
+            # the next song changed after the old one was queued up, so take it back out
+            self.media_list.lock()
+            self.media_list.remove_index(self.media_list.count() - 1)
+            self.media_list.unlock()
+            self._armed_location = None
+        self._next_location = new_song_location
+
+    def arm_next_song(self) -> bool:
+        """
+        arm_next_song : if the current song is nearly over, parse the next song and add
+        it to the media list (unless the list is full, see the class docstring).
+        returns True if it was added
+        """
+        location = self._next_location
+        if location is None or self._armed_location is not None or not self.is_playing():
+            return False
+        length = self.player.get_length()
+        if length <= 0 or length - self.player.get_time() > config.GAPLESS_ARM_SECONDS * 1000:
+            return False
+        if not os.path.isfile(location):
+            return False
+        if self.media_list.count() >= config.GAPLESS_MAX_LIST_LENGTH:
+            # let this song end, so change_song starts a new list for the next one
+            return False
+        media = self.vlc_instance.media_new_path(location)
+        # parse the file now so switching to it doesn't have to
+        media.parse_with_options(vlc.MediaParseFlag.local, 0)
+        self.media_list.lock()
+        self.media_list.add_media(media)
+        self.media_list.unlock()
+        self._armed_location = location
+        return True
+
+    def _arm_when_due(self):
+        while not self._stop_arming.wait(config.GAPLESS_POLL_SECONDS):
+            self.arm_next_song()
+
+    def begin_timing(self, action: str, started: float = None):
+        """
+        begin_timing : start timing action (one of TIMED_ACTIONS), e.g. when its button is
+        clicked. it's done once the player is heard playing again (or, for pause, once
+        it's paused). for the actions that change songs, that's the song passed to
+        the next change_song: the old song carrying on in the meantime doesn't count.
+        started is a time.perf_counter() value, by default now.
+        starting another timing abandons this one
+        """
+        if action not in self.latency:
+            raise ValueError('Unknown action {}'.format(action))
+        # _timing : (action, when it started, the media it's waiting to hear, once known)
+        self._timing = (action, time.perf_counter() if started is None else started, None)
+
+    def latency_stats(self) -> dict:
+        """
+        latency_stats : p50/p95/max click-to-audible latency in ms for each action
+        """
+        return {action: stats.summary() for action, stats in self.latency.items()}
+
+    def describe_latency(self) -> str:
+        """
+        describe_latency : latency_stats as text, one line per action that has samples
+        """
+        return '\n'.join('{}: {}'.format(action, stats.describe())
+                         for action, stats in self.latency.items() if stats.samples)
+
+    def _finish_timing(self, paused: bool):
+        timing = self._timing
+        if timing is None or (timing[0] == 'pause') != paused:
+            return
+        action, started, media = timing
+        if action in SONG_CHANGES and (media is None or not self._is_playing_media(media)):
+            return
+        self._timing = None
+        self.latency[action].record_since(started)
+
+    def _is_playing_media(self, media) -> bool:
+        """
+        _is_playing_media : whether media is the one the vlc player has
+        """
+        current = self.player.get_media()
+        if current is None:
+            return False
+        try:
+            return current._as_parameter_.value == media._as_parameter_.value
+        finally:
+            # get_media gives us a reference of our own
+            current.release()
+
+    def _attach_events(self, player):
+        events = player.event_manager()
+        events.event_attach(vlc.EventType.MediaPlayerEndReached, self._on_end_reached)
+        events.event_attach(vlc.EventType.MediaPlayerTimeChanged, self._on_time_changed)
+        events.event_attach(vlc.EventType.MediaPlayerPaused, self._on_paused)
+
+    def _on_end_reached(self, _):
+        self._ended_at = time.perf_counter()
+        if self._armed_location is None and self.on_song_ended is not None:
+            self.on_song_ended()
+
+    def _on_time_changed(self, event):
+        # the first time update after a song ended is when the next one became audible
+        if event.u.new_time <= 0:
+            return
+        ended_at = self._ended_at
+        if ended_at is not None:
+            self._ended_at = None
+            self.gap_stats.record_since(ended_at)
+        cold_start = self._cold_start
+        if cold_start is not None:
+            self._cold_start = None
+            self.first_audio.record_since(cold_start)
+        self._finish_timing(paused=False)
+
+    def _on_paused(self, _):
+        self._finish_timing(paused=True)
+
+    def _on_next_item_set(self, _):
+        location = self._armed_location
+        if location is None:
+            # change_song starting a new list, rather than vlc moving on by itself
+            return
+        self._armed_location = None
+        self._next_location = None
+        if self.on_song_changed is not None:
+            self.on_song_changed(location)
+
     def is_playing(self):
         """
         is_playing: check to see if the audio stream is playing music
         """
-        return self.player.is_playing()
+        return bool(self.player.is_playing())
 
 class NoAvailableMediaException(Exception):
     """
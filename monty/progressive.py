@@ -0,0 +1,206 @@
+"""
+progressive.py : download a recording in ranged chunks, so it can be played before
+the whole file is on disk
+
+a ProgressiveDownload writes the object into a .part file next to its final
+location, in order: first config.PROGRESSIVE_LEAD_BYTES, then
+config.PROGRESSIVE_CHUNK_SIZE bytes at a time. once the lead bytes are there, it's
+ready to play: readers (see open) read the .part file and wait for bytes that
+haven't arrived yet, instead of taking the end of what's there for the end of the
+file. when the last chunk is written, the .part file is moved into place, where it
+looks like any other download (readers that already have it open carry on, unaffected)
+
+downloads in progress are registered by their final path, so the player can tell
+that a path it's been given is still on its way (see active)
+
+every download of a file gets a .part file of its own (see partial_path), so a
+prefetch, a stream and a bulk download of the same track can't write over each
+other: each one moves a complete file into place, and the last one in wins
+"""
+
+import os
+import threading
+import time
+import uuid
+
+import monty.config as config
+
+# _ACTIVE : key is the final path of a download in progress, value is its ProgressiveDownload
+_ACTIVE = {}
+_ACTIVE_LOCK = threading.Lock()
+
+
+def partial_path(path: str) -> str:
+    """
+    partial_path : a name, unique to this download, to write path under until it's complete
+    """
+    return '{}.{}.part'.format(path, uuid.uuid4().hex)
+
+
+def active(path: str) -> 'ProgressiveDownload':
+    """
+    active : the download in progress to path, or None
+    """
+    with _ACTIVE_LOCK:
+        return _ACTIVE.get(path)
+
+
+class ProgressiveDownload(object):
+    """
+    ProgressiveDownload : fetch blob to path in ranged chunks (see the module docstring)
+
+    Attributes:
+        - path : where the file ends up
+        - partial_path : where it's written in the meantime
+        - size : size of the object in bytes
+        - written : number of bytes on disk so far
+        - started : time.perf_counter() when the download was created
+        - ready_at : time.perf_counter() when the lead buffer was on disk
+    """
+
+    def __init__(self, blob, path: str, size: int, chunk_size: int = None,
+                 lead_bytes: int = None):
+        self.blob = blob
+        self.path = path
+        self.partial_path = partial_path(path)
+        self.size = size
+        self.chunk_size = chunk_size or config.PROGRESSIVE_CHUNK_SIZE
+        self.lead_bytes = min(size, config.PROGRESSIVE_LEAD_BYTES
+                              if lead_bytes is None else lead_bytes)
+        self.written = 0
+        self.complete = False
+        self.error = None
+        self.started = time.perf_counter()
+        self.ready_at = None
+        self._cancelled = False
+        self._changed = threading.Condition()
+
+    def run(self):
+        """
+        run : download the whole object, then move it into place. this blocks, so it's
+        meant to be run on an executor. raises whatever the download raised, or
+        DownloadCancelled if cancel was called
+        """
+        with _ACTIVE_LOCK:
+            _ACTIVE[self.path] = self
+        try:
+            with open(self.partial_path, 'wb') as out:
+                # the first request is just the lead buffer, so playing can start sooner
+                start, end = 0, max(self.lead_bytes, 1)
+                while start < self.size:
+                    if self._cancelled:
+                        raise DownloadCancelled(self.path)
+                    end = min(end, self.size)
+                    self.blob.download_to_file(out, start=start, end=end - 1)
+                    out.flush()
+                    self._set_written(end)
+                    start, end = end, end + self.chunk_size
+            os.replace(self.partial_path, self.path)
+            with self._changed:
+                self.complete = True
+                self._changed.notify_all()
+        except BaseException as error:
+            with self._changed:
+                self.error = error
+                self._changed.notify_all()
+            try:
+                os.remove(self.partial_path)
+            except FileNotFoundError:
+                pass
+            raise
+        finally:
+            with _ACTIVE_LOCK:
+                if _ACTIVE.get(self.path) is self:
+                    del _ACTIVE[self.path]
+
+    def _set_written(self, written: int):
+        with self._changed:
+            self.written = written
+            if self.ready_at is None and written >= self.lead_bytes:
+                self.ready_at = time.perf_counter()
+            self._changed.notify_all()
+
+    def cancel(self):
+        """
+        cancel : stop downloading after the chunk in flight. readers waiting on
+        bytes that will now never come get an error
+        """
+        self._cancelled = True
+
+    def wait_for(self, offset: int, timeout: float = None) -> bool:
+        """
+        wait_for : block until the byte at offset is on disk (or the download finished
+        or failed). returns False if it timed out, and raises if the download failed
+        """
+        with self._changed:
+            available = self._changed.wait_for(
+                lambda: self.written > offset or self.complete or self.error is not None,
+                timeout)
+            if self.error is not None and self.written <= offset:
+                raise self.error
+            return available
+
+    def wait_until_ready(self, timeout: float = None) -> bool:
+        """
+        wait_until_ready : block until the lead buffer is on disk
+        """
+        return self.wait_for(self.lead_bytes - 1, timeout)
+
+    def open(self) -> 'PartialFileReader':
+        """
+        open : a reader over the file, which waits for bytes that haven't arrived yet
+        """
+        return PartialFileReader(self)
+
+
+class PartialFileReader(object):
+    """
+    PartialFileReader : read a file that a ProgressiveDownload is still writing.
+    reads past what's been written wait for it to arrive
+    """
+
+    def __init__(self, download: ProgressiveDownload):
+        self.download = download
+        # once the .part file is renamed this handle still reads the same file
+        try:
+            self._file = open(download.partial_path, 'rb')
+        except FileNotFoundError:
+            # it finished (and was moved into place) in the meantime
+            self._file = open(download.path, 'rb')
+        self.position = 0
+
+    def read(self, count: int) -> bytes:
+        """
+        read : up to count bytes, waiting until at least one of them has arrived.
+        returns b'' at the end of the file
+        """
+        if self.position >= self.download.size:
+            return b''
+        self.download.wait_for(self.position)
+        available = max(self.download.written, self.position + 1)
+        if self.download.complete:
+            available = self.download.size
+        count = min(count, available - self.position)
+        self._file.seek(self.position)
+        data = self._file.read(count)
+        self.position += len(data)
+        return data
+
+    def seek(self, position: int):
+        """
+        seek : move to position. the bytes there are waited for on the next read
+        """
+        self.position = position
+
+    def close(self):
+        """
+        close : close the file
+        """
+        self._file.close()
+
+
+class DownloadCancelled(Exception):
+    """
+    DownloadCancelled : the download was cancelled before it finished
+    """
+    pass
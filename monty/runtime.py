@@ -0,0 +1,150 @@
+"""
+runtime.py : run asyncio work on a background thread and hand the results to the gui
+
+tkinter has to be driven from the thread that created it, and its main loop can't
+run an asyncio event loop. so downloads, prefetches and index syncs run on an event
+loop in a background thread, and everything they need to tell the gui about goes
+through a queue that the gui thread drains every config.RUNTIME_POLL_MS with after()
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import queue
+import threading
+from typing import Callable, Coroutine
+
+import monty.config as config
+
+LOGGER = logging.getLogger(__name__)
+
+# asyncio.all_tasks and asyncio.current_task are new in python 3.7 (and the Task
+# classmethods they replace are gone in 3.9)
+_all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+_current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+
+
+class Runtime(object):
+    """
+    Runtime : an asyncio event loop on a background thread, bridged to a gui main loop
+
+    submit() and run_blocking() can be called from any thread. the callbacks given
+    to them, and anything passed to post(), are called on the gui thread, so they're
+    free to touch widgets
+
+    Attributes:
+        - loop : the event loop running on the background thread
+        - poll_interval : how often (ms) the gui thread checks for results
+    """
+
+    def __init__(self, poll_interval: int = None):
+        self.loop = asyncio.new_event_loop()
+        self.poll_interval = poll_interval or config.RUNTIME_POLL_MS
+        self._callbacks = queue.Queue()
+        self._thread = None
+        self._root = None
+        self._poll_job = None
+
+    def start(self, root=None):
+        """
+        start : start the event loop thread and, if root (a tk widget) is given,
+        start delivering results to its thread
+        """
+        self._thread = threading.Thread(target=self._run, name='monty-runtime', daemon=True)
+        self._thread.start()
+        if root is not None:
+            self._root = root
+            self.poll()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def stop(self, timeout: float = None):
+        """
+        stop : cancel whatever is still running and stop the event loop thread
+        """
+        if self._root is not None and self._poll_job is not None:
+            self._root.after_cancel(self._poll_job)
+            self._poll_job = None
+        if self._thread is None:
+            return
+
+        async def cancel_everything():
+            tasks = [task for task in _all_tasks(self.loop)
+                     if task is not _current_task(self.loop)]
+            for task in tasks:
+                task.cancel()
+            # the loop only stops once the tasks have finished, and had a turn to pass
+            # that on to the futures submit() returned
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.sleep(0)
+            self.loop.stop()
+
+        asyncio.run_coroutine_threadsafe(cancel_everything(), self.loop)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, coroutine: Coroutine, on_done: Callable = None,
+               on_error: Callable = None) -> concurrent.futures.Future:
+        """
+        submit : run coroutine on the event loop
+        on_done is called with its result, or on_error with the exception it raised,
+        on the gui thread. cancelled coroutines call neither
+        returns a concurrent.futures.Future, which can be used to cancel it
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+        def deliver(future):
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is None:
+                if on_done is not None:
+                    self.post(on_done, future.result())
+            elif on_error is not None:
+                self.post(on_error, error)
+            else:
+                LOGGER.error('Background task failed', exc_info=error)
+
+        future.add_done_callback(deliver)
+        return future
+
+    def run_blocking(self, func: Callable, *args, on_done: Callable = None,
+                     on_error: Callable = None) -> concurrent.futures.Future:
+        """
+        run_blocking : like submit, but for a blocking function, which is run on
+        the event loop's default executor so it doesn't hold up the loop either
+        """
+        async def call():
+            return await self.loop.run_in_executor(None, functools.partial(func, *args))
+        return self.submit(call(), on_done, on_error)
+
+    def post(self, func: Callable, *args):
+        """
+        post : call func(*args) on the gui thread. safe to call from any thread
+        """
+        self._callbacks.put((func, args))
+
+    def poll(self):
+        """
+        poll : call everything posted since the last poll, then check again later
+        """
+        self.run_posted()
+        self._poll_job = self._root.after(self.poll_interval, self.poll)
+
+    def run_posted(self):
+        """
+        run_posted : call everything posted so far, on this thread
+        """
+        while True:
+            try:
+                func, args = self._callbacks.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                func(*args)
+            except Exception: # pylint: disable=broad-except
+                # one bad callback shouldn't stop the rest from being delivered
+                LOGGER.exception('Callback %r failed', func)
@@ -0,0 +1,451 @@
+"""
+server.py : serve the track library and its audio over http (the "monty-server")
+
+    GET /tracks                   a page of tracks, in (artist, album, track_number) order
+        ?limit=N                  page size (default config.DB_PAGE_SIZE)
+        &after=CURSOR             the "next" cursor from the previous page
+        &artist_id=&release_id=&file_format=    optional filters
+    GET /tracks/{recording_id}        one track
+    GET /tracks/{recording_id}/audio  the track's audio, from config.MEDIA_DIR
+
+audio responses support single byte ranges (Range, If-Range), and carry an ETag and
+Last-Modified so clients can make conditional requests (If-None-Match,
+If-Modified-Since). the file is handed to the socket with loop.sendfile, which uses
+os.sendfile where the platform has it, so the bytes never pass through python.
+HEAD works everywhere GET does
+
+it's a small HTTP/1.1 server on asyncio streams (keep-alive, no request bodies: a
+connection is closed after a request that has one), so it can hold hundreds of
+concurrent streams in one process. anything unexpected going wrong answers a 500
+and closes the connection. db queries are all
+indexed page or key lookups, so they run on the event loop
+"""
+
+import asyncio
+import base64
+import email.utils
+import json
+import logging
+import os
+import re
+import time
+import urllib.parse
+from http import HTTPStatus
+from typing import NamedTuple
+
+import monty.config as config
+from monty import metrics
+from monty.db import Database
+from monty.metadata import TrackRow
+
+CONTENT_TYPES = {
+    'mp3' : 'audio/mpeg',
+    'flac' : 'audio/flac',
+}
+TRACKS_PATH = re.compile(r'^/tracks/?$')
+TRACK_PATH = re.compile(r'^/tracks/([\w-]+)$')
+AUDIO_PATH = re.compile(r'^/tracks/([\w-]+)/audio$')
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+MAX_HEADERS = 100
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Request(NamedTuple):
+    """
+    Request : the parts of an http request the server looks at
+    """
+    method: str
+    path: str
+    query: dict
+    version: str
+    headers: dict
+
+    @property
+    def has_body(self) -> bool:
+        """ has_body : whether a body follows the headers """
+        return ('transfer-encoding' in self.headers
+                or self.headers.get('content-length', '0').strip() != '0')
+
+    @property
+    def keep_alive(self) -> bool:
+        """
+        keep_alive : whether the client wants the connection kept open. request
+        bodies are never read, so the connection can't be reused after one
+        """
+        if self.has_body:
+            return False
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+
+class HTTPError(Exception):
+    """
+    HTTPError : stop handling a request and respond with status
+    """
+
+    def __init__(self, status: HTTPStatus, message: str = None, headers: dict = None):
+        super().__init__(message or status.phrase)
+        self.status = status
+        self.message = message or status.phrase
+        self.headers = headers or {}
+
+
+class MediaServer(object):
+    """
+    MediaServer : serve a Database's tracks, and their audio files, over http
+
+    Attributes:
+        - db : the Database to list tracks from
+        - host, port : where to listen
+        - requests, bytes_sent : totals since the server started
+        - connections : number of connections currently open
+    """
+
+    def __init__(self, db: Database, host: str = None, port: int = None):
+        self.db = db
+        self.host = host or config.SERVER_HOST
+        self.port = config.SERVER_PORT if port is None else port
+        self.requests = 0
+        self.bytes_sent = 0
+        self.connections = 0
+        self._server = None
+
+    async def start(self):
+        """
+        start : start listening. returns the asyncio server
+        """
+        self._server = await asyncio.start_server(self.handle_connection, self.host, self.port,
+                                                  backlog=1024)
+        return self._server
+
+    def close(self):
+        """
+        close : stop listening
+        """
+        if self._server is not None:
+            self._server.close()
+
+    async def handle_connection(self, reader, writer):
+        """
+        handle_connection : answer requests on one connection until either side is done
+        """
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader),
+                                                     config.SERVER_REQUEST_TIMEOUT)
+                except HTTPError as err:
+                    await self.send_error(writer, err, keep_alive=False)
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break
+                start = time.perf_counter()
+                keep_alive = request.keep_alive
+                try:
+                    await self.respond(request, writer, keep_alive)
+                except HTTPError as err:
+                    await self.send_error(writer, err, keep_alive, request.method)
+                except (ConnectionError, asyncio.CancelledError):
+                    raise
+                except Exception: # pylint: disable=broad-except
+                    LOGGER.exception('Failed to answer %s %s', request.method, request.path)
+                    # whatever was half-written can't be taken back, so don't reuse the connection
+                    keep_alive = False
+                    await self.send_error(writer, HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR),
+                                          keep_alive, request.method)
+                self.requests += 1
+                metrics.get().observe('server_request_seconds', time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def respond(self, request: Request, writer, keep_alive: bool):
+        """
+        respond : route a request to its handler
+        """
+        if request.method not in ('GET', 'HEAD'):
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, headers={'Allow' : 'GET, HEAD'})
+        if TRACKS_PATH.match(request.path):
+            await self.send_json(writer, request, self.list_tracks(request.query), keep_alive)
+            return
+        match = TRACK_PATH.match(request.path)
+        if match:
+            track = self.get_track(match.group(1))
+            await self.send_json(writer, request, track_to_json(track), keep_alive)
+            return
+        match = AUDIO_PATH.match(request.path)
+        if match:
+            await self.send_audio(writer, request, self.get_track(match.group(1)), keep_alive)
+            return
+        raise HTTPError(HTTPStatus.NOT_FOUND)
+
+    def list_tracks(self, query: dict) -> dict:
+        """
+        list_tracks : a page of tracks, and the cursor for the next page (or None)
+        """
+        try:
+            limit = int(query.get('limit', config.DB_PAGE_SIZE))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'limit must be a number')
+        if not 0 < limit <= config.SERVER_MAX_PAGE_SIZE:
+            raise HTTPError(HTTPStatus.BAD_REQUEST,
+                            'limit must be between 1 and {}'.format(config.SERVER_MAX_PAGE_SIZE))
+        after = decode_cursor(query['after']) if query.get('after') else None
+        filters = {name: query[name] for name in ('artist_id', 'release_id', 'file_format')
+                   if query.get(name)}
+        page = self.db.get_tracks_page(after, limit, **filters)
+        return {
+            'tracks' : [track_to_json(track) for track in page],
+            'next' : encode_cursor(page[-1].key) if len(page) == limit else None,
+        }
+
+    def get_track(self, recording_id: str) -> TrackRow:
+        """
+        get_track : the track with this recording id, or a 404
+        """
+        track = self.db.get_track(recording_id)
+        if track is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, 'no track {}'.format(recording_id))
+        return track
+
+    async def send_json(self, writer, request: Request, body, keep_alive: bool):
+        """
+        send_json : respond 200 with body as json
+        """
+        payload = json.dumps(body).encode()
+        headers = {'Content-Type' : 'application/json', 'Cache-Control' : 'no-cache'}
+        self.write_head(writer, HTTPStatus.OK, headers, len(payload), keep_alive)
+        if request.method != 'HEAD':
+            writer.write(payload)
+            self.bytes_sent += len(payload)
+        await writer.drain()
+
+    async def send_error(self, writer, error: HTTPError, keep_alive: bool, method: str = None):
+        """
+        send_error : respond with an error status and a json body explaining it. the
+        body is left out for HEAD requests, where the client isn't expecting one
+        """
+        payload = json.dumps({'error' : error.message}).encode()
+        headers = dict(error.headers, **{'Content-Type' : 'application/json'})
+        self.write_head(writer, error.status, headers, len(payload), keep_alive)
+        if method != 'HEAD':
+            writer.write(payload)
+        await writer.drain()
+
+    async def send_audio(self, writer, request: Request, track: TrackRow, keep_alive: bool):
+        """
+        send_audio : respond with all of, or the requested range of, a track's audio file
+        """
+        path = track.get_local_path()
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise HTTPError(HTTPStatus.NOT_FOUND, 'track {} is not in the media directory'.format(
+                track.recording_id))
+        size = stat.st_size
+        etag = '"{:x}-{:x}"'.format(size, stat.st_mtime_ns)
+        headers = {
+            'Content-Type' : CONTENT_TYPES.get(track.file_format, 'application/octet-stream'),
+            'Accept-Ranges' : 'bytes',
+            'ETag' : etag,
+            'Last-Modified' : email.utils.formatdate(stat.st_mtime, usegmt=True),
+        }
+        if not_modified(request.headers, etag, stat.st_mtime):
+            self.write_head(writer, HTTPStatus.NOT_MODIFIED, headers, None, keep_alive)
+            await writer.drain()
+            return
+
+        status = HTTPStatus.OK
+        start, length = 0, size
+        byte_range = request.headers.get('range')
+        if byte_range and if_range_matches(request.headers.get('if-range'), etag, stat.st_mtime):
+            parsed = parse_range(byte_range, size)
+            if parsed is not None:
+                start, end = parsed
+                length = end - start + 1
+                status = HTTPStatus.PARTIAL_CONTENT
+                headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+        self.write_head(writer, status, headers, length, keep_alive)
+        await writer.drain()
+        if request.method == 'HEAD' or not length:
+            return
+        with open(path, 'rb') as audio:
+            await send_file(writer, audio, start, length)
+        self.bytes_sent += length
+        metrics.get().count('server_bytes_sent', length)
+
+    @staticmethod
+    def write_head(writer, status: HTTPStatus, headers: dict, length: int, keep_alive: bool):
+        """
+        write_head : write the status line and headers
+        """
+        lines = ['HTTP/1.1 {} {}'.format(status.value, status.phrase),
+                 'Date: {}'.format(email.utils.formatdate(usegmt=True)),
+                 'Connection: {}'.format('keep-alive' if keep_alive else 'close')]
+        if length is not None:
+            lines.append('Content-Length: {}'.format(length))
+        lines.extend('{}: {}'.format(name, value) for name, value in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+
+async def read_request(reader) -> Request:
+    """
+    read_request : read a request line and headers. returns None if the client hung up
+    """
+    line = await _read_line(reader, HTTPStatus.REQUEST_URI_TOO_LONG)
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'malformed request line')
+    headers = {}
+    while True:
+        line = await _read_line(reader, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    url = urllib.parse.urlsplit(target)
+    query = dict(urllib.parse.parse_qsl(url.query))
+    return Request(method.upper(), urllib.parse.unquote(url.path), query, version, headers)
+
+
+async def _read_line(reader, too_long: HTTPStatus) -> bytes:
+    """
+    _read_line : read a line, answering with too_long if it's longer than the reader's limit
+    """
+    try:
+        return await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        # readline reports a line over the limit as a ValueError
+        raise HTTPError(too_long)
+
+
+async def send_file(writer, file_obj, offset: int, count: int):
+    """
+    send_file : send count bytes of file_obj, starting at offset, to the client.
+    loop.sendfile falls back to reading and writing chunks where os.sendfile can't be used
+    """
+    loop = asyncio.get_event_loop()
+    if hasattr(loop, 'sendfile'):
+        await loop.sendfile(writer.transport, file_obj, offset, count)
+        return
+    file_obj.seek(offset)
+    while count > 0:
+        chunk = file_obj.read(min(count, config.SERVER_CHUNK_SIZE))
+        if not chunk:
+            break
+        writer.write(chunk)
+        count -= len(chunk)
+        await writer.drain()
+
+
+def parse_range(header: str, size: int) -> tuple:
+    """
+    parse_range : the (first, last) byte of a single "bytes=" range, clamped to size.
+    returns None for headers it doesn't handle (multiple ranges, other units), which
+    means sending the whole file. raises a 416 if the range is outside the file
+    """
+    match = RANGE_HEADER.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N : the last N bytes
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPError(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                        headers={'Content-Range' : 'bytes */{}'.format(size)})
+    return start, end
+
+
+def not_modified(headers: dict, etag: str, mtime: float) -> bool:
+    """
+    not_modified : whether a conditional GET can be answered with a 304
+    If-None-Match wins over If-Modified-Since when both are sent
+    """
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or 'W/' + etag in tags
+    return not_modified_since(headers.get('if-modified-since'), mtime)
+
+
+def not_modified_since(header: str, mtime: float) -> bool:
+    """
+    not_modified_since : whether a file last modified at mtime is no newer than header
+    """
+    if not header:
+        return False
+    try:
+        since = email.utils.parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # http dates only have whole seconds
+    return int(mtime) <= since
+
+
+def if_range_matches(header: str, etag: str, mtime: float) -> bool:
+    """
+    if_range_matches : whether a Range should be honoured, given the If-Range header
+    """
+    if not header:
+        return True
+    if header.startswith('"') or header.startswith('W/'):
+        return header == etag
+    return not_modified_since(header, mtime)
+
+
+def track_to_json(track: TrackRow) -> dict:
+    """
+    track_to_json : the fields of a track that clients see
+    """
+    return {
+        'recording_id' : track.recording_id,
+        'artist' : track.artist,
+        'album' : track.album,
+        'title' : track.track_title,
+        'track_number' : track.track_number,
+        'artist_id' : track.artist_id,
+        'release_id' : track.release_id,
+        'file_format' : track.file_format,
+        'audio' : '/tracks/{}/audio'.format(track.recording_id),
+    }
+
+
+def encode_cursor(key: tuple) -> str:
+    """
+    encode_cursor : turn a track key into an opaque, url-safe cursor
+    """
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    decode_cursor : turn a cursor back into a track key
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'bad cursor')
+    if not isinstance(key, list) or len(key) != 4:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'bad cursor')
+    return tuple(key)
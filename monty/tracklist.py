@@ -2,9 +2,12 @@
 tracklist.py : a tracklist class for playing audio
 """
 
+import asyncio
 import os
 from typing import List
 
+import monty.config as config
+from monty.cache import MediaCache
 from monty.cloud import get_remote_storage
 from monty.metadata import Metadata
 
@@ -26,14 +29,44 @@ def _wrap_index_error(func):
 class TrackList(object):
     """
     TrackList : a list of songs and their locations
+
+    while a song plays, the next prefetch_ahead songs (and the previous one) are
+    downloaded in the background, at most max_prefetches at a time (plus the song
+    being skipped to, if it has to be fetched on demand). prefetch_hits
+    counts songs that were ready (or on their way) thanks to a prefetch, and
+    prefetch_misses counts songs that had to be downloaded on demand
+
+    if a MediaCache is given, downloads are recorded in it, plays update their
+    last access time, and the current song (which is assumed to be the one playing) and
+    the prefetch window are protected from eviction
+
+    if progressive is True (default: config.PROGRESSIVE_DOWNLOADS), a song that has to
+    be downloaded on demand is streamed (see CloudStorage.stream_recording):
+    skip_to_index returns as soon as the start of it is on disk, and the rest carries
+    on downloading in the background
     """
-    def __init__(self, song_metadata: List[Metadata], position=0):
+    def __init__(self, song_metadata: List[Metadata], position=0,
+                 prefetch_ahead: int = None, max_prefetches: int = None, cloud=None,
+                 media_cache: MediaCache = None, progressive: bool = None):
         if position < 0 or position > len(song_metadata):
             raise NoAvailableSongException('position in track list ' +
                                            'cannot be greater than the list of songs')
         self.song_metadata = song_metadata
         self.position = position
-        self.cloud = get_remote_storage()
+        self.cloud = cloud or get_remote_storage()
+        self.media_cache = media_cache
+        self.prefetch_ahead = (config.PREFETCH_AHEAD
+                               if prefetch_ahead is None else prefetch_ahead)
+        self.max_prefetches = max_prefetches or config.MAX_PREFETCHES
+        self.progressive = (config.PROGRESSIVE_DOWNLOADS
+                            if progressive is None else progressive)
+        self.prefetch_hits = 0
+        self.prefetch_misses = 0
+        # _prefetches : key is a song's local path, value is the task downloading it
+        self._prefetches = {}
+        # _streams : key is a song's local path, value is the task finishing its stream
+        self._streams = {}
+        self._prefetch_slots = None
 
     def enqueue_song(self, song):
         """
@@ -48,6 +81,16 @@ class TrackList(object):
         """
         self.song_metadata.insert(self.position, song)
 
+    async def play_from(self, songs: List[Metadata], index: int) -> str:
+        """
+        play_from : replace the songs in the track list with songs, then skip to index
+        in them. prefetches for songs that aren't near index any more are cancelled
+        """
+        if index < 0 or index >= len(songs):
+            raise NoAvailableSongException('cannot skip to index {}'.format(index))
+        self.song_metadata = songs
+        return await self.skip_to_index(index)
+
     async def get_next_song(self) -> str:
         """
         get_next_song : return the location of the next song file to play
@@ -81,14 +124,106 @@ class TrackList(object):
             raise NoAvailableSongException('cannot skip to index {}'.format(index))
         self.position = index
         current_track = self.song_metadata[self.position]
-        try:
-            os.stat(current_track.get_local_path())
-        except FileNotFoundError:
-            await self.cloud.get_recording(current_track.artist_id,
-                                           current_track.release_id,
-                                           current_track.recording_id,
-                                           current_track.file_format)
-        return current_track.get_local_path()
+        local_path = current_track.get_local_path()
+        prefetch = self._prefetches.pop(local_path, None)
+        # drop prefetches we no longer need before (possibly) downloading this song
+        self._cancel_stale_prefetches()
+        if prefetch is not None:
+            try:
+                await prefetch
+                self.prefetch_hits += 1
+            except (asyncio.CancelledError, Exception): # pylint: disable=broad-except
+                # the prefetch didn't make it, so fall back to fetching it ourselves
+                prefetch = None
+        streaming = local_path in self._streams
+        if prefetch is None and not streaming and not os.path.isfile(local_path):
+            self.prefetch_misses += 1
+            if self.progressive:
+                await self._stream(current_track)
+            else:
+                await self._download(current_track)
+        self.update_prefetches()
+        if self.media_cache is not None:
+            self.media_cache.set_playing(local_path)
+            self.media_cache.touch(local_path)
+        return local_path
+
+    def prefetch_window(self) -> List[Metadata]:
+        """
+        prefetch_window : the songs worth having on disk given the current position:
+        the previous song and the next prefetch_ahead songs
+        """
+        start = max(0, self.position - 1)
+        end = min(len(self.song_metadata), self.position + self.prefetch_ahead + 1)
+        return [self.song_metadata[i] for i in range(start, end) if i != self.position]
+
+    def update_prefetches(self):
+        """
+        update_prefetches : cancel prefetches for songs that fell out of the window,
+        and start them for songs in the window that aren't on disk yet.
+        has to be called from within a running event loop
+        """
+        if self._prefetch_slots is None:
+            self._prefetch_slots = asyncio.Semaphore(self.max_prefetches)
+        window = self._cancel_stale_prefetches()
+        for local_path, track in window.items():
+            if (local_path in self._prefetches or local_path in self._streams
+                    or os.path.isfile(local_path)):
+                continue
+            self._prefetches[local_path] = asyncio.ensure_future(self._prefetch(track))
+
+    def _cancel_stale_prefetches(self) -> dict:
+        """
+        _cancel_stale_prefetches : cancel prefetches outside of the window, and streams
+        outside of the window that aren't the current song
+        returns the window as a dict of local path -> song
+        """
+        window = {track.get_local_path(): track for track in self.prefetch_window()}
+        current = self.song_metadata[self.position].get_local_path()
+        if self.media_cache is not None:
+            self.media_cache.set_window(list(window) + [current])
+        for local_path in list(self._prefetches):
+            if local_path not in window:
+                self._prefetches.pop(local_path).cancel()
+        for local_path in list(self._streams):
+            if local_path not in window and local_path != current:
+                self._streams.pop(local_path).cancel()
+        return window
+
+    def prefetch_stats(self) -> dict:
+        """
+        prefetch_stats : prefetch hits, on-demand misses, and prefetches in flight
+        """
+        return {
+            'hits' : self.prefetch_hits,
+            'misses' : self.prefetch_misses,
+            'in_flight' : sum(1 for task in self._prefetches.values() if not task.done()),
+            'streaming' : len(self._streams),
+        }
+
+    async def _prefetch(self, track: Metadata):
+        async with self._prefetch_slots:
+            await self._download(track)
+
+    async def _stream(self, track: Metadata):
+        finished = await self.cloud.stream_recording(*track.audio_ids)
+        local_path = track.get_local_path()
+        self._streams[local_path] = finished
+
+        def on_finished(task):
+            if self._streams.get(local_path) is task:
+                del self._streams[local_path]
+            if task.cancelled() or task.exception() is not None:
+                return
+            if self.media_cache is not None:
+                self.media_cache.record_download(local_path)
+
+        finished.add_done_callback(on_finished)
+
+    async def _download(self, track: Metadata):
+        await self.cloud.get_recording(*track.audio_ids)
+        if self.media_cache is not None:
+            self.media_cache.record_download(track.get_local_path())
 
 
 class NoAvailableSongException(Exception):
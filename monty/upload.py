@@ -0,0 +1,162 @@
+"""
+upload.py : upload files to a bucket concurrently, skipping ones that are already there
+
+works with a google.cloud.storage Bucket or a monty.bucket.DirectoryBucket
+"""
+
+import base64
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import monty.config as config
+from monty import metrics
+from monty.util import mid
+
+UPLOADED = 'uploaded'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+
+class Uploader(object):
+    """
+    Uploader : upload (local path, object name) pairs with a bounded thread pool
+
+    before uploading, the local file's md5 is compared with the md5 stored on the
+    remote object, and identical objects are skipped. errors listed in retryable
+    are retried with exponential backoff; anything else fails that one upload
+
+    Attributes:
+        - bucket : bucket to upload to
+        - workers : maximum number of uploads in flight
+        - retries : how many times to retry a transient failure
+        - backoff : seconds to wait before the first retry, doubled on each retry
+        - retryable : exception types that count as transient
+        - hash_cache : optional mid.HashCache used to hash local files
+        - storage : optional CloudStorage (or LocalDirectoryStorage) to upload with.
+          its bucket and thread pool are used instead of bucket and workers, and
+          uploads are recorded in its stats
+    """
+
+    def __init__(self, bucket=None,
+                 workers: int = None,
+                 retries: int = None,
+                 backoff: float = None,
+                 retryable: tuple = (ConnectionError, TimeoutError),
+                 hash_cache: mid.HashCache = None,
+                 storage=None):
+        self.storage = storage
+        self.bucket = storage.bucket if storage is not None else bucket
+        self.workers = workers or config.UPLOAD_WORKERS
+        self.retries = config.UPLOAD_RETRIES if retries is None else retries
+        self.backoff = config.UPLOAD_BACKOFF if backoff is None else backoff
+        self.retryable = retryable
+        self.hash_cache = hash_cache
+        self._print_lock = threading.Lock()
+
+    def upload_all(self, uploads: List[Tuple[str, str]]) -> 'UploadReport':
+        """
+        upload_all : upload every (local path, object name) pair, return an UploadReport
+        """
+        report = UploadReport()
+        start = time.time()
+        if self.storage is not None:
+            pool = self.storage.executor
+        else:
+            pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            results = pool.map(lambda upload: self.upload(*upload), uploads)
+            for (local_path, _), (status, size) in zip(uploads, results):
+                report.add(local_path, status, size)
+        finally:
+            if self.storage is None:
+                pool.shutdown()
+        report.elapsed = time.time() - start
+        return report
+
+    def upload(self, local_path: str, object_name: str) -> Tuple[str, int]:
+        """
+        upload : upload a single file unless the remote copy is identical
+        returns (status, bytes uploaded)
+        """
+        start = time.perf_counter()
+        try:
+            local_md5 = base64.b64encode(mid.file_digest(local_path, self.hash_cache))
+            remote = self._retry(self.bucket.get_blob, object_name)
+            if remote is not None and remote.md5_hash == local_md5.decode('ascii'):
+                self._print('Skipping {}: already at {}'.format(local_path, object_name))
+                metrics.get().count('upload_skipped')
+                return SKIPPED, 0
+            self._retry(self.bucket.blob(object_name).upload_from_filename, local_path)
+        except Exception as err: # pylint: disable=broad-except
+            self._print('Failed to upload {}: {!r}'.format(local_path, err))
+            metrics.get().count('upload_errors')
+            return FAILED, 0
+        self._print('Uploaded {} to {}'.format(local_path, object_name))
+        size = os.path.getsize(local_path)
+        metrics.get().count('uploads')
+        metrics.get().count('upload_bytes', size)
+        metrics.get().observe('upload_seconds', time.perf_counter() - start)
+        if self.storage is not None:
+            self.storage.stats.record('upload', start, size)
+        return UPLOADED, size
+
+    def _retry(self, func, *args):
+        """
+        _retry : call func, retrying transient errors with exponential backoff and jitter
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return func(*args)
+            except self.retryable:
+                if attempt == self.retries:
+                    raise
+                metrics.get().count('upload_retries')
+                time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def _print(self, message):
+        with self._print_lock:
+            print(message)
+
+
+class UploadReport(object):
+    """
+    UploadReport : what happened during Uploader.upload_all
+    """
+
+    def __init__(self):
+        self.uploaded = 0
+        self.skipped = 0
+        self.failed = []
+        self.bytes_uploaded = 0
+        self.elapsed = 0.0
+
+    def add(self, local_path, status, size):
+        """
+        add : record the result of one upload
+        """
+        if status == UPLOADED:
+            self.uploaded += 1
+            self.bytes_uploaded += size
+        elif status == SKIPPED:
+            self.skipped += 1
+        else:
+            self.failed.append(local_path)
+
+    def summary(self) -> str:
+        """
+        summary : human-readable throughput summary
+        """
+        elapsed = self.elapsed or float('inf')
+        return ('Uploaded {} objects ({:.1f} MB) in {:.2f}s: {:.2f} MB/s, {:.1f} objects/s. '
+                'Skipped {} identical, {} failed').format(
+                    self.uploaded,
+                    self.bytes_uploaded / 1e6,
+                    self.elapsed,
+                    self.bytes_uploaded / 1e6 / elapsed,
+                    self.uploaded / elapsed,
+                    self.skipped,
+                    len(self.failed))
@@ -0,0 +1,94 @@
+"""
+jsonstream.py — read the members of a big top-level json object without loading all of it
+
+    with open('audio.json') as index_file:
+        for track_id, track in iter_object_items(index_file):
+            ...
+
+only one member (plus a read buffer) is held in memory at a time
+"""
+
+import json
+from typing import Any, Iterator, TextIO, Tuple
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = ' \t\n\r'
+# NUMBER_CHARS : characters that can carry on a json number, e.g. the '.5' after a '1'
+NUMBER_CHARS = '0123456789+-.eE'
+
+
+def iter_object_items(file_obj: TextIO, chunk_size=CHUNK_SIZE) -> Iterator[Tuple[str, Any]]:
+    """
+    iter_object_items - yield (key, value) for each member of the json object in file_obj
+    """
+    reader = _Reader(file_obj, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.decode()
+        reader.expect(':')
+        value = reader.decode()
+        yield key, value
+        if reader.expect(',}') == '}':
+            return
+
+
+class _Reader(object):
+    """
+    _Reader : a buffer over file_obj that's refilled whenever a token runs past its end
+    """
+
+    def __init__(self, file_obj, chunk_size):
+        self.file_obj = file_obj
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.file_obj.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self) -> str:
+        """ peek : return the next non-whitespace character, without consuming it """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                raise ValueError('unexpected end of json')
+            self._fill()
+
+    def expect(self, chars: str) -> str:
+        """ expect : consume the next non-whitespace character, which has to be one of chars """
+        char = self.peek()
+        if char not in chars:
+            raise ValueError('expected one of {!r} at {!r}'.format(
+                chars, self.buf[self.pos:self.pos + 20]))
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """ decode : consume and return the next json value """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number (or literal) that ends with the buffer might continue in the next
+                # chunk. so might a number followed only by the start of a fraction or an
+                # exponent ('1.' or '1e' decodes as 1), so those wait for more too
+                if self.eof or (end < len(self.buf) and not (
+                        isinstance(value, (int, float)) and not isinstance(value, bool)
+                        and not self.buf[end:].lstrip(NUMBER_CHARS))):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self._fill()
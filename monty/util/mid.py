@@ -2,22 +2,272 @@
 mid.py — get or create a uuid for a song
 
 "mid" is supposed to stand for "Monty ID", but we'll see if that sticks
+
+    $ python -m monty.util.mid FILE
+
+file hashes are computed by streaming the file through md5 in fixed-size chunks,
+so memory use doesn't depend on the size of the file. a HashCache can be passed
+in to remember hashes across runs, keyed by (device, inode, size, mtime_ns).
+create_uuids_from_files hashes many files at once on a thread pool
+
+audio_digest hashes only the audio in a file, leaving out its tags (ID3v2, ID3v1
+and APEv2 tags in an mp3, the metadata blocks in a flac), so copies of a song that
+were tagged differently have the same audio fingerprint. files whose tags don't add
+up (a size that runs past the end of the file, or leaves less than MIN_AUDIO_BYTES of
+audio) have no fingerprint, and are treated as unique
 """
 
 import hashlib
+import os
+import sqlite3
+import struct
 import sys
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import monty.config as config
+from monty import metrics
 
+CHUNK_SIZE = 1024 * 1024
+ID3V2_HEADER_SIZE = 10
+ID3V1_SIZE = 128
+APE_FOOTER_SIZE = 32
+# less audio than this is taken to mean the tags were misread, not a real (tiny) song
+MIN_AUDIO_BYTES = 1024
 
-def create_uuid_from_file(filename) -> str:
+
+class HashCache(object):
     """
-    create_uuid_from_file - read from a file-like object, return a uuid string
-    created from the md5 hash of the contents
+    HashCache : sqlite-backed cache of file md5s
+
+    a cached hash is only used if the file's device, inode, size and mtime_ns
+    all match what they were when the hash was computed
+
+    Attributes:
+        - location : location of the sqlite cache file
+    """
+
+    def __init__(self, location=None):
+        self.location = location or config.HASH_CACHE_LOCATION
+        config.ensure_dir(self.location)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.location, check_same_thread=False)
+        with self._conn:
+            # file_hashes holds whole-file md5s, audio_hashes audio_digest md5s
+            for table in ('file_hashes', 'audio_hashes'):
+                self._conn.execute("""
+                create table if not exists {}
+                    (device int,
+                     inode int,
+                     size int,
+                     mtime_ns int,
+                     md5 blob,
+                     primary key (device, inode, size, mtime_ns))
+                """.format(table))
+
+    @staticmethod
+    def _key(stat: os.stat_result) -> tuple:
+        return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def get(self, stat: os.stat_result, table='file_hashes') -> bytes:
+        """
+        get : return the cached md5 digest for a file's stat info, or None
+        """
+        with self._lock:
+            row = self._conn.execute("""
+            select md5 from {}
+            where device = ? and inode = ? and size = ? and mtime_ns = ?
+            """.format(table), HashCache._key(stat)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def put(self, stat: os.stat_result, digest: bytes, table='file_hashes'):
+        """
+        put : remember the md5 digest for a file's stat info
+        """
+        with self._lock, self._conn:
+            self._conn.execute("""
+            insert or replace into {} (device, inode, size, mtime_ns, md5)
+            values (?, ?, ?, ?, ?)
+            """.format(table), HashCache._key(stat) + (digest,))
+
+    def close(self):
+        """
+        close : close the sqlite connection
+        """
+        self._conn.close()
+
+
+def file_digest(filename, cache: HashCache = None) -> bytes:
+    """
+    file_digest - return the md5 digest of a file's contents, reading it in
+    CHUNK_SIZE pieces into a single reused buffer
+    """
+    start = time.perf_counter()
+    with open(filename, 'rb') as file_obj:
+        stat = os.fstat(file_obj.fileno())
+        if cache:
+            digest = cache.get(stat)
+            if digest:
+                metrics.get().count('hash_cache_hits')
+                return digest
+        digest = _md5_range(file_obj, 0, stat.st_size)
+    if cache:
+        cache.put(stat, digest)
+    metrics.get().count('hash_bytes', stat.st_size)
+    metrics.get().observe('hash_seconds', time.perf_counter() - start)
+    return digest
+
+
+def _md5_range(file_obj, start: int, end: int) -> bytes:
+    """
+    _md5_range : md5 digest of bytes start to end of file_obj, read in CHUNK_SIZE
+    pieces into a single reused buffer
     """
     md5 = hashlib.md5()
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    file_obj.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        size = file_obj.readinto(buf)
+        if not size:
+            break
+        size = min(size, remaining)
+        md5.update(view[:size])
+        remaining -= size
+    return md5.digest()
+
+
+def audio_range(file_obj, size: int) -> tuple:
+    """
+    audio_range : (start, end) of the audio in a file of size bytes, after leading
+    ID3v2 tags or flac metadata blocks and before trailing APEv2 and ID3v1 tags.
+    anything that isn't recognised as a tag is counted as audio. returns None if the
+    tags claim more of the file than there is, or leave less than MIN_AUDIO_BYTES
+    """
+    start, end = 0, size
+    # ID3v2 tags (there may be more than one, and they turn up in front of flacs too)
+    while True:
+        file_obj.seek(start)
+        header = file_obj.read(ID3V2_HEADER_SIZE)
+        if len(header) < ID3V2_HEADER_SIZE or header[:3] != b'ID3':
+            break
+        # the tag size is 4 bytes of 7 bits each, excluding the header and any footer
+        tag_size = 0
+        for byte in header[6:10]:
+            tag_size = (tag_size << 7) | (byte & 0x7f)
+        footer = ID3V2_HEADER_SIZE if header[5] & 0x10 else 0
+        start += ID3V2_HEADER_SIZE + tag_size + footer
+    file_obj.seek(start)
+    if file_obj.read(4) == b'fLaC':
+        # metadata blocks: a flag for the last block, 7 bits of type, 24 bits of length
+        start += 4
+        while True:
+            file_obj.seek(start)
+            header = file_obj.read(4)
+            if len(header) < 4:
+                break
+            start += 4 + int.from_bytes(header[1:], 'big')
+            if header[0] & 0x80:
+                break
+        return _checked_range(start, size, size)
+    # trailing ID3v1 and APEv2 tags, which can come in either order
+    while end > start:
+        if end - start >= APE_FOOTER_SIZE:
+            file_obj.seek(end - APE_FOOTER_SIZE)
+            footer = file_obj.read(APE_FOOTER_SIZE)
+            if footer[:8] == b'APETAGEX':
+                # the tag size counts the items and the footer, but not the optional header
+                tag_size, _, flags = struct.unpack('<III', footer[12:24])
+                end -= tag_size + (APE_FOOTER_SIZE if flags & 0x80000000 else 0)
+                continue
+        if end - start >= ID3V1_SIZE:
+            file_obj.seek(end - ID3V1_SIZE)
+            if file_obj.read(3) == b'TAG':
+                end -= ID3V1_SIZE
+                continue
+        break
+    return _checked_range(start, end, size)
+
+
+def _checked_range(start: int, end: int, size: int) -> tuple:
+    """
+    _checked_range : (start, end) if it's a plausible amount of audio within size bytes,
+    otherwise None
+    """
+    if start < 0 or end > size or end - start < MIN_AUDIO_BYTES:
+        return None
+    return start, end
+
+
+def audio_digest(filename, cache: HashCache = None) -> bytes:
+    """
+    audio_digest - return the md5 digest of just the audio in a file (see audio_range),
+    or None if its audio can't be told apart from its tags
+    """
+    start = time.perf_counter()
     with open(filename, 'rb') as file_obj:
-        md5.update(file_obj.read())
-    return str(uuid.UUID(bytes=md5.digest()))
+        stat = os.fstat(file_obj.fileno())
+        if cache:
+            digest = cache.get(stat, 'audio_hashes')
+            if digest:
+                metrics.get().count('hash_cache_hits')
+                return digest
+        audio = audio_range(file_obj, stat.st_size)
+        if audio is None:
+            metrics.get().count('hash_unreadable_tags')
+            return None
+        audio_start, audio_end = audio
+        digest = _md5_range(file_obj, audio_start, audio_end)
+    if cache:
+        cache.put(stat, digest, 'audio_hashes')
+    metrics.get().count('hash_bytes', audio_end - audio_start)
+    metrics.get().observe('hash_seconds', time.perf_counter() - start)
+    return digest
+
+
+def audio_fingerprint(filename, cache: HashCache = None) -> str:
+    """
+    audio_fingerprint - the audio_digest of a file, as a hex string, or None
+    """
+    digest = audio_digest(filename, cache)
+    return digest.hex() if digest is not None else None
+
+
+def audio_fingerprints(filenames: List[str],
+                       cache: HashCache = None,
+                       workers: int = None) -> Dict[str, str]:
+    """
+    audio_fingerprints - fingerprint many files concurrently, returning a dict of
+    filename -> audio_fingerprint (None for files with no fingerprint)
+    """
+    with ThreadPoolExecutor(max_workers=workers or config.HASH_WORKERS) as pool:
+        fingerprints = pool.map(lambda filename: audio_fingerprint(filename, cache), filenames)
+        return dict(zip(filenames, fingerprints))
+
+
+def create_uuid_from_file(filename, cache: HashCache = None) -> str:
+    """
+    create_uuid_from_file - read from a file-like object, return a uuid string
+    created from the md5 hash of the contents
+    """
+    return str(uuid.UUID(bytes=file_digest(filename, cache)))
+
+
+def create_uuids_from_files(filenames: List[str],
+                            cache: HashCache = None,
+                            workers: int = None) -> Dict[str, str]:
+    """
+    create_uuids_from_files - hash many files concurrently, returning a dict of
+    filename -> uuid string. hashlib releases the GIL while hashing large buffers,
+    so a thread pool is enough to keep several cores busy
+    """
+    with ThreadPoolExecutor(max_workers=workers or config.HASH_WORKERS) as pool:
+        uuids = pool.map(lambda filename: create_uuid_from_file(filename, cache), filenames)
+        return dict(zip(filenames, uuids))
 
 
 def create_uuid_from_string(string):
@@ -0,0 +1,62 @@
+"""
+stats.py : keep track of how long things take
+
+a LatencyStats holds the most recent samples of one measurement (in milliseconds)
+and summarises them as p50/p95/max
+"""
+
+import collections
+import time
+from typing import Dict
+
+WINDOW = 1000
+
+
+class LatencyStats(object):
+    """
+    LatencyStats : the last `window` samples of one latency, in ms
+    """
+
+    def __init__(self, window: int = WINDOW):
+        self.samples = collections.deque(maxlen=window)
+
+    def record(self, milliseconds: float):
+        """
+        record : add a sample
+        """
+        self.samples.append(milliseconds)
+
+    def record_since(self, started: float):
+        """
+        record_since : add the time since started (a time.perf_counter() value) as a sample
+        """
+        self.record((time.perf_counter() - started) * 1000)
+
+    def percentile(self, fraction: float) -> float:
+        """
+        percentile : nearest-rank percentile of the samples, or None if there are none
+        """
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self) -> Dict[str, float]:
+        """
+        summary : sample count, p50, p95 and max
+        """
+        return {
+            'count' : len(self.samples),
+            'p50' : self.percentile(0.5),
+            'p95' : self.percentile(0.95),
+            'max' : max(self.samples) if self.samples else None,
+        }
+
+    def describe(self) -> str:
+        """
+        describe : the summary as a line of text
+        """
+        if not self.samples:
+            return 'no samples'
+        return 'p50 {p50:.0f}ms, p95 {p95:.0f}ms, max {max:.0f}ms ({count} samples)'.format(
+            **self.summary())
@@ -0,0 +1,57 @@
+"""
+monty_server.py : serve the local library and its audio over http (see monty.server)
+
+Arguments:
+- --host, --port : where to listen (default: config.SERVER_HOST, config.SERVER_PORT)
+- --db : sqlite db to serve (default: config.DB_LOCATION)
+
+e.g. stream the first track's audio, starting a megabyte in:
+    $ curl localhost:8419/tracks?limit=1
+    $ curl -H 'Range: bytes=1048576-' localhost:8419/tracks/<recording_id>/audio
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+
+import monty.config as config
+from monty.db import Database
+from monty.server import MediaServer
+
+SH = logging.StreamHandler(sys.stdout)
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(SH)
+LOGGER.setLevel(logging.INFO)
+
+
+def main(arguments):
+    """
+    main : serve until interrupted
+    """
+    db = Database(arguments.db)
+    server = MediaServer(db, arguments.host, arguments.port)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(server.start())
+    LOGGER.info('Serving %d tracks on http://%s:%d', db.count_tracks(), server.host, server.port)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        LOGGER.info('Served %d requests, %d bytes', server.requests, server.bytes_sent)
+        db.close()
+
+
+def parse():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default=config.SERVER_HOST)
+    parser.add_argument('--port', type=int, default=config.SERVER_PORT)
+    parser.add_argument('--db', help='sqlite db to serve (default: {})'.format(
+        config.DB_LOCATION))
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse())
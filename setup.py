@@ -21,7 +21,7 @@ setup(
     license='MIT license',
     packages=find_packages(
         exclude=[
-            'docs', 'tests',
+            'docs', 'tests', 'bench',
             'windows', 'macOS', 'linux',
             'iOS', 'android',
             'django'
@@ -0,0 +1,98 @@
+"""
+cache_test.py : MediaCache eviction, and the tracks it has to leave alone
+
+    $ python -m pytest test/cache_test.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+from monty import cache
+from monty.cache import MediaCache
+
+SIZE = 100
+
+
+class MediaCacheTest(unittest.TestCase):
+    """
+    MediaCacheTest : least recently played first, until usage is under the quota
+    """
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.media_cache = MediaCache(os.path.join(self.workdir.name, 'local.db'),
+                                      quota_bytes=3 * SIZE)
+        # tracks 0 to 5, played in that order
+        self.paths = [self.download(i) for i in range(6)]
+
+    def tearDown(self):
+        self.media_cache.stop()
+        self.workdir.cleanup()
+
+    def download(self, i: int, pinned=False) -> str:
+        path = os.path.join(self.workdir.name, '{}.mp3'.format(i))
+        with open(path, 'wb') as track:
+            track.write(b'\0' * SIZE)
+        with mock.patch.object(cache.time, 'time', return_value=1000.0 + i):
+            self.media_cache.record_download(path, pinned=pinned)
+        return path
+
+    def remaining(self) -> list:
+        return [i for i, path in enumerate(self.paths) if os.path.isfile(path)]
+
+    def test_under_quota_evicts_nothing(self):
+        self.media_cache.quota_bytes = 6 * SIZE
+        self.assertEqual(self.media_cache.evict_step(), 0)
+        self.assertEqual(self.remaining(), list(range(6)))
+
+    def test_evicts_least_recently_played_until_under_quota(self):
+        with mock.patch.object(cache.time, 'time', return_value=2000.0):
+            self.media_cache.touch(self.paths[0])
+        self.assertEqual(self.media_cache.evict_step(), 3 * SIZE)
+        self.assertEqual(self.remaining(), [0, 4, 5])
+        self.assertEqual(self.media_cache.usage(), 3 * SIZE)
+
+    def test_evicts_in_batches(self):
+        self.assertEqual(self.media_cache.evict_step(max_files=2), 2 * SIZE)
+        self.assertEqual(self.remaining(), [2, 3, 4, 5])
+        self.media_cache.evict_step(max_files=2)
+        self.assertEqual(self.remaining(), [3, 4, 5])
+
+    def test_pinned_tracks_are_never_evicted(self):
+        self.media_cache.pin(self.paths[0])
+        self.media_cache.pin(self.paths[1])
+        self.media_cache.quota_bytes = 0
+        self.media_cache.evict_step()
+        self.assertEqual(self.remaining(), [0, 1])
+
+    def test_tracks_in_the_window_are_kept(self):
+        self.media_cache.set_window(self.paths[:2])
+        self.media_cache.evict_step()
+        self.assertEqual(self.remaining(), [0, 1, 5])
+
+    def test_playing_track_is_never_deleted(self):
+        self.media_cache.set_playing(self.paths[0])
+        self.media_cache.quota_bytes = 0
+        self.media_cache.evict_step()
+        self.assertEqual(self.remaining(), [0])
+        self.assertEqual(self.media_cache.usage(), SIZE)
+
+    def test_background_eviction(self):
+        self.media_cache.start(interval=0.01)
+        for _ in range(200):
+            if self.media_cache.usage() <= 3 * SIZE:
+                break
+            time.sleep(0.01)
+        self.media_cache.stop()
+        self.assertEqual(self.remaining(), [3, 4, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+"""
+db_sync_test.py : Database.sync and Database.rebuild against an in-memory index log
+
+    $ python -m pytest test/db_sync_test.py
+"""
+
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+from bench.synthetic import iter_index_entries
+from monty.cache import MediaCache
+from monty.db import Database, SyncError, build_catalog_snapshot
+
+
+class IndexLogStorage(object):
+    """
+    IndexLogStorage : the index side of CloudStorage, for a base (as a catalog snapshot)
+    and a set of change segments held in memory
+    """
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.base = {}
+        self.base_generation = 0
+        self.changes = {}
+
+    def publish_base(self, entries: dict, generation: int):
+        self.base = entries
+        self.base_generation = generation
+        self.changes = {g: change for g, change in self.changes.items() if g > generation}
+
+    def get_catalog_snapshot(self, db_location):
+        compressed = os.path.join(self.workdir, 'catalog.db.gz')
+        build_catalog_snapshot(self.base.values(), compressed, self.base_generation)
+        with gzip.open(compressed, 'rb') as snapshot, open(db_location, 'wb') as out:
+            shutil.copyfileobj(snapshot, out)
+        return True
+
+    def list_index_changes(self, after_generation):
+        return [(generation, str(generation)) for generation in sorted(self.changes)
+                if generation > after_generation]
+
+    def get_index_object(self, name):
+        return json.dumps({'entries': self.changes[int(name)]}).encode()
+
+
+def entries(count, seed) -> dict:
+    return {entry['track_id']: entry for entry in iter_index_entries(count, seed=seed)}
+
+
+class DatabaseSyncTest(unittest.TestCase):
+    """
+    DatabaseSyncTest : syncing across a pruned log rebuilds the catalog in place
+    """
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.db_location = os.path.join(self.workdir.name, 'local.db')
+        self.index_location = os.path.join(self.workdir.name, 'audio.json')
+        self.storage = IndexLogStorage(self.workdir.name)
+        self.storage.publish_base(entries(10, seed=1), generation=1)
+        self.db = Database(self.db_location, self.index_location, self.storage)
+
+    def tearDown(self):
+        self.db.close()
+        self.workdir.cleanup()
+
+    def test_sync_applies_changes(self):
+        added = entries(3, seed=2)
+        self.storage.changes[2] = added
+        report = self.db.sync()
+        self.assertEqual((report.generation, report.added), (2, 3))
+        self.assertEqual(self.db.count_tracks(), 13)
+
+    def test_rebuild_keeps_media_cache_and_other_connections(self):
+        track_path = os.path.join(self.workdir.name, 'track.mp3')
+        with open(track_path, 'wb') as track:
+            track.write(b'\0' * 100)
+        media_cache = MediaCache(self.db_location)
+        media_cache.record_download(track_path, pinned=True)
+        reader = Database(self.db_location, self.index_location, self.storage)
+        self.addCleanup(reader.close)
+
+        # generations 2 to 5 were compacted into a new base and pruned
+        self.storage.publish_base(entries(20, seed=3), generation=5)
+        self.storage.changes[6] = entries(2, seed=4)
+        report = self.db.sync()
+
+        self.assertEqual(report.generation, 6)
+        self.assertEqual(self.db.count_tracks(), 22)
+        self.assertEqual(reader.count_tracks(), 22)
+        self.assertTrue(self.db.search(self.db.get_tracks_page()[0].artist))
+        self.assertEqual(media_cache.usage(), 100)
+        # and the media cache still writes to the file everyone else reads
+        media_cache.touch(track_path)
+        conn = sqlite3.connect(self.db_location)
+        self.addCleanup(conn.close)
+        self.assertEqual(conn.execute('select count(*) from media_cache').fetchone()[0], 1)
+
+    def test_sync_gives_up_when_the_base_stays_behind(self):
+        # a stale base: rebuilding from it still leaves a gap before the oldest change
+        self.storage.changes = {4: entries(1, seed=5)}
+        with self.assertRaises(SyncError):
+            self.db.sync()
+        self.assertEqual(self.db.count_tracks(), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
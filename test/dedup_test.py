@@ -0,0 +1,174 @@
+"""
+dedup_test.py : link_duplicates against an ingest manifest and a library db
+
+    $ python -m pytest test/dedup_test.py
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+from monty.db import Database
+from monty.dedup import link_duplicates
+from monty.manifest import IngestManifest
+from monty.metadata import Metadata, make_audio_key
+
+FINGERPRINT = 'f' * 32
+
+
+class LinkDuplicatesTest(unittest.TestCase):
+    """
+    LinkDuplicatesTest : duplicates keep their own ids and share the stored audio
+    """
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.manifest = IngestManifest(os.path.join(self.workdir.name, 'manifest.db'))
+
+    def tearDown(self):
+        self.manifest.close()
+        self.workdir.cleanup()
+
+    def make_track(self, name: str, size=100) -> Metadata:
+        path = os.path.join(self.workdir.name, '{}.mp3'.format(name))
+        with open(path, 'wb') as audio:
+            audio.write(b'\0' * size)
+        track = Metadata()
+        track.artist = 'Artist'
+        track.album = 'Album {}'.format(name)
+        track.track_title = 'Track {}'.format(name)
+        track.track_number = 1
+        track.file_path = path
+        track.file_format = 'mp3'
+        track.artist_id = 'artist'
+        track.release_id = 'release-{}'.format(name)
+        track.recording_id = 'recording-{}'.format(name)
+        return track
+
+    def make_library(self, tracks) -> Database:
+        db_location = os.path.join(self.workdir.name, 'local.db')
+        # an empty db file means Database() just connects, leaving init_db to us
+        sqlite3.connect(db_location).close()
+        db = Database(db_location)
+        self.addCleanup(db.close)
+        db.init_db(entries=[{
+            'artist' : track.artist,
+            'album' : track.album,
+            'track_name' : track.track_title,
+            'position' : track.track_number,
+            'path' : track.file_path,
+            'artist_id' : track.artist_id,
+            'release_id' : track.release_id,
+            'track_id' : track.recording_id,
+            'file_format' : track.file_format,
+            'fingerprint' : FINGERPRINT,
+            'audio_key' : track.audio_key,
+        } for track in tracks])
+        return db
+
+    def test_duplicates_in_one_run(self):
+        original, duplicate, other, unreadable = (self.make_track(name, size)
+                                                  for name, size in (('a', 100), ('b', 200),
+                                                                     ('c', 300), ('d', 400)))
+        fingerprints = {original.file_path: FINGERPRINT, duplicate.file_path: FINGERPRINT,
+                        other.file_path: 'c' * 32, unreadable.file_path: None}
+        to_store, report = link_duplicates([original, duplicate, other, unreadable],
+                                           fingerprints, self.manifest)
+        self.assertEqual(to_store, [original, other, unreadable])
+        self.assertEqual(report.linked, [duplicate])
+        self.assertEqual((report.relinked, report.bytes_saved), (1, 200))
+        # the duplicate is still its own track, with the original's audio
+        self.assertEqual((duplicate.release_id, duplicate.recording_id),
+                         ('release-b', 'recording-b'))
+        self.assertEqual(duplicate.audio_key, make_audio_key('artist', 'release-a',
+                                                              'recording-a', 'mp3'))
+        self.assertEqual(duplicate.get_local_path(), original.get_local_path())
+        self.assertEqual(duplicate.audio_ids, ('artist', 'release-a', 'recording-a', 'mp3'))
+        self.assertIsNone(original.audio_key)
+
+    def test_duplicates_of_earlier_ingests(self):
+        original, duplicate = self.make_track('a'), self.make_track('b')
+        link_duplicates([original, duplicate], {original.file_path: FINGERPRINT,
+                                                duplicate.file_path: FINGERPRINT}, self.manifest)
+        self.manifest.record([original, duplicate], {original.file_path: FINGERPRINT,
+                                                     duplicate.file_path: FINGERPRINT})
+        # a third copy links to the stored audio, whichever copy the manifest finds
+        later = self.make_track('c')
+        to_store, report = link_duplicates([later], {later.file_path: FINGERPRINT},
+                                           self.manifest)
+        self.assertEqual((to_store, report.linked), ([], [later]))
+        self.assertEqual(later.get_audio_key(), original.get_audio_key())
+        self.assertEqual(later.recording_id, 'recording-c')
+
+    def test_retagged_recording_is_stored_again(self):
+        original = self.make_track('a')
+        self.manifest.record([original], {original.file_path: FINGERPRINT})
+        retagged = self.make_track('a')
+        retagged.track_title = 'Retitled'
+        to_store, report = link_duplicates([retagged], {retagged.file_path: FINGERPRINT},
+                                           self.manifest)
+        # its own stored audio isn't a duplicate of it
+        self.assertEqual((to_store, report.linked), ([retagged], []))
+        self.assertIsNone(retagged.audio_key)
+
+    def test_full_reingest_stores_tracks_already_in_the_library(self):
+        original, duplicate = self.make_track('a'), self.make_track('b')
+        duplicate.audio_key = original.get_audio_key()
+        db = self.make_library([original, duplicate])
+        # --full clears the manifest, so only the db has the tracks' own rows
+        original, duplicate = self.make_track('a'), self.make_track('b')
+        to_store, report = link_duplicates([original, duplicate],
+                                           {original.file_path: FINGERPRINT,
+                                            duplicate.file_path: FINGERPRINT},
+                                           self.manifest, db)
+        self.assertEqual((to_store, report.linked), ([original], [duplicate]))
+        self.assertIsNone(original.audio_key)
+        self.assertEqual(duplicate.audio_key, original.get_audio_key())
+
+    def test_duplicates_of_the_library(self):
+        original, duplicate = self.make_track('a'), self.make_track('b')
+        duplicate.audio_key = original.get_audio_key()
+        db = self.make_library([original, duplicate])
+        rows = [db.get_track('recording-a'), db.get_track('recording-b')]
+        self.assertEqual([row.release_id for row in rows], ['release-a', 'release-b'])
+        self.assertEqual(rows[1].get_local_path(), original.get_local_path())
+        self.assertEqual(rows[1].get_remote_path(), original.get_remote_path())
+        # linked tracks aren't stored, so they aren't reported as wasted copies
+        self.assertEqual(db.get_duplicates(), [])
+
+        later = self.make_track('c')
+        to_store, _ = link_duplicates([later], {later.file_path: FINGERPRINT},
+                                      self.manifest, db)
+        self.assertEqual(to_store, [])
+        self.assertEqual(later.audio_key, original.get_audio_key())
+
+    def test_older_dbs_get_the_audio_key_column(self):
+        db_location = os.path.join(self.workdir.name, 'old.db')
+        conn = sqlite3.connect(db_location)
+        with conn:
+            conn.execute("""
+            create table audio_tracks
+                (artist varchar, album varchar, track_title varchar, track_number int,
+                 file_path varchar, artist_id varchar, release_id varchar,
+                 track_id varchar primary key, file_format varchar)
+            """)
+            conn.execute("""
+            insert into audio_tracks values
+                ('Artist', 'Album', 'Track', 1, '', 'artist', 'release', 'recording', 'mp3')
+            """)
+        conn.close()
+        db = Database(db_location)
+        self.addCleanup(db.close)
+        track = db.get_track('recording')
+        self.assertIsNone(track.audio_key)
+        self.assertTrue(track.get_local_path().endswith(os.path.join(
+            'artist', 'release', 'recording.mp3')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""
+indexlog_test.py : publishing segments while another ingest publishes and compacts
+
+    $ python -m pytest test/indexlog_test.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+import monty.config as config
+from bench.synthetic import iter_index_entries
+from monty.bucket import DirectoryBlob, DirectoryBucket
+from monty.indexlog import compact, get_base_generation, list_segments, publish_segment
+
+CONFLICT_ERRORS = (FileExistsError,)
+
+
+class InterleavingBlob(DirectoryBlob):
+    """
+    InterleavingBlob : runs the bucket's before_create hook ahead of a create-only upload
+    """
+
+    def upload_from_string(self, data, if_generation_match=None):
+        hook, self.bucket.before_create = self.bucket.before_create, None
+        if hook is not None and if_generation_match == 0:
+            hook()
+        super().upload_from_string(data, if_generation_match)
+
+
+class InterleavingBucket(DirectoryBucket):
+    """
+    InterleavingBucket : a DirectoryBucket where something else can happen just before
+    the next segment is created
+    """
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.before_create = None
+
+    def blob(self, blob_name):
+        return InterleavingBlob(blob_name, self)
+
+
+def entries(count, seed) -> dict:
+    return {entry['track_id']: entry for entry in iter_index_entries(count, seed=seed)}
+
+
+def published_track_ids(bucket) -> set:
+    """
+    published_track_ids : the track ids a reader sees: the base, then newer segments
+    """
+    track_ids = set()
+    base = bucket.get_blob(config.AUDIO_INDEX_OBJECT)
+    if base is not None:
+        track_ids.update(json.loads(base.download_as_string()))
+    for _, blob in list_segments(bucket, get_base_generation(bucket)):
+        track_ids.update(json.loads(blob.download_as_string())['entries'])
+    return track_ids
+
+
+class PublishSegmentTest(unittest.TestCase):
+    """
+    PublishSegmentTest : a segment is never lost to a compaction running alongside it
+    """
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.bucket = InterleavingBucket(self.workdir.name)
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_concurrent_publishes_take_new_generations(self):
+        first, second = entries(3, seed=1), entries(3, seed=2)
+
+        def other_ingest():
+            publish_segment(self.bucket, first, CONFLICT_ERRORS)
+
+        self.bucket.before_create = other_ingest
+        self.assertEqual(publish_segment(self.bucket, second, CONFLICT_ERRORS), 2)
+        self.assertEqual(published_track_ids(self.bucket), set(first) | set(second))
+
+    def test_publish_racing_a_pruning_compaction(self):
+        publish_segment(self.bucket, entries(2, seed=1), CONFLICT_ERRORS)
+        compact(self.bucket, prune=True)
+        other, ours = entries(3, seed=2), entries(3, seed=3)
+
+        def other_ingest_then_compaction():
+            # takes the generation we picked, then it's folded into the base and pruned
+            publish_segment(self.bucket, other, CONFLICT_ERRORS)
+            compact(self.bucket, prune=True)
+
+        self.bucket.before_create = other_ingest_then_compaction
+        generation = publish_segment(self.bucket, ours, CONFLICT_ERRORS)
+        self.assertGreater(generation, get_base_generation(self.bucket))
+        self.assertTrue(set(ours) <= published_track_ids(self.bucket))
+        self.assertTrue(set(other) <= published_track_ids(self.bucket))
+
+    def test_publish_after_a_compaction_skips_folded_generations(self):
+        for seed in range(3):
+            publish_segment(self.bucket, entries(1, seed=seed), CONFLICT_ERRORS)
+        compact(self.bucket, prune=True)
+        self.assertEqual(publish_segment(self.bucket, entries(1, seed=9), CONFLICT_ERRORS), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
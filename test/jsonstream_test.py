@@ -0,0 +1,67 @@
+"""
+jsonstream_test.py : iter_object_items against json.load, with chunk boundaries everywhere
+
+    $ python -m pytest test/jsonstream_test.py
+"""
+
+import io
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+from bench.synthetic import iter_index_entries
+from monty.util.jsonstream import iter_object_items
+
+
+def index_text(track_count: int) -> str:
+    """
+    index_text : an audio.json for track_count tracks, with some numbers that have
+    fractions and exponents for the chunk boundaries to land in
+    """
+    index = {}
+    for i, entry in enumerate(iter_index_entries(track_count)):
+        entry['duration'] = 183.5 + i / 8
+        entry['gain'] = -6.02e-3 * (i + 1)
+        entry['fingerprint'] = None if i % 2 else '{:032x}'.format(i)
+        index[entry['track_id']] = entry
+    return json.dumps(index, ensure_ascii=False)
+
+
+class IterObjectItemsTest(unittest.TestCase):
+    """
+    IterObjectItemsTest : the streamed members are the ones json.load sees
+    """
+
+    def assert_streams(self, text: str, chunk_sizes):
+        expected = list(json.loads(text).items())
+        for chunk_size in chunk_sizes:
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(iter_object_items(io.StringIO(text), chunk_size)),
+                                 expected)
+
+    def test_index_in_small_chunks(self):
+        self.assert_streams(index_text(24), range(1, 40))
+
+    def test_index_in_big_chunks(self):
+        self.assert_streams(index_text(500), (4096, 64 * 1024))
+
+    def test_numbers_split_after_point_or_exponent(self):
+        for text in ('{"b": 1.5}', '{"b": 1e5, "c": 2}', '{"b": -2.5E-3}', '{"b": 12}'):
+            self.assert_streams(text, range(1, len(text) + 1))
+
+    def test_literals_and_empty_object(self):
+        self.assert_streams('{"a": true, "b": false, "c": null, "d": []}', range(1, 8))
+        self.assert_streams(' {} ', range(1, 4))
+
+    def test_truncated_json_raises(self):
+        for text in ('{"a": 1', '{"a": 1.', '{"a": '):
+            with self.assertRaises(ValueError):
+                list(iter_object_items(io.StringIO(text), 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
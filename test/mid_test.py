@@ -0,0 +1,149 @@
+"""
+mid_test.py : audio_range and audio_fingerprint, on files tagged a few different ways
+
+    $ python -m pytest test/mid_test.py
+"""
+
+import io
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+from monty.util import mid
+
+AUDIO = bytes(range(256)) * 16
+
+
+def id3v2(body: bytes, footer=False) -> bytes:
+    """
+    id3v2 : an ID3v2 tag around body, with its size as four 7 bit bytes
+    """
+    size = bytes((len(body) >> shift) & 0x7f for shift in (21, 14, 7, 0))
+    flags = 0x10 if footer else 0
+    tag = b'ID3\x04\x00' + bytes((flags,)) + size + body
+    return tag + (b'3DI\x04\x00' + bytes((flags,)) + size if footer else b'')
+
+
+def id3v1(title: bytes) -> bytes:
+    return (b'TAG' + title).ljust(mid.ID3V1_SIZE, b'\0')
+
+
+def ape(items: bytes, header=False) -> bytes:
+    """
+    ape : an APEv2 tag holding items, with a footer and optionally a header
+    """
+    flags = 0x80000000 if header else 0
+    size = len(items) + mid.APE_FOOTER_SIZE
+    block = struct.pack('<III', 2000, size, 1) + struct.pack('<I', flags) + b'\0' * 8
+    head = b'APETAGEX' + block if header else b''
+    return head + items + b'APETAGEX' + block
+
+
+def flac(*blocks: bytes) -> bytes:
+    """
+    flac : the flac marker and metadata blocks, the last one flagged as such
+    """
+    data = b'fLaC'
+    for i, block in enumerate(blocks):
+        last = 0x80 if i == len(blocks) - 1 else 0
+        data += bytes((last,)) + len(block).to_bytes(3, 'big') + block
+    return data
+
+
+def audio_of(data: bytes) -> bytes:
+    audio = mid.audio_range(io.BytesIO(data), len(data))
+    return data[audio[0]:audio[1]] if audio is not None else None
+
+
+class AudioRangeTest(unittest.TestCase):
+    """
+    AudioRangeTest : the range is the audio, whatever tags are around it
+    """
+
+    def test_untagged(self):
+        self.assertEqual(audio_of(AUDIO), AUDIO)
+
+    def test_id3v2(self):
+        self.assertEqual(audio_of(id3v2(b'title') + AUDIO), AUDIO)
+        self.assertEqual(audio_of(id3v2(b'with footer', footer=True) + AUDIO), AUDIO)
+        self.assertEqual(audio_of(id3v2(b'one') + id3v2(b'two') + AUDIO), AUDIO)
+
+    def test_trailing_tags(self):
+        self.assertEqual(audio_of(AUDIO + id3v1(b'title')), AUDIO)
+        self.assertEqual(audio_of(AUDIO + ape(b'items')), AUDIO)
+        self.assertEqual(audio_of(AUDIO + ape(b'items', header=True)), AUDIO)
+        self.assertEqual(audio_of(AUDIO + ape(b'items') + id3v1(b'title')), AUDIO)
+        self.assertEqual(audio_of(id3v2(b'title') + AUDIO + id3v1(b'title')), AUDIO)
+
+    def test_flac(self):
+        streaminfo = b'\0' * 34
+        self.assertEqual(audio_of(flac(streaminfo) + AUDIO), AUDIO)
+        self.assertEqual(audio_of(id3v2(b'title') + flac(streaminfo, b'comments') + AUDIO),
+                         AUDIO)
+
+    def test_tags_that_dont_add_up_have_no_range(self):
+        oversized_id3v2 = b'ID3\x04\x00\x00\x7f\x7f\x7f\x7f' + AUDIO
+        oversized_ape = AUDIO + b'APETAGEX' + struct.pack('<III', 2000, 10 ** 6, 1) + b'\0' * 12
+        oversized_flac = b'fLaC\x80\xff\xff\xff' + AUDIO
+        for data in (oversized_id3v2, oversized_ape, oversized_flac):
+            self.assertIsNone(mid.audio_range(io.BytesIO(data), len(data)))
+
+    def test_too_little_audio_has_no_range(self):
+        data = id3v2(b'title') + AUDIO[:mid.MIN_AUDIO_BYTES - 1] + id3v1(b'title')
+        self.assertIsNone(mid.audio_range(io.BytesIO(data), len(data)))
+        self.assertIsNone(mid.audio_range(io.BytesIO(b''), 0))
+
+
+class AudioFingerprintTest(unittest.TestCase):
+    """
+    AudioFingerprintTest : retagged copies match, unreadable files match nothing
+    """
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.hash_cache = mid.HashCache(os.path.join(self.workdir.name, 'hashes.db'))
+
+    def tearDown(self):
+        self.hash_cache.close()
+        self.workdir.cleanup()
+
+    def write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.workdir.name, name)
+        with open(path, 'wb') as audio:
+            audio.write(data)
+        return path
+
+    def test_retagged_copies_share_a_fingerprint(self):
+        paths = [self.write('a.mp3', id3v2(b'one') + AUDIO),
+                 self.write('b.mp3', AUDIO + id3v1(b'two')),
+                 self.write('c.mp3', id3v2(b'three') + AUDIO + ape(b'four'))]
+        fingerprints = mid.audio_fingerprints(paths, self.hash_cache)
+        self.assertEqual(len(set(fingerprints.values())), 1)
+        # and the same again from the cache
+        self.assertEqual(mid.audio_fingerprints(paths, self.hash_cache), fingerprints)
+
+    def test_uuids_from_many_files(self):
+        paths = [self.write('{}.mp3'.format(i), id3v2(str(i).encode()) + AUDIO)
+                 for i in range(8)]
+        uuids = mid.create_uuids_from_files(paths, self.hash_cache, workers=4)
+        self.assertEqual(uuids, {path: mid.create_uuid_from_file(path) for path in paths})
+        self.assertEqual(len(set(uuids.values())), len(paths))
+        # and the hashes are cached for the next run
+        stat = os.stat(paths[0])
+        self.assertEqual(self.hash_cache.get(stat).hex(), uuids[paths[0]].replace('-', ''))
+
+    def test_unreadable_tags_have_no_fingerprint(self):
+        paths = [self.write('a.mp3', b'ID3\x04\x00\x00\x7f\x7f\x7f\x7f' + AUDIO),
+                 self.write('b.mp3', b'ID3\x04\x00\x00\x7f\x7f\x7f\x7e' + AUDIO)]
+        self.assertEqual(mid.audio_fingerprints(paths, self.hash_cache),
+                         {path: None for path in paths})
+        self.assertIsNone(mid.audio_fingerprint(paths[0], self.hash_cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
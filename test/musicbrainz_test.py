@@ -0,0 +1,171 @@
+"""
+musicbrainz_test.py : MusicBrainzClient and get_musicbrainz_data against a stubbed musicbrainzngs
+
+    $ python -m pytest test/musicbrainz_test.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import musicbrainzngs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+from monty.index import get_musicbrainz_data
+from monty.metadata import Metadata
+from monty.musicbrainz import MusicBrainzClient, NotFound, RequestScheduler, ResponseCache
+
+ARTIST_ID = 'artist-1'
+RELEASE_ID = 'release-1'
+TRACKS = 12
+
+
+class HTTPError(object):
+    """
+    HTTPError : stands in for the urllib error musicbrainzngs wraps in a ResponseError
+    """
+
+    def __init__(self, code):
+        self.code = code
+
+
+class StubMusicBrainz(object):
+    """
+    StubMusicBrainz : the parts of musicbrainzngs that MusicBrainzClient calls, for one
+    artist with one release. counts the calls made, and hands every caller the same
+    release response, the way coalesced lookups do
+    """
+
+    ResponseError = musicbrainzngs.ResponseError
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+        positions = list(range(1, TRACKS + 1))
+        positions.reverse()
+        self.release = {'release': {'medium-list': [{'track-list': [
+            {'position': str(position), 'recording': {'id': 'recording-{}'.format(position)}}
+            for position in positions]}]}}
+
+    def _called(self, endpoint, *args):
+        with self._lock:
+            self.calls.append((endpoint,) + args)
+        time.sleep(self.delay)
+
+    def search_artists(self, artist):
+        self._called('search_artists', artist)
+        if artist != 'Artist':
+            return {'artist-list': []}
+        return {'artist-list': [{'id': ARTIST_ID, 'ext:score': '100'}]}
+
+    def search_release_groups(self, query):
+        self._called('search_release_groups', query)
+        return {'release-group-list': [{
+            'ext:score': '100',
+            'artist-credit': [{'artist': {'id': ARTIST_ID}}],
+            'release-list': [{'id': RELEASE_ID}],
+        }]}
+
+    def get_release_by_id(self, release_id, includes=None):
+        self._called('get_release_by_id', release_id)
+        if release_id != RELEASE_ID:
+            raise musicbrainzngs.ResponseError(cause=HTTPError(404))
+        return self.release
+
+
+class MusicBrainzTest(unittest.TestCase):
+    """
+    MusicBrainzTest : caching, coalescing and id lookups, with no network
+    """
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.stub = StubMusicBrainz()
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def make_client(self, stub=None):
+        cache = ResponseCache(os.path.join(self.workdir.name, 'musicbrainz.db'))
+        self.addCleanup(cache.close)
+        return MusicBrainzClient(cache, RequestScheduler(interval=0), stub or self.stub)
+
+    def make_track(self, number, artist='Artist'):
+        path = os.path.join(self.workdir.name, '{}-{}.mp3'.format(artist, number))
+        with open(path, 'wb') as audio:
+            audio.write('{} {}'.format(artist, number).encode())
+        metadata = Metadata()
+        metadata.artist = artist
+        metadata.album = 'Album'
+        metadata.track_title = 'Track {}'.format(number)
+        metadata.track_number = number
+        metadata.file_path = path
+        return metadata
+
+    def test_responses_are_cached(self):
+        client = self.make_client()
+        client.search_artists('Artist')
+        client.search_artists('Artist')
+        self.assertEqual(len(self.stub.calls), 1)
+        self.assertEqual((client.hits, client.misses), (1, 1))
+        # and survive the client, in the cache file
+        self.make_client().search_artists('Artist')
+        self.assertEqual(len(self.stub.calls), 1)
+
+    def test_not_found_is_cached(self):
+        client = self.make_client()
+        for _ in range(2):
+            with self.assertRaises(NotFound):
+                client.get_release_by_id('missing')
+        self.assertEqual(len(self.stub.calls), 1)
+
+    def test_expired_responses_are_fetched_again(self):
+        client = self.make_client()
+        client.cache.ttls = {'search_artists': 0}
+        client.search_artists('Artist')
+        time.sleep(0.01)
+        client.search_artists('Artist')
+        self.assertEqual(len(self.stub.calls), 2)
+
+    def test_identical_lookups_in_flight_are_coalesced(self):
+        client = self.make_client(StubMusicBrainz(delay=0.2))
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(lambda _: client.search_artists('Artist'), range(4)))
+        self.assertEqual(len(client.mb.calls), 1)
+
+    def test_scheduler_spaces_requests(self):
+        scheduler = RequestScheduler(interval=0.05)
+        start = time.monotonic()
+        for key in range(4):
+            scheduler.call(key, lambda: None)
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+    def test_tracks_get_recording_ids_concurrently(self):
+        client = self.make_client(StubMusicBrainz(delay=0.01))
+        get_track_data = get_musicbrainz_data(client=client)
+        tracks = [self.make_track(number) for number in range(1, TRACKS + 1)]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            tracks = list(pool.map(get_track_data, tracks))
+        for track in tracks:
+            self.assertEqual(track.artist_id, ARTIST_ID)
+            self.assertEqual(track.release_id, RELEASE_ID)
+            self.assertEqual(track.recording_id, 'recording-{}'.format(track.track_number))
+        # the shared response is left as it came
+        track_list = client.mb.release['release']['medium-list'][0]['track-list']
+        self.assertEqual(track_list[0]['position'], str(TRACKS))
+
+    def test_unknown_artist_gets_ids_from_names_and_file(self):
+        track = get_musicbrainz_data(client=self.make_client())(self.make_track(1, 'Nobody'))
+        self.assertTrue(track.artist_id and track.release_id and track.recording_id)
+        self.assertNotEqual(track.recording_id, 'recording-1')
+
+
+if __name__ == '__main__':
+    unittest.main()
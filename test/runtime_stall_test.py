@@ -0,0 +1,303 @@
+"""
+runtime_stall_test.py : measure how long the tk main loop stalls while downloads run
+
+    $ python test/runtime_stall_test.py
+
+a ticker on the tk main loop asks to run every TICK_MS. how late each tick runs is
+how long the gui was unable to respond. this is measured while DOWNLOADS slow
+downloads run the way launch_player used to run them (run_until_complete on the
+gui thread), and then through monty.runtime.Runtime. it's measured with tk when
+there's a display, and always with FakeRoot, a stand-in for tk's main loop
+
+the rest of Runtime (submit, run_blocking, post and poll) is tested against FakeRoot
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+import tkinter as tk
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from monty.runtime import Runtime # pylint: disable=wrong-import-position
+
+TICK_MS = 10
+DOWNLOADS = 4
+DOWNLOAD_SECONDS = 0.5
+
+
+class SlowStorage(object):
+    """
+    SlowStorage : storage whose downloads block for a while, like a slow network would
+    """
+
+    async def get_recording(self, *_):
+        await asyncio.get_event_loop().run_in_executor(None, time.sleep, DOWNLOAD_SECONDS)
+
+
+class FakeRoot(object):
+    """
+    FakeRoot : the parts of a tk root that Runtime and StallMeter use. mainloop runs
+    the callbacks given to after() on the calling thread, in order, at their due times
+    """
+
+    def __init__(self):
+        self._jobs = []
+        self._ids = itertools.count()
+        self._cancelled = set()
+        self._quit = False
+
+    def after(self, ms, func):
+        job = next(self._ids)
+        heapq.heappush(self._jobs, (time.perf_counter() + ms / 1000, job, func))
+        return job
+
+    def after_cancel(self, job):
+        self._cancelled.add(job)
+
+    def quit(self):
+        self._quit = True
+
+    def mainloop(self):
+        self._quit = False
+        while self._jobs and not self._quit:
+            due, job, func = heapq.heappop(self._jobs)
+            if job in self._cancelled:
+                continue
+            time.sleep(max(0.0, due - time.perf_counter()))
+            func()
+
+    def destroy(self):
+        self._jobs = []
+
+
+class StallMeter(object):
+    """
+    StallMeter : record how late each tick of the tk main loop is
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.stalls = []
+        self._expected = None
+        self._job = None
+
+    def start(self):
+        self._expected = time.perf_counter() + TICK_MS / 1000
+        self._job = self.root.after(TICK_MS, self.tick)
+
+    def tick(self):
+        now = time.perf_counter()
+        self.stalls.append(max(0.0, now - self._expected) * 1000)
+        self._expected = now + TICK_MS / 1000
+        self._job = self.root.after(TICK_MS, self.tick)
+
+    def stop(self):
+        self.root.after_cancel(self._job)
+
+    def worst(self):
+        return max(self.stalls) if self.stalls else 0.0
+
+
+def measure(root, start_downloads, until_done):
+    """
+    measure : run the main loop, starting downloads once it's going, until they're done
+    returns the worst stall in ms
+    """
+    meter = StallMeter(root)
+    meter.start()
+
+    def check():
+        if until_done():
+            meter.stop()
+            root.quit()
+        else:
+            root.after(TICK_MS, check)
+
+    root.after(50, start_downloads)
+    root.after(100, check)
+    root.mainloop()
+    return meter.worst()
+
+
+class StallTests(object):
+    """
+    StallTests : the gui keeps responding while downloads run on the runtime.
+    subclasses make the root whose main loop is measured
+    """
+
+    def make_root(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.root = self.make_root()
+        self.storage = SlowStorage()
+
+    def tearDown(self):
+        self.root.destroy()
+
+    def test_blocking_downloads_stall(self):
+        done = []
+
+        def start_downloads():
+            loop = asyncio.new_event_loop()
+            for _ in range(DOWNLOADS):
+                loop.run_until_complete(self.storage.get_recording())
+                done.append(True)
+            loop.close()
+
+        worst = measure(self.root, start_downloads, lambda: len(done) == DOWNLOADS)
+        print('blocking: worst stall {:.1f}ms'.format(worst))
+        self.assertGreater(worst, DOWNLOADS * DOWNLOAD_SECONDS * 1000 * 0.9)
+
+    def test_runtime_downloads_dont_stall(self):
+        runtime = Runtime()
+        runtime.start(self.root)
+        done = []
+
+        def start_downloads():
+            for _ in range(DOWNLOADS):
+                runtime.submit(self.storage.get_recording(), done.append)
+
+        started = time.perf_counter()
+        worst = measure(self.root, start_downloads, lambda: len(done) == DOWNLOADS)
+        elapsed = time.perf_counter() - started
+        runtime.stop()
+        print('runtime: worst stall {:.1f}ms, {} downloads in {:.2f}s'.format(
+            worst, DOWNLOADS, elapsed))
+        self.assertLess(worst, 50)
+        # and they ran at the same time, not one after another
+        self.assertLess(elapsed, DOWNLOADS * DOWNLOAD_SECONDS)
+
+
+
+@unittest.skipUnless(os.environ.get('DISPLAY'), 'needs a display to run tk')
+class RuntimeStallTest(StallTests, unittest.TestCase):
+    """
+    RuntimeStallTest : stalls of the tk main loop
+    """
+
+    def make_root(self):
+        root = tk.Tk()
+        root.withdraw()
+        return root
+
+
+class HeadlessRuntimeStallTest(StallTests, unittest.TestCase):
+    """
+    HeadlessRuntimeStallTest : stalls of FakeRoot's main loop, which needs no display
+    """
+
+    def make_root(self):
+        return FakeRoot()
+
+
+class RuntimeTest(unittest.TestCase):
+    """
+    RuntimeTest : results get from the event loop thread to the gui thread
+    """
+
+    def setUp(self):
+        self.root = FakeRoot()
+        self.runtime = Runtime(poll_interval=5)
+        self.runtime.start(self.root)
+        self.gui_thread = threading.get_ident()
+        self.calls = []
+
+    def tearDown(self):
+        self.runtime.stop()
+
+    def record(self, name):
+        def callback(*args):
+            self.calls.append((name, args, threading.get_ident()))
+        return callback
+
+    def run_until(self, done, timeout=5):
+        """
+        run_until : run the fake main loop until done() or timeout seconds have passed
+        """
+        deadline = time.perf_counter() + timeout
+
+        def check():
+            if done() or time.perf_counter() > deadline:
+                self.root.quit()
+            else:
+                self.root.after(5, check)
+
+        self.root.after(5, check)
+        self.root.mainloop()
+        self.assertTrue(done(), 'timed out')
+
+    def test_results_are_delivered_on_the_gui_thread(self):
+        async def answer():
+            await asyncio.sleep(0.01)
+            return threading.get_ident()
+
+        self.runtime.submit(answer(), self.record('done'), self.record('error'))
+        self.run_until(lambda: self.calls)
+        [(name, (loop_thread,), thread)] = self.calls
+        self.assertEqual(name, 'done')
+        self.assertEqual(thread, self.gui_thread)
+        self.assertNotEqual(loop_thread, self.gui_thread)
+
+    def test_errors_are_delivered_on_the_gui_thread(self):
+        async def fail():
+            raise ValueError('nope')
+
+        self.runtime.submit(fail(), self.record('done'), self.record('error'))
+        self.run_until(lambda: self.calls)
+        [(name, (error,), thread)] = self.calls
+        self.assertEqual(name, 'error')
+        self.assertIsInstance(error, ValueError)
+        self.assertEqual(thread, self.gui_thread)
+
+    def test_cancelled_coroutines_call_neither(self):
+        future = self.runtime.submit(asyncio.sleep(10), self.record('done'),
+                                     self.record('error'))
+        future.cancel()
+        self.runtime.submit(asyncio.sleep(0.01), self.record('later'))
+        self.run_until(lambda: self.calls)
+        self.assertEqual([call[0] for call in self.calls], ['later'])
+
+    def test_run_blocking_runs_off_both_threads(self):
+        self.runtime.run_blocking(threading.get_ident, on_done=self.record('done'))
+        self.run_until(lambda: self.calls)
+        [(_, (worker_thread,), thread)] = self.calls
+        self.assertEqual(thread, self.gui_thread)
+        self.assertNotEqual(worker_thread, self.gui_thread)
+        self.assertNotEqual(worker_thread, self.runtime._thread.ident)
+
+    def test_posts_from_any_thread_are_run_in_order(self):
+        def post_from_thread():
+            for i in range(3):
+                self.runtime.post(self.record('post'), i)
+
+        thread = threading.Thread(target=post_from_thread)
+        thread.start()
+        thread.join()
+        self.run_until(lambda: len(self.calls) == 3)
+        self.assertEqual([call[1] for call in self.calls], [(0,), (1,), (2,)])
+        self.assertTrue(all(call[2] == self.gui_thread for call in self.calls))
+
+    def test_a_failing_callback_doesnt_stop_the_rest(self):
+        def fail():
+            raise RuntimeError('bad callback')
+
+        self.runtime.post(fail)
+        self.runtime.post(self.record('after'))
+        self.run_until(lambda: self.calls)
+        self.assertEqual(self.calls[0][0], 'after')
+
+    def test_stop_cancels_whatever_is_running(self):
+        future = self.runtime.submit(asyncio.sleep(10))
+        self.runtime.stop()
+        self.assertTrue(future.cancelled())
+
+
+if __name__ == '__main__':
+    unittest.main()
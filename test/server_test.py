@@ -0,0 +1,216 @@
+"""
+server_test.py : the request helpers in monty.server, and HEAD over keep-alive
+
+    $ python -m pytest test/server_test.py
+"""
+
+import asyncio
+import email.utils
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from http import HTTPStatus
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+from bench.init_db import OfflineStorage
+from bench.synthetic import write_index
+from monty.db import Database
+from monty.server import (HTTPError, MediaServer, decode_cursor, encode_cursor,
+                          if_range_matches, not_modified, parse_range)
+
+ETAG = '"1f4-16b2"'
+MTIME = 1500000000.0
+
+
+def http_date(timestamp: float) -> str:
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+class ParseRangeTest(unittest.TestCase):
+    """
+    ParseRangeTest : single byte ranges, clamped to the file
+    """
+
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=500-', 1000), (500, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range(' bytes=10-10 ', 1000), (10, 10))
+
+    def test_ranges_are_clamped(self):
+        self.assertEqual(parse_range('bytes=900-5000', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+
+    def test_unhandled_ranges_mean_the_whole_file(self):
+        for header in ('bytes=0-1,5-6', 'items=0-1', 'bytes=-', 'bytes=a-b'):
+            self.assertIsNone(parse_range(header, 1000), header)
+
+    def test_unsatisfiable_ranges(self):
+        for header in ('bytes=1000-', 'bytes=5-4', 'bytes=-0', 'bytes=0-'):
+            size = 0 if header == 'bytes=0-' else 1000
+            with self.assertRaises(HTTPError) as raised:
+                parse_range(header, size)
+            self.assertEqual(raised.exception.status, HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.assertEqual(raised.exception.headers['Content-Range'], 'bytes */{}'.format(size))
+
+
+class ConditionalTest(unittest.TestCase):
+    """
+    ConditionalTest : If-None-Match, If-Modified-Since and If-Range
+    """
+
+    def test_if_none_match(self):
+        self.assertTrue(not_modified({'if-none-match': ETAG}, ETAG, MTIME))
+        self.assertTrue(not_modified({'if-none-match': '"x", ' + ETAG}, ETAG, MTIME))
+        self.assertTrue(not_modified({'if-none-match': 'W/' + ETAG}, ETAG, MTIME))
+        self.assertTrue(not_modified({'if-none-match': '*'}, ETAG, MTIME))
+        self.assertFalse(not_modified({'if-none-match': '"other"'}, ETAG, MTIME))
+
+    def test_if_modified_since(self):
+        self.assertTrue(not_modified({'if-modified-since': http_date(MTIME)}, ETAG, MTIME + 0.5))
+        self.assertFalse(not_modified({'if-modified-since': http_date(MTIME - 1)}, ETAG, MTIME))
+        self.assertFalse(not_modified({'if-modified-since': 'not a date'}, ETAG, MTIME))
+        self.assertFalse(not_modified({}, ETAG, MTIME))
+
+    def test_if_none_match_wins(self):
+        headers = {'if-none-match': '"other"', 'if-modified-since': http_date(MTIME)}
+        self.assertFalse(not_modified(headers, ETAG, MTIME))
+
+    def test_if_range(self):
+        self.assertTrue(if_range_matches(None, ETAG, MTIME))
+        self.assertTrue(if_range_matches(ETAG, ETAG, MTIME))
+        self.assertFalse(if_range_matches('"other"', ETAG, MTIME))
+        self.assertFalse(if_range_matches('W/' + ETAG, ETAG, MTIME))
+        self.assertTrue(if_range_matches(http_date(MTIME), ETAG, MTIME))
+        self.assertFalse(if_range_matches(http_date(MTIME - 60), ETAG, MTIME))
+
+
+class CursorTest(unittest.TestCase):
+    """
+    CursorTest : track keys survive a round trip through a cursor, and bad cursors are a 400
+    """
+
+    def test_round_trip(self):
+        key = ('Ärtist "quoted"', 'Album/with?chars', 7, 1234)
+        cursor = encode_cursor(key)
+        self.assertRegex(cursor, r'^[A-Za-z0-9_=-]+$')
+        self.assertEqual(decode_cursor(cursor), key)
+
+    def test_bad_cursors(self):
+        for cursor in ('not base64!', encode_cursor([1, 2, 3]), encode_cursor({'a': 1}), 'é'):
+            with self.assertRaises(HTTPError) as raised:
+                decode_cursor(cursor)
+            self.assertEqual(raised.exception.status, HTTPStatus.BAD_REQUEST)
+
+
+class KeepAliveTest(unittest.TestCase):
+    """
+    KeepAliveTest : responses on one connection stay in step
+    """
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        index_location = os.path.join(self.workdir.name, 'audio.json')
+        write_index(index_location, 20)
+        self.db = Database(os.path.join(self.workdir.name, 'local.db'), index_location,
+                           OfflineStorage())
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.db.close()
+        self.workdir.cleanup()
+
+    async def exchange(self, requests):
+        """
+        exchange : make requests on one connection, returning (status, headers, body)
+        for each. bodies are read up to Content-Length, except for HEAD requests
+        """
+        server = MediaServer(self.db, '127.0.0.1', 0)
+        listening = await server.start()
+        port = listening.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        responses = []
+        try:
+            for method, path in requests:
+                writer.write('{} {} HTTP/1.1\r\nHost: localhost\r\n\r\n'.format(
+                    method, path).encode())
+                status = int((await reader.readline()).split()[1])
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode()
+                    if line == '\r\n':
+                        break
+                    name, _, value = line.partition(':')
+                    headers[name.lower()] = value.strip()
+                body = b''
+                if method != 'HEAD':
+                    body = await reader.readexactly(int(headers['content-length']))
+                responses.append((status, headers, body))
+            # nothing left over on the connection
+            writer.write_eof()
+            responses.append(await reader.read())
+        finally:
+            writer.close()
+            server.close()
+        return responses
+
+    async def raw_exchange(self, data: bytes) -> bytes:
+        """
+        raw_exchange : send data on one connection, and return everything that comes
+        back before the server closes it
+        """
+        server = MediaServer(self.db, '127.0.0.1', 0)
+        listening = await server.start()
+        port = listening.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            writer.write(data)
+            return await asyncio.wait_for(reader.read(), 5)
+        finally:
+            writer.close()
+            server.close()
+
+    def test_head_errors_have_no_body(self):
+        *responses, leftover = self.loop.run_until_complete(self.exchange(
+            [('HEAD', '/tracks/abc'), ('HEAD', '/tracks'), ('GET', '/tracks/abc'),
+             ('GET', '/tracks?limit=2')]))
+        self.assertEqual([status for status, _, _ in responses], [404, 200, 404, 200])
+        head_error, head_list, get_error, get_list = responses
+        self.assertEqual(head_error[1]['content-length'], get_error[1]['content-length'])
+        self.assertEqual(head_list[2], b'')
+        self.assertIn(b'"error"', get_error[2])
+        self.assertIn(b'"tracks"', get_list[2])
+        self.assertEqual(leftover, b'')
+
+    def test_unexpected_errors_are_a_500(self):
+        with mock.patch.object(self.db, 'get_track', side_effect=sqlite3.OperationalError), \
+                self.assertLogs('monty.server', 'ERROR'):
+            response = self.loop.run_until_complete(self.raw_exchange(
+                b'GET /tracks/abc HTTP/1.1\r\n\r\nGET /tracks HTTP/1.1\r\n\r\n'))
+        self.assertTrue(response.startswith(b'HTTP/1.1 500 '))
+        self.assertIn(b'Connection: close', response)
+        # and the connection was closed rather than answering the second request
+        self.assertEqual(response.count(b'HTTP/1.1 '), 1)
+
+    def test_requests_with_bodies_close_the_connection(self):
+        body = b'GET /tracks HTTP/1.1\r\n\r\n'
+        response = self.loop.run_until_complete(self.raw_exchange(
+            b'POST /tracks HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % len(body) + body))
+        self.assertTrue(response.startswith(b'HTTP/1.1 405 '))
+        self.assertIn(b'Connection: close', response)
+        self.assertEqual(response.count(b'HTTP/1.1 '), 1)
+
+    def test_oversized_headers(self):
+        response = self.loop.run_until_complete(self.raw_exchange(
+            b'GET /tracks HTTP/1.1\r\nX-Big: ' + b'a' * 128 * 1024 + b'\r\n\r\n'))
+        self.assertTrue(response.startswith(b'HTTP/1.1 431 '), response[:40])
+
+
+if __name__ == '__main__':
+    unittest.main()
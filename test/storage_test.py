@@ -0,0 +1,207 @@
+"""
+storage_test.py : downloads from a LocalDirectoryStorage, with several at once, and
+bulk downloads sharing it with a cold track
+
+    $ python -m pytest test/storage_test.py
+"""
+
+import asyncio
+import glob
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+import monty.config as config
+from monty.bucket import DirectoryBlob
+from monty.cloud import LocalDirectoryStorage
+from monty.download import BulkDownload
+from monty.metadata import TrackRow
+
+SIZE = 3 * 1024 * 1024 + 17
+RECORDING = ('artist', 'release', 'recording', 'mp3')
+
+
+class StorageTest(unittest.TestCase):
+    """
+    StorageTest : a bucket directory and a MEDIA_DIR to download into
+    """
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.workdir.name, 'bucket')
+        media_dir = mock.patch.object(config, 'MEDIA_DIR', os.path.join(self.workdir.name, 'media'))
+        media_dir.start()
+        self.addCleanup(media_dir.stop)
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def write_recording(self, recording_id, payload):
+        path = os.path.join(self.root, config.CLOUD_STORAGE_PREFIX, 'artist', 'release',
+                            '{}.mp3'.format(recording_id))
+        config.ensure_dir(path)
+        with open(path, 'wb') as recording:
+            recording.write(payload)
+
+    def slow_down(self, download_seconds, ranged_seconds):
+        """
+        slow_down : make whole-object downloads take download_seconds longer, and ranged
+        reads ranged_seconds longer, so that they overlap
+        """
+        download_to_filename = DirectoryBlob.download_to_filename
+        download_to_file = DirectoryBlob.download_to_file
+
+        def slow_download_to_filename(blob, filename):
+            time.sleep(download_seconds)
+            download_to_filename(blob, filename)
+
+        def slow_download_to_file(blob, file_obj, start=None, end=None):
+            time.sleep(ranged_seconds)
+            download_to_file(blob, file_obj, start, end)
+
+        for name, func in (('download_to_filename', slow_download_to_filename),
+                           ('download_to_file', slow_download_to_file)):
+            patch = mock.patch.object(DirectoryBlob, name, func)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def run_loop(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+
+class ConcurrentDownloadTest(StorageTest):
+    """
+    ConcurrentDownloadTest : downloads of the same recording don't get in each other's way
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.payload = os.urandom(SIZE)
+        self.write_recording('recording', self.payload)
+        self.storage = LocalDirectoryStorage(self.root, max_concurrency=8)
+        self.addCleanup(self.storage.close)
+        self.local_path = os.path.join(config.MEDIA_DIR, 'artist', 'release', 'recording.mp3')
+        self.slow_down(0.05, 0.05)
+
+    async def download_together(self):
+        async def stream():
+            finished = await self.storage.stream_recording(*RECORDING)
+            await finished
+
+        await asyncio.gather(stream(), *[self.storage.get_recording(*RECORDING)
+                                         for _ in range(4)])
+
+    def test_downloads_of_one_recording_at_once(self):
+        self.run_loop(self.download_together())
+        with open(self.local_path, 'rb') as recording:
+            self.assertEqual(recording.read(), self.payload)
+        self.assertEqual(glob.glob(self.local_path + '*.part'), [])
+        self.assertEqual(self.storage.stats.summary()['download']['requests'], 4)
+
+    def test_failed_streams_are_logged(self):
+        download_to_file = DirectoryBlob.download_to_file
+
+        def fail_after_the_lead(blob, file_obj, start=None, end=None):
+            if start:
+                raise ConnectionError('lost the connection')
+            download_to_file(blob, file_obj, start, end)
+
+        async def stream_and_forget():
+            finished = await self.storage.stream_recording(*RECORDING)
+            # nothing awaits it, it just finishes
+            await asyncio.wait([finished])
+
+        with mock.patch.object(DirectoryBlob, 'download_to_file', fail_after_the_lead), \
+                self.assertLogs('monty.cloud', 'ERROR') as logs:
+            self.run_loop(stream_and_forget())
+        self.assertEqual(len(logs.records), 1)
+        self.assertIsInstance(logs.records[0].exc_info[1], ConnectionError)
+        self.assertFalse(os.path.exists(self.local_path))
+
+
+class FakeLibrary(object):
+    """
+    FakeLibrary : the one Database method BulkDownload uses, over a list of tracks
+    """
+
+    def __init__(self, tracks):
+        self.tracks = tracks
+
+    def iter_tracks(self, artist_id=None, release_id=None):
+        return iter(self.tracks)
+
+
+class BulkDownloadTest(StorageTest):
+    """
+    BulkDownloadTest : a bulk download leaves room for a cold track to start streaming
+    """
+
+    BULK_TRACKS = 8
+    DOWNLOAD_SECONDS = 0.3
+
+    def setUp(self):
+        super().setUp()
+        tracks = []
+        for i in range(self.BULK_TRACKS):
+            recording_id = 'bulk-{}'.format(i)
+            self.write_recording(recording_id, b'bulk')
+            tracks.append(TrackRow(i, 'Artist', 'Album', 'Track', i + 1, '',
+                                   'artist', 'release', recording_id, 'mp3'))
+        self.write_recording('cold', os.urandom(64 * 1024))
+        self.library = FakeLibrary(tracks)
+        self.storage = LocalDirectoryStorage(self.root, max_concurrency=4)
+        self.addCleanup(self.storage.close)
+        self.slow_down(self.DOWNLOAD_SECONDS, 0.01)
+
+    async def stream_during_bulk(self):
+        bulk = BulkDownload(self.library, self.storage, release_id='release',
+                            workers=self.BULK_TRACKS)
+        running = asyncio.ensure_future(bulk.run())
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        finished = await self.storage.stream_recording('artist', 'release', 'cold', 'mp3')
+        ready = time.perf_counter() - started
+        await finished
+        return ready, await running
+
+    def test_cold_track_doesnt_wait_for_bulk_downloads(self):
+        ready, report = self.run_loop(self.stream_during_bulk())
+        self.assertEqual(report.downloaded, self.BULK_TRACKS)
+        self.assertLess(ready, self.DOWNLOAD_SECONDS / 2)
+
+
+class LinkedDuplicateDownloadTest(StorageTest):
+    """
+    LinkedDuplicateDownloadTest : tracks sharing one recording's audio download it once
+    """
+
+    def test_linked_duplicates_are_downloaded_once(self):
+        self.write_recording('original', b'audio')
+        original = TrackRow(0, 'Artist', 'Album', 'Track', 1, '',
+                            'artist', 'release', 'original', 'mp3')
+        duplicates = [TrackRow(i, 'Artist', 'Compilation', 'Track', i, '', 'artist',
+                               'compilation', 'duplicate-{}'.format(i), 'mp3',
+                               original.get_audio_key()) for i in (1, 2)]
+        storage = LocalDirectoryStorage(self.root)
+        self.addCleanup(storage.close)
+        bulk = BulkDownload(FakeLibrary([original] + duplicates), storage, release_id='release')
+        self.assertEqual(bulk.missing, [original])
+        report = self.run_loop(bulk.run())
+        self.assertEqual((report.total, report.downloaded, report.skipped), (3, 1, 2))
+        self.assertEqual(storage.stats.summary()['download']['requests'], 1)
+        for track in duplicates:
+            self.assertTrue(os.path.isfile(track.get_local_path()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+tracklist_test.py : TrackList's prefetch window against a slow fake cloud
+
+    $ python -m pytest test/tracklist_test.py
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+import monty.config as config
+from monty.metadata import TrackRow
+from monty.tracklist import TrackList
+
+TRACKS = 20
+
+
+class SlowCloud(object):
+    """
+    SlowCloud : stand-in for CloudStorage whose downloads take delay seconds, then
+    write the file. keeps track of downloads in flight, finished and cancelled
+    """
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self.finished = []
+        self.cancelled = []
+
+    async def get_recording(self, artist_id, release_id, recording_id, file_format):
+        self.in_flight += 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(recording_id)
+            raise
+        finally:
+            self.in_flight -= 1
+        path = os.path.join(config.MEDIA_DIR, artist_id, release_id,
+                            '{}.{}'.format(recording_id, file_format))
+        config.ensure_dir(path)
+        with open(path, 'wb') as recording:
+            recording.write(b'\0')
+        self.finished.append(recording_id)
+
+
+class PrefetchTest(unittest.TestCase):
+    """
+    PrefetchTest : the window around the current song is fetched ahead, a few at a time
+    """
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        media_dir = mock.patch.object(config, 'MEDIA_DIR', self.workdir.name)
+        media_dir.start()
+        self.addCleanup(media_dir.stop)
+        self.cloud = SlowCloud()
+        tracks = [TrackRow(i, 'Artist', 'Album', 'Track', i + 1, '', 'artist', 'release',
+                           'r-{}'.format(i), 'mp3') for i in range(TRACKS)]
+        self.track_list = TrackList(tracks, prefetch_ahead=3, max_prefetches=2,
+                                    cloud=self.cloud, progressive=False)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.workdir.cleanup()
+
+    def run_loop(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    async def settle(self):
+        """
+        settle : let the prefetches in flight (and any queued behind them) finish
+        """
+        await asyncio.gather(*self.track_list._prefetches.values(), return_exceptions=True)
+
+    def test_prefetches_are_limited(self):
+        self.run_loop(self.track_list.skip_to_index(0))
+        self.assertEqual(self.track_list.prefetch_stats()['in_flight'], 3)
+        self.run_loop(self.settle())
+        self.assertEqual(self.cloud.finished, ['r-0', 'r-1', 'r-2', 'r-3'])
+        # three prefetches, but never more than max_prefetches downloading at once
+        self.assertEqual(self.cloud.most_in_flight, 2)
+
+    def test_prefetches_outside_the_window_are_cancelled_on_skip(self):
+        async def skip_away():
+            await self.track_list.skip_to_index(0)
+            await asyncio.sleep(0)
+            await self.track_list.skip_to_index(10)
+            await asyncio.sleep(0)
+
+        self.run_loop(skip_away())
+        # 1 and 2 were downloading, 3 was waiting for a slot and never started
+        self.assertEqual(sorted(self.cloud.cancelled), ['r-1', 'r-2'])
+        self.assertEqual(sorted(self.track_list._prefetches),
+                         sorted(track.get_local_path() for track
+                                in self.track_list.prefetch_window()))
+        self.run_loop(self.settle())
+        self.assertEqual(self.cloud.finished, ['r-0', 'r-10', 'r-9', 'r-11', 'r-12', 'r-13'])
+        for i in (1, 2, 3):
+            self.assertFalse(os.path.isfile(self.track_list.song_metadata[i].get_local_path()))
+
+    def test_hits_and_misses(self):
+        async def play():
+            # a miss, then two prefetched songs
+            await self.track_list.skip_to_index(0)
+            await self.settle()
+            await self.track_list.get_next_song()
+            await self.track_list.get_next_song()
+            # a miss, then the song before it, prefetched
+            await self.track_list.skip_to_index(15)
+            await self.settle()
+            await self.track_list.get_previous_song()
+            # downloaded on demand earlier, so neither
+            await self.track_list.get_next_song()
+
+        self.run_loop(play())
+        stats = self.track_list.prefetch_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (3, 2))
+        self.assertEqual(self.cloud.finished.count('r-14'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+"""
+upload_test.py : Uploader against a DirectoryBucket, with uploads that fail or take a while
+
+    $ python -m pytest test/upload_test.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+from monty import upload
+from monty.bucket import DirectoryBlob, DirectoryBucket
+from monty.upload import Uploader
+from monty.util import mid
+
+
+class FlakyBlob(DirectoryBlob):
+    """
+    FlakyBlob : fails its bucket's first uploads of an object, and counts uploads in flight
+    """
+
+    def upload_from_filename(self, filename):
+        bucket = self.bucket
+        with bucket.lock:
+            failures = bucket.failures.get(self.name, 0)
+            bucket.failures[self.name] = failures - 1
+            bucket.in_flight += 1
+            bucket.most_in_flight = max(bucket.most_in_flight, bucket.in_flight)
+        try:
+            if bucket.delay:
+                time.sleep(bucket.delay)
+            if failures > 0:
+                raise ConnectionError('flaky upload of {}'.format(self.name))
+            super().upload_from_filename(filename)
+        finally:
+            with bucket.lock:
+                bucket.in_flight -= 1
+
+
+class FlakyBucket(DirectoryBucket):
+    """
+    FlakyBucket : a DirectoryBucket whose uploads fail failures[name] times, then work
+    """
+
+    def __init__(self, root, delay=0.0):
+        super().__init__(root)
+        self.delay = delay
+        self.failures = {}
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.most_in_flight = 0
+
+    def blob(self, blob_name):
+        return FlakyBlob(blob_name, self)
+
+
+class UploaderTest(unittest.TestCase):
+    """
+    UploaderTest : skipping, retrying, failing and the concurrency limit
+    """
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.workdir.name, 'source')
+        os.makedirs(self.source)
+        self.bucket = FlakyBucket(os.path.join(self.workdir.name, 'bucket'))
+        self.hash_cache = mid.HashCache(os.path.join(self.workdir.name, 'hashes.db'))
+        self.addCleanup(self.hash_cache.close)
+        printing = mock.patch.object(Uploader, '_print')
+        printing.start()
+        self.addCleanup(printing.stop)
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def make_uploads(self, count) -> list:
+        uploads = []
+        for i in range(count):
+            path = os.path.join(self.source, '{}.mp3'.format(i))
+            with open(path, 'wb') as audio:
+                audio.write(os.urandom(1024))
+            uploads.append((path, 'audio/artist/release/{}.mp3'.format(i)))
+        return uploads
+
+    def make_uploader(self, **kwargs) -> Uploader:
+        kwargs.setdefault('backoff', 0.001)
+        return Uploader(self.bucket, hash_cache=self.hash_cache, **kwargs)
+
+    def test_identical_objects_are_skipped(self):
+        uploads = self.make_uploads(3)
+        self.make_uploader().upload_all(uploads[:2])
+        report = self.make_uploader().upload_all(uploads)
+        self.assertEqual((report.uploaded, report.skipped, report.failed), (1, 2, []))
+        for path, name in uploads:
+            with open(path, 'rb') as source:
+                self.assertEqual(self.bucket.blob(name).download_as_string(), source.read())
+
+    def test_changed_files_are_uploaded_again(self):
+        uploads = self.make_uploads(1)
+        self.make_uploader().upload_all(uploads)
+        with open(uploads[0][0], 'ab') as audio:
+            audio.write(b'more')
+        report = self.make_uploader().upload_all(uploads)
+        self.assertEqual((report.uploaded, report.skipped), (1, 0))
+
+    def test_transient_failures_back_off_and_retry(self):
+        uploads = self.make_uploads(1)
+        self.bucket.failures[uploads[0][1]] = 2
+        with mock.patch.object(upload.time, 'sleep') as sleep:
+            report = self.make_uploader(retries=3, backoff=1.0).upload_all(uploads)
+        self.assertEqual((report.uploaded, report.failed), (1, []))
+        # exponential backoff, with up to 50% jitter either way
+        waits = [call[0][0] for call in sleep.call_args_list]
+        self.assertEqual(len(waits), 2)
+        self.assertTrue(0.5 <= waits[0] <= 1.5, waits)
+        self.assertTrue(1.0 <= waits[1] <= 3.0, waits)
+
+    def test_persistent_failures_are_reported(self):
+        uploads = self.make_uploads(3)
+        self.bucket.failures[uploads[1][1]] = 100
+        report = self.make_uploader(retries=2).upload_all(uploads)
+        self.assertEqual((report.uploaded, report.failed), (2, [uploads[1][0]]))
+        self.assertIsNone(self.bucket.get_blob(uploads[1][1]))
+        # one try and two retries
+        self.assertEqual(self.bucket.failures[uploads[1][1]], 97)
+
+    def test_uploads_in_flight_are_limited(self):
+        self.bucket.delay = 0.05
+        report = self.make_uploader(workers=2).upload_all(self.make_uploads(6))
+        self.assertEqual(report.uploaded, 6)
+        self.assertEqual(self.bucket.most_in_flight, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()